@@ -31,6 +31,14 @@ def create_app():
     db.init_app(app)
     jwt.init_app(app)
 
+    from utils.event_log import event_log
+
+    event_log.init_app(app)
+
+    from utils.customer_sync import install_change_tracking
+
+    install_change_tracking()
+
     from routes.auth import auth_bp
     from routes.collection import collection_bp
     from routes.line import line_bp
@@ -46,13 +54,16 @@ def create_app():
     # from routes.ops_analytics import ops_bp
     from routes.worker_tracking import tracking_bp
 
-    # Pre-load face verification model
-    try:
-        from utils.face_utils import model  # noqa: F401
+    # Pre-load face verification model (the shared service owns it otherwise)
+    from utils.face_inference import FACE_INFERENCE_MODE
 
-        print("AI Model loaded successfully")
-    except Exception as e:
-        print(f"Error loading AI Model: {e}")
+    if FACE_INFERENCE_MODE != "service":
+        try:
+            from utils.face_utils import model  # noqa: F401
+
+            print("AI Model loaded successfully")
+        except Exception as e:
+            print(f"Error loading AI Model: {e}")
 
     app.register_blueprint(auth_bp, url_prefix="/api/auth")
     app.register_blueprint(customer_bp, url_prefix="/api/customer")
@@ -73,13 +84,33 @@ def create_app():
     with app.app_context():
         db.create_all()
 
+        from utils.customer_sync import seed_change_counter
+
+        seed_change_counter(db)  # No-op once flask migrate has created it
+
+        from utils.customer_search import customer_search
+
+        customer_search.init_app(app)
+
+    # Schema sync and backfills run once per deploy, not in every worker:
+    # `flask --app app:create_app migrate` (gunicorn_config.py and the
+    # Procfile release step call it)
+    @app.cli.command("migrate")
+    def migrate_command():
+        """Add missing columns/indexes and run the data backfills"""
+        from utils.schema_sync import run_migrations
+
+        run_migrations(db)
+
     return app
 
 
 if __name__ == "__main__":
     app = create_app()
     with app.app_context():
-        db.create_all()
+        from utils.schema_sync import run_migrations
+
+        run_migrations(db)
     host = os.getenv("HOST", "0.0.0.0")  # nosec B104
     port = int(os.getenv("PORT", 5000))
     app.run(debug=True, host=host, port=port)  # nosec B104
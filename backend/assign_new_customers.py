@@ -0,0 +1,32 @@
+"""
+Place open customers that no active agent serves (new, or left by a
+deactivated agent) with a nearby agent that has room. Existing
+assignments stay as they are. Prints the plan; --apply saves it.
+
+Usage (from backend/):  python assign_new_customers.py [--max-per-worker 50] [--apply]
+"""
+
+import argparse
+
+from app import create_app
+from utils.worker_assignment import assign_new_customers
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--max-per-worker", type=int, default=50)
+    parser.add_argument("--apply", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        summary = assign_new_customers(args.max_per_worker, apply=args.apply)
+        for entry in summary["placements"]:
+            print(
+                f"agent {entry['worker_id']}: +{entry['count']} "
+                f"({entry['load_before']} -> {entry['load_after']})"
+            )
+        print(
+            f"{summary['agents']} agents, {summary['served']} served, "
+            f"{summary['unserved']} unserved, {summary['placed']} placed"
+            + (" (saved)" if summary["applied"] else " (preview, --apply to save)")
+        )
@@ -0,0 +1,244 @@
+"""
+Benchmark same-day collection checks against a large collection history.
+
+Usage (from backend/):
+    python benchmark_collection_submit.py [--rows 1000000] [--submits 200]
+                                          [--db sqlite:////tmp/vasool_bench.db]
+
+Seeds the target database with synthetic loans and a year of historical
+collections (skipped when it already holds enough rows), then reports:
+  * the duplicate check written as DATE(created_at) = today versus
+    collection_date = today (ix_collections_loan_date),
+  * the settlement cash total per agent on both predicates
+    (ix_collections_agent_date_mode),
+  * end-to-end POST /api/collection/submit latency (p50/p95).
+Never point --db at a production database.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def timed(fn, runs):
+    samples = []
+    for i in range(runs):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def seed(db, rows, loans, agents):
+    from models import Collection, Customer, Loan, User, UserRole
+    from utils.business_time import business_date
+
+    existing = db.session.query(db.func.count(Collection.id)).scalar()
+    if existing >= rows:
+        print(f"Reusing {existing} existing collections")
+        return
+
+    print(f"Seeding up to {rows} collections...")
+    if not User.query.filter(User.name.like("Bench Agent %")).first():
+        db.session.execute(
+            User.__table__.insert(),
+            [
+                {
+                    "name": f"Bench Agent {i}",
+                    "mobile_number": f"90000{i:05d}",
+                    "role": UserRole.FIELD_AGENT.name,
+                    "is_active": True,
+                    "is_locked": False,
+                    "token_version": 0,
+                }
+                for i in range(agents)
+            ],
+        )
+        db.session.execute(
+            Customer.__table__.insert(),
+            [
+                {
+                    "name": f"Bench Customer {i}",
+                    "mobile_number": f"80000{i:05d}",
+                    "status": "active",
+                    "version": 1,
+                }
+                for i in range(loans)
+            ],
+        )
+        db.session.commit()
+        agent_ids = [
+            uid
+            for (uid,) in db.session.query(User.id).filter(
+                User.name.like("Bench Agent %")
+            )
+        ]
+        db.session.execute(
+            Loan.__table__.insert(),
+            [
+                {
+                    "customer_id": cid,
+                    "principal_amount": 10000.0,
+                    "pending_amount": 1e9,
+                    "status": "active",
+                    "assigned_worker_id": random.choice(agent_ids),
+                }
+                for (cid,) in db.session.query(Customer.id).filter(
+                    Customer.name.like("Bench Customer %")
+                )
+            ],
+        )
+        db.session.commit()
+
+    agent_ids = [
+        uid
+        for (uid,) in db.session.query(User.id).filter(User.name.like("Bench Agent %"))
+    ]
+    loan_ids = [
+        lid
+        for (lid,) in db.session.query(Loan.id)
+        .join(Customer, Loan.customer_id == Customer.id)
+        .filter(Customer.name.like("Bench Customer %"))
+    ]
+
+    now = datetime.utcnow()
+    chunk = 50000
+    for offset in range(existing, rows, chunk):
+        batch = []
+        for _ in range(min(chunk, rows - offset)):
+            # Everything strictly before today, so today's submits are not duplicates
+            created = now - timedelta(
+                days=random.randint(1, 365), seconds=random.randint(0, 86399)
+            )
+            batch.append(
+                {
+                    "loan_id": random.choice(loan_ids),
+                    "agent_id": random.choice(agent_ids),
+                    "amount": 100.0,
+                    "payment_mode": random.choice(("cash", "cash", "upi")),
+                    "status": "approved",
+                    "created_at": created,
+                    "collection_date": business_date(created),
+                }
+            )
+        db.session.execute(Collection.__table__.insert(), batch)
+        db.session.commit()
+        print(f"  {offset + len(batch)} / {rows}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db", default="sqlite:////tmp/vasool_bench.db")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--loans", type=int, default=20000)
+    parser.add_argument("--agents", type=int, default=200)
+    parser.add_argument("--submits", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=200, help="Query repetitions")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.db
+    os.environ.setdefault("EVENT_LOG_MODE", "sync")
+
+    from flask_jwt_extended import create_access_token
+
+    from app import create_app
+    from extensions import db
+    from models import Collection, Loan, User
+    from utils.business_time import business_date
+
+    app = create_app()
+    with app.app_context():
+        seed(db, args.rows, args.loans, args.agents)
+        loan_ids = [
+            lid for (lid,) in db.session.query(Loan.id).filter(Loan.status == "active")
+        ]
+        agent_ids = [
+            uid
+            for (uid,) in db.session.query(User.id).filter(
+                User.name.like("Bench Agent %")
+            )
+        ]
+        today = business_date()
+        utc_today = datetime.utcnow().date()
+
+        def old_duplicate(i):
+            Collection.query.filter(
+                Collection.loan_id == loan_ids[i % len(loan_ids)],
+                db.func.date(Collection.created_at) == utc_today,
+            ).first()
+
+        def new_duplicate(i):
+            Collection.query.filter(
+                Collection.loan_id == loan_ids[i % len(loan_ids)],
+                Collection.collection_date == today,
+            ).first()
+
+        def cash_total(predicate):
+            def run(i):
+                db.session.query(db.func.sum(Collection.amount)).filter(
+                    Collection.agent_id == agent_ids[i % len(agent_ids)],
+                    predicate,
+                    Collection.payment_mode == "cash",
+                ).scalar()
+
+            return run
+
+        results = [
+            ("dup check DATE(created_at)", timed(old_duplicate, args.runs)),
+            ("dup check collection_date", timed(new_duplicate, args.runs)),
+            (
+                "agent cash DATE(created_at)",
+                timed(
+                    cash_total(db.func.date(Collection.created_at) == utc_today),
+                    args.runs,
+                ),
+            ),
+            (
+                "agent cash collection_date",
+                timed(cash_total(Collection.collection_date == today), args.runs),
+            ),
+        ]
+
+        agent = User.query.get(agent_ids[0])
+        token = create_access_token(identity=agent.mobile_number)
+        todays = {
+            lid
+            for (lid,) in db.session.query(Collection.loan_id).filter(
+                Collection.collection_date == today
+            )
+        }
+        fresh_loans = [lid for lid in loan_ids if lid not in todays][: args.submits]
+
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def submit(i):
+        resp = client.post(
+            "/api/collection/submit",
+            json={"loan_id": fresh_loans[i], "amount": 100, "payment_mode": "upi"},
+            headers=headers,
+        )
+        if resp.status_code != 201:
+            raise SystemExit(f"Submit failed: {resp.status_code} {resp.get_json()}")
+
+    if fresh_loans:
+        results.append(("POST /collection/submit", timed(submit, len(fresh_loans))))
+
+    print(f"\n{'measurement':<30}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+    for label, samples in results:
+        print(
+            f"{label:<30}{percentile(samples, 50):>10.2f}"
+            f"{percentile(samples, 95):>10.2f}{statistics.mean(samples):>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
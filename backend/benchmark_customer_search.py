@@ -0,0 +1,188 @@
+"""
+Benchmark customer search (utils/customer_search.py) on synthetic data.
+
+Usage (from backend/):
+    python benchmark_customer_search.py [--customers 200000] [--queries 200]
+                                        [--db sqlite:////tmp/vasool_search.db]
+
+Seeds the target database with synthetic customers (skipped when it
+already holds enough), then times for name fragments, mobile prefixes,
+full mobiles and customer_id fragments:
+  * the previous ILIKE '%term%' over name / mobile_number / customer_id,
+  * a LIKE scan of search_text (the "sql" backend),
+  * the in-memory trigram index (the "memory" backend),
+and reports the index build time. Never point --db at a production database.
+"""
+
+import argparse
+import os
+import random
+import time
+
+FIRST = [
+    "arun",
+    "murugan",
+    "lakshmi",
+    "selvi",
+    "karthik",
+    "priya",
+    "ramesh",
+    "kavitha",
+    "suresh",
+    "meena",
+    "vijay",
+    "anitha",
+    "ganesh",
+    "revathi",
+    "senthil",
+    "divya",
+    "madhu",
+    "bala",
+    "saravanan",
+    "geetha",
+    "prakash",
+    "uma",
+    "rajesh",
+    "deepa",
+]
+LAST = [
+    "kumar",
+    "raj",
+    "devi",
+    "pandian",
+    "subramani",
+    "krishnan",
+    "velu",
+    "arumugam",
+    "natarajan",
+    "ramasamy",
+    "shankar",
+    "mani",
+    "durai",
+    "selvam",
+    "perumal",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def seed(db, count):
+    from models import Customer
+    from utils.match_keys import customer_match_keys
+
+    existing = db.session.query(db.func.count(Customer.id)).scalar()
+    if existing >= count:
+        print(f"Reusing {existing} existing customers")
+        return
+    print(f"Seeding {count - existing} customers...")
+    rng = random.Random(existing)
+    chunk = 20000
+    for start in range(existing, count, chunk):
+        rows = []
+        for n in range(start, min(count, start + chunk)):
+            name = f"{rng.choice(FIRST).title()} {rng.choice(LAST).title()}"
+            mobile = str(6000000000 + (n * 7919) % 4000000000)  # distinct for every n
+            customer_id = f"CUST-2025-{n + 1:06d}"
+            rows.append(
+                {
+                    "name": name,
+                    "mobile_number": mobile,
+                    "customer_id": customer_id,
+                    "status": "active",
+                    "version": 1,
+                    "change_version": 1,
+                    **customer_match_keys(name, mobile, customer_id, None),
+                }
+            )
+        db.session.execute(Customer.__table__.insert(), rows)
+        db.session.commit()
+        print(f"  {start + len(rows)} / {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db", default="sqlite:////tmp/vasool_search.db")
+    parser.add_argument("--customers", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.db
+    os.environ.setdefault("EVENT_LOG_MODE", "sync")
+    os.environ["CUSTOMER_SEARCH_BACKEND"] = "sql"  # build the index below, timed
+
+    from app import create_app
+    from extensions import db
+    from models import Customer
+    from utils.customer_search import customer_search
+
+    app = create_app()
+    with app.app_context():
+        seed(db, args.customers)
+
+        start = time.perf_counter()
+        customer_search.index.build()
+        build_seconds = time.perf_counter() - start
+
+        sample = (
+            db.session.query(
+                Customer.name, Customer.mobile_number, Customer.customer_id
+            )
+            .order_by(db.func.random())
+            .limit(args.queries)
+            .all()
+        )
+        rng = random.Random(1)
+        terms = {
+            "name fragment": [
+                name.split()[rng.randrange(2)][1:5] for name, _, _ in sample
+            ],
+            "mobile prefix": [mobile[:5] for _, mobile, _ in sample],
+            "full mobile": [mobile for _, mobile, _ in sample],
+            "customer_id": [customer_id[-6:] for _, _, customer_id in sample],
+        }
+
+        def old_ilike(term):
+            pattern = f"%{term}%"
+            return (
+                Customer.query.filter(
+                    Customer.name.ilike(pattern)
+                    | Customer.mobile_number.ilike(pattern)
+                    | Customer.customer_id.ilike(pattern)
+                )
+                .order_by(Customer.created_at.desc())
+                .limit(50)
+                .all()
+            )
+
+        def backend(name):
+            def run(term):
+                customer_search.backend = name
+                return customer_search.apply(Customer.query, term).limit(50).all()
+
+            return run
+
+        print(
+            f"\nIndex build: {build_seconds:.2f} s for {len(customer_search.index.docs)} customers"
+        )
+        print(f"{'term kind':<16}{'method':<18}{'p50 ms':>10}{'p95 ms':>10}")
+        for kind, values in terms.items():
+            for label, fn in (
+                ("ILIKE (old)", old_ilike),
+                ("search_text LIKE", backend("sql")),
+                ("memory index", backend("memory")),
+            ):
+                samples = []
+                for term in values:
+                    start = time.perf_counter()
+                    fn(term)
+                    samples.append((time.perf_counter() - start) * 1000)
+                print(
+                    f"{kind:<16}{label:<18}{percentile(samples, 50):>10.2f}{percentile(samples, 95):>10.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
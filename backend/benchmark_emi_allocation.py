@@ -0,0 +1,211 @@
+"""
+Check and benchmark the EMI allocation engine (utils/emi_allocation.py).
+
+Usage (from backend/):
+    python benchmark_emi_allocation.py [--cases 20000] [--loans 200] [--emis 100]
+
+1. Property check: random schedules and payments (partial, exact, over-
+   payments, legacy NULL balances, 0.1 tolerance edges) are run through
+   both the engine and the original per-object loop; balances, statuses
+   and loan closure must agree.
+2. Micro-benchmark on an in-memory SQLite database: allocating one payment
+   to a daily loan with the ORM loop versus the tuple engine with one
+   executemany UPDATE.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+
+def legacy_allocate(emis, loan, amount):
+    """The loop previously inlined in submit_collection/update_collection_status"""
+    remaining = amount
+    for emi in emis:
+        if remaining <= 0:
+            break
+        current_balance = emi.balance if emi.balance is not None else emi.amount
+        check_amount = min(remaining, current_balance)
+        new_balance = current_balance - check_amount
+        remaining -= check_amount
+        emi.balance = new_balance
+        if new_balance <= 0.1:
+            emi.status = "paid"
+            emi.balance = 0
+        else:
+            emi.status = "partial"
+    loan.pending_amount = max(0, loan.pending_amount - amount)
+    if loan.pending_amount <= 10 and all(e.status == "paid" for e in emis):
+        loan.status = "closed"
+
+
+def random_case(rng):
+    count = rng.randint(0, 120)
+    emi_amount = rng.choice([50, 100, 125.5, 333.33, 1000])
+    emis = []
+    for i in range(count):
+        balance = rng.choice(
+            [emi_amount, emi_amount, None, round(rng.uniform(0.05, emi_amount), 2)]
+        )
+        emis.append(
+            SimpleNamespace(
+                id=i + 1,
+                emi_no=i + 1,
+                due_date=datetime(2025, 1, 1) + timedelta(days=i),
+                amount=emi_amount,
+                balance=balance,
+                status="partial" if balance else "pending",
+            )
+        )
+    outstanding = sum(e.balance if e.balance is not None else e.amount for e in emis)
+    amount = rng.choice(
+        [
+            rng.uniform(0.01, emi_amount * 3),
+            outstanding,
+            outstanding + rng.uniform(0, 50),
+            outstanding - 0.05,
+            emi_amount - 0.1,
+            round(rng.uniform(0, outstanding or 1), 2),
+        ]
+    )
+    pending = max(0.0, outstanding + rng.choice([0, 0, 5, 25]))
+    return emis, amount, pending
+
+
+def property_check(cases, seed):
+    from utils.emi_allocation import EmiRow, allocate, settle_loan
+
+    rng = random.Random(seed)
+    for n in range(cases):
+        emis, amount, pending = random_case(rng)
+        rows = [
+            EmiRow(
+                e.id,
+                e.emi_no,
+                e.due_date,
+                e.balance if e.balance is not None else e.amount,
+                e.status,
+            )
+            for e in emis
+        ]
+        legacy_loan = SimpleNamespace(pending_amount=pending, status="active")
+        legacy_allocate(emis, legacy_loan, amount)
+
+        allocation = allocate(rows, amount)
+        loan = SimpleNamespace(pending_amount=pending, status="active")
+        settle_loan(loan, amount, allocation.all_paid)
+
+        state = {r.id: (r.balance, r.status) for r in rows}
+        for u in allocation.updates:
+            state[u.id] = (u.balance, u.status)
+        for e in emis:
+            balance, status = state[e.id]
+            expected = e.balance if e.balance is not None else e.amount
+            if status != e.status or abs(balance - expected) > 1e-6:
+                raise SystemExit(
+                    f"Mismatch in case {n} on EMI {e.id}: {state[e.id]} vs {(expected, e.status)}"
+                )
+        if (loan.status, round(loan.pending_amount, 6)) != (
+            legacy_loan.status,
+            round(legacy_loan.pending_amount, 6),
+        ):
+            raise SystemExit(f"Loan mismatch in case {n}")
+    print(f"Property check: {cases} random cases match the original loop")
+
+
+def micro_benchmark(loans, emis_per_loan):
+    os.environ["DATABASE_URL"] = "sqlite://"
+    os.environ.setdefault("EVENT_LOG_MODE", "sync")
+
+    from app import create_app
+    from extensions import db
+    from models import Customer, EMISchedule, Loan
+    from utils.emi_allocation import apply_payment
+
+    app = create_app()
+    with app.app_context():
+        loan_ids = []
+        for i in range(loans * 2):
+            customer = Customer(name=f"Bench {i}", mobile_number=f"5{i:09d}")
+            db.session.add(customer)
+            db.session.flush()
+            loan = Loan(
+                customer_id=customer.id,
+                principal_amount=10000,
+                pending_amount=emis_per_loan * 120.0,
+                status="active",
+            )
+            db.session.add(loan)
+            db.session.flush()
+            db.session.add_all(
+                EMISchedule(
+                    loan_id=loan.id,
+                    emi_no=k + 1,
+                    due_date=datetime(2025, 1, 1) + timedelta(days=k),
+                    amount=120.0,
+                    principal_part=100.0,
+                    interest_part=20.0,
+                    balance=120.0,
+                )
+                for k in range(emis_per_loan)
+            )
+            loan_ids.append(loan.id)
+        db.session.commit()
+
+        def orm_loop(loan_id):
+            loan = Loan.query.get(loan_id)
+            emis = (
+                EMISchedule.query.filter_by(loan_id=loan_id)
+                .filter(EMISchedule.status != "paid")
+                .order_by(EMISchedule.due_date)
+                .all()
+            )
+            legacy_allocate(emis, loan, 1500.0)
+            db.session.commit()
+
+        def engine(loan_id):
+            loan = Loan.query.get(loan_id)
+            apply_payment(loan, 1500.0)
+            db.session.commit()
+
+        results = {}
+        for label, fn, ids in (
+            ("ORM loop", orm_loop, loan_ids[:loans]),
+            ("tuple engine", engine, loan_ids[loans:]),
+        ):
+            samples = []
+            for loan_id in ids:
+                start = time.perf_counter()
+                fn(loan_id)
+                samples.append((time.perf_counter() - start) * 1000)
+                db.session.expunge_all()
+            results[label] = samples
+
+    print(
+        f"\nOne payment (12.5 EMIs) on a {emis_per_loan}-EMI loan, {loans} loans each"
+    )
+    print(f"{'path':<14}{'p50 ms':>10}{'p95 ms':>10}")
+    for label, samples in results.items():
+        ordered = sorted(samples)
+        p95 = ordered[int(len(ordered) * 0.95) - 1]
+        print(f"{label:<14}{statistics.median(samples):>10.3f}{p95:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--loans", type=int, default=200)
+    parser.add_argument("--emis", type=int, default=100)
+    args = parser.parse_args()
+
+    property_check(args.cases, args.seed)
+    micro_benchmark(args.loans, args.emis)
+
+
+if __name__ == "__main__":
+    main()
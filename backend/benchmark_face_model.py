@@ -0,0 +1,105 @@
+"""
+Benchmark the float and int8 face embedding models.
+
+Usage (from backend/):
+    python benchmark_face_model.py [--images DIR] [--runs 50]
+
+Each variant runs in a fresh interpreter so cold-start time and peak RSS
+are not polluted by the other model.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess  # nosec B404
+import sys
+import time
+
+
+def run_variant(variant, image_dir, runs):
+    """Executed inside the child interpreter"""
+    start = time.perf_counter()
+    os.environ["FACE_MODEL_VARIANT"] = variant
+
+    import numpy as np
+    import torch
+    from utils import face_utils
+
+    imported = time.perf_counter()
+    face_utils._get_ai_resources()
+    loaded = time.perf_counter()
+
+    if image_dir:
+        faces = []
+        for name in sorted(os.listdir(image_dir)):
+            with open(os.path.join(image_dir, name), "rb") as f:
+                tensor, error = face_utils.preprocess_face(f.read())
+            if not error:
+                faces.append(tensor)
+    else:
+        torch.manual_seed(0)
+        faces = list(torch.randn(8, 3, 224, 224))
+
+    face_utils.embed_faces([faces[0]])
+    first = time.perf_counter()
+
+    latencies = []
+    for i in range(runs):
+        t0 = time.perf_counter()
+        face_utils.embed_faces([faces[i % len(faces)]])
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    return {
+        "variant": variant,
+        "import_s": round(imported - start, 3),
+        "load_s": round(loaded - imported, 3),
+        "cold_start_s": round(first - start, 3),
+        "rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", help="Folder of face photos (default: synthetic)")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_variant(args.worker, args.images, args.runs)))
+        return
+
+    from utils.face_utils import FACE_MODEL_INT8_PATH
+
+    variants = ["float"]
+    if os.path.exists(FACE_MODEL_INT8_PATH):
+        variants.append("int8")
+    results = []
+    for variant in variants:
+        cmd = [sys.executable, __file__, "--worker", variant, "--runs", str(args.runs)]
+        if args.images:
+            cmd += ["--images", args.images]
+        out = subprocess.run(  # nosec B603
+            cmd, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    header = f"{'variant':<8}{'cold start':>12}{'load':>9}{'RSS MB':>9}{'p50 ms':>9}{'p95 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['variant']:<8}{r['cold_start_s']:>11.2f}s{r['load_s']:>8.2f}s"
+            f"{r['rss_mb']:>9.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+        )
+    if len(results) == 1:
+        print(
+            f"int8 skipped: {FACE_MODEL_INT8_PATH} not found (run export_face_model.py)"
+        )
+
+
+if __name__ == "__main__":
+    main()
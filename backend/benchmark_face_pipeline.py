@@ -0,0 +1,113 @@
+"""
+Compare the standard and fast face preprocessing pipelines on a photo corpus.
+
+Usage (from backend/):
+    python benchmark_face_pipeline.py --images DIR [--runs 3] [--no-embed]
+
+Reports per-stage median timings and throughput for each mode, how often
+both modes found a face, and (unless --no-embed) the cosine similarity
+between the embeddings each mode produces for the same photo.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+
+def load_corpus(image_dir):
+    corpus = []
+    for name in sorted(os.listdir(image_dir)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png")):
+            with open(os.path.join(image_dir, name), "rb") as f:
+                corpus.append((name, f.read()))
+    return corpus
+
+
+def run_mode(face_utils, mode, corpus, runs):
+    stages = {"decode": [], "detect": [], "preprocess": []}
+    faces, failures = {}, 0
+    start = time.perf_counter()
+    for _ in range(runs):
+        for name, image_bytes in corpus:
+            timings = {}
+            if mode == "fast":
+                face, error = face_utils.preprocess_face_fast(image_bytes, timings)
+            else:
+                face, error = face_utils.preprocess_face(image_bytes, mode, timings)
+            for stage, values in stages.items():
+                if stage in timings:
+                    values.append(timings[stage])
+            if error:
+                failures += 1
+            else:
+                faces[name] = face
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "images_per_s": round(len(corpus) * runs / elapsed, 1),
+        "stages_ms": {
+            k: round(float(np.median(v)), 2) if v else None for k, v in stages.items()
+        },
+        "failures": failures // runs,
+        "faces": faces,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", required=True, help="Folder of face photos")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--no-embed", action="store_true", help="Skip the model")
+    args = parser.parse_args()
+
+    from utils import face_utils
+
+    corpus = load_corpus(args.images)
+    if not corpus:
+        raise SystemExit(f"No images found in {args.images}")
+
+    if not args.no_embed:
+        face_utils._get_ai_resources()  # Keep model load out of the timings
+
+    results = [
+        run_mode(face_utils, mode, corpus, args.runs) for mode in ("standard", "fast")
+    ]
+
+    header = (
+        f"{'mode':<10}{'img/s':>8}{'decode':>9}{'detect':>9}{'prep':>9}{'no face':>9}"
+    )
+    print(f"{len(corpus)} images x {args.runs} runs (median ms per stage)")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        stages = "".join(
+            f"{ms:>9.2f}" if ms is not None else f"{'-':>9}"
+            for ms in r["stages_ms"].values()
+        )
+        print(f"{r['mode']:<10}{r['images_per_s']:>8.1f}{stages}{r['failures']:>9}")
+
+    standard, fast = results[0]["faces"], results[1]["faces"]
+    both = sorted(set(standard) & set(fast))
+    print(
+        f"\nDetection agreement: {len(both)}/{len(corpus)} photos found by both modes"
+    )
+    if args.no_embed or not both:
+        return
+
+    import torch
+
+    ref = face_utils.embed_faces([standard[n] for n in both])
+    cand = face_utils.embed_faces([torch.from_numpy(fast[n]) for n in both])
+    ref /= np.linalg.norm(ref, axis=1, keepdims=True)
+    cand /= np.linalg.norm(cand, axis=1, keepdims=True)
+    cosine = np.einsum("ij,ij->i", ref, cand)
+    print(
+        f"Embedding cosine (standard vs fast): mean {cosine.mean():.4f}, "
+        f"min {cosine.min():.4f} ({both[int(cosine.argmin())]})"
+    )
+
+
+if __name__ == "__main__":
+    main()
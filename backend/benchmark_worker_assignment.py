@@ -0,0 +1,191 @@
+"""
+Benchmark worker-customer assignment (utils/optimization_engine.py).
+
+Usage (from backend/):
+    python benchmark_worker_assignment.py [--sizes 5x200,10x1000,50x20000,200x100000]
+                                          [--exact-max 20000] [--time-budget 10] [--seed 7]
+
+Workers and customers are scattered around a few town centres (customers
+clustered around their town, ~2% without coordinates). For every size:
+  * the scalable solver (nearest candidates, regret greedy, min-cost flow
+    cycle cancelling) with --time-budget seconds for the cycle cancelling,
+  * the exact integer program when workers x customers <= --exact-max,
+  * a lower bound: every customer with its nearest worker, ignoring
+    capacity (only useful where capacity does not bind).
+Reports runtime, total km and the gap of the scalable solution to the
+exact optimum, and checks that capacities hold and everyone is assigned.
+
+Then the incremental mode (assign_new_customers): --new more customers
+are placed around the scalable solution of each size, with the workers'
+load and home area (centroid of their customers) taken from it.
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+
+def make_instance(n_workers, n_customers, rng):
+    towns = [
+        (13.0 + rng.uniform(-0.5, 0.5), 80.2 + rng.uniform(-0.5, 0.5)) for _ in range(8)
+    ]
+    weights = [rng.uniform(0.5, 3.0) for _ in towns]
+
+    def point(spread):
+        lat, lng = rng.choices(towns, weights)[0]
+        return lat + rng.gauss(0, spread), lng + rng.gauss(0, spread)
+
+    workers = []
+    for w in range(n_workers):
+        lat, lng = point(0.03)
+        workers.append({"id": w + 1, "lat": lat, "lng": lng})
+    customers = []
+    for c in range(n_customers):
+        if rng.random() < 0.02:
+            customers.append({"id": c + 1, "lat": None, "lng": None})
+            continue
+        lat, lng = point(0.02)
+        customers.append({"id": c + 1, "lat": lat, "lng": lng})
+    return workers, customers
+
+
+def total_km(workers, customers, assignments):
+    from utils.optimization_engine import OptimizationEngine
+
+    index = {c["id"]: i for i, c in enumerate(customers)}
+    windex = {w["id"]: j for j, w in enumerate(workers)}
+    rows, cols = [], []
+    for a in assignments:
+        for cid in a["customer_ids"]:
+            rows.append(index[cid])
+            cols.append(windex[a["worker_id"]])
+    total = 0.0
+    for start in range(0, len(rows), 20000):
+        r = np.array(rows[start : start + 20000])
+        c = np.array(cols[start : start + 20000])
+        dist = OptimizationEngine.distance_matrix_km(workers, customers, r)
+        total += float(dist[np.arange(len(r)), c].sum())
+    return total
+
+
+def check(workers, customers, assignments, limit):
+    seen = [cid for a in assignments for cid in a["customer_ids"]]
+    assert sorted(seen) == sorted(
+        c["id"] for c in customers
+    ), "customers missing or repeated"
+    assert all(
+        a["count"] == len(a["customer_ids"]) <= limit for a in assignments
+    ), "over capacity"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="5x200,10x1000,20x1000,50x20000,200x100000")
+    parser.add_argument("--exact-max", type=int, default=20000)
+    parser.add_argument("--max-per-worker", type=int, default=50)
+    parser.add_argument("--time-budget", type=float, default=None)
+    parser.add_argument("--new", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    from utils.optimization_engine import ASSIGN_TIME_BUDGET, OptimizationEngine
+
+    time_budget = (
+        args.time_budget if args.time_budget is not None else ASSIGN_TIME_BUDGET
+    )
+    incremental = []
+
+    print(
+        f"{'size':>12} {'exact s':>8} {'exact km':>11} {'scalable s':>10} "
+        f"{'scalable km':>12} {'gap':>7} {'bound km':>11}"
+    )
+    for size in args.sizes.split(","):
+        n_workers, n_customers = (int(x) for x in size.split("x"))
+        workers, customers = make_instance(
+            n_workers, n_customers, random.Random(args.seed)
+        )
+        limit = OptimizationEngine.worker_capacity(
+            workers, customers, args.max_per_worker
+        )
+
+        start = time.perf_counter()
+        scalable = OptimizationEngine._assign_scalable(
+            workers, customers, args.max_per_worker, time_budget
+        )
+        scalable_s = time.perf_counter() - start
+        check(workers, customers, scalable, limit)
+        scalable_km = total_km(workers, customers, scalable)
+
+        exact_s = exact_km = None
+        if n_workers * n_customers <= args.exact_max:
+            start = time.perf_counter()
+            exact = OptimizationEngine._assign_exact(
+                workers, customers, args.max_per_worker
+            )
+            exact_s = time.perf_counter() - start
+            if exact is not None:
+                check(workers, customers, exact, limit)
+                exact_km = total_km(workers, customers, exact)
+
+        _, nearest = OptimizationEngine._nearest_candidates(
+            *OptimizationEngine._coordinates(customers),
+            *OptimizationEngine._coordinates(workers),
+            1,
+        )
+        bound_km = float(nearest[:, 0].sum())
+
+        gap = (
+            f"{100 * (scalable_km - exact_km) / exact_km:6.2f}%"
+            if exact_km
+            else "     -"
+        )
+        print(
+            f"{size:>12} {exact_s if exact_s is not None else float('nan'):8.2f} "
+            f"{exact_km if exact_km is not None else float('nan'):11.1f} {scalable_s:10.2f} "
+            f"{scalable_km:12.1f} {gap:>7} {bound_km:11.1f}"
+        )
+
+        by_id = {c["id"]: c for c in customers}
+        homes = []
+        for worker, entry in zip(workers, scalable):
+            points = [
+                by_id[cid]
+                for cid in entry["customer_ids"]
+                if by_id[cid]["lat"] is not None
+            ]
+            homes.append(
+                {
+                    "id": worker["id"],
+                    "lat": (
+                        sum(p["lat"] for p in points) / len(points)
+                        if points
+                        else worker["lat"]
+                    ),
+                    "lng": (
+                        sum(p["lng"] for p in points) / len(points)
+                        if points
+                        else worker["lng"]
+                    ),
+                    "load": entry["count"],
+                }
+            )
+        _, extra = make_instance(n_workers, args.new, random.Random(args.seed + 1))
+        for c in extra:
+            c["id"] += n_customers
+        start = time.perf_counter()
+        placed = OptimizationEngine.assign_new_customers(
+            homes, extra, args.max_per_worker, time_budget
+        )
+        incremental.append(
+            (size, time.perf_counter() - start, sum(a["count"] for a in placed))
+        )
+
+    print(f"\nincremental: {args.new} new customers")
+    for size, seconds, count in incremental:
+        print(f"{size:>12} {seconds:8.3f} s, {count} placed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Check for POST /api/customer/sync on databases without INSERT ... RETURNING.
+
+Usage (from backend/):
+    python check_customer_sync.py [--customers 50] [--db sqlite:////tmp/vasool_sync.db]
+
+MySQL, the production default, supports neither INSERT ... RETURNING nor
+executemany RETURNING. The check switches both dialect flags off on the
+test engine, so any RETURNING in the sync path fails as it would on
+MySQL. It then syncs a batch of new customers, an existing mobile and a
+mobile repeated in the upload, and verifies that every server_id and
+customer_id matches the stored row.
+Never point --db at a production database.
+"""
+
+import argparse
+import os
+import uuid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db", default="sqlite:////tmp/vasool_sync.db")
+    parser.add_argument("--customers", type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.db
+    os.environ.setdefault("EVENT_LOG_MODE", "sync")
+
+    from flask_jwt_extended import create_access_token
+
+    from app import create_app
+    from extensions import db
+    from models import Customer, User, UserRole
+    from utils.auth_helpers import build_token_claims
+
+    app = create_app()
+    with app.app_context():
+        dialect = db.engine.dialect
+        dialect.insert_returning = False
+        dialect.insert_executemany_returning = False
+        dialect.insert_executemany_returning_sort_by_parameter_order = False
+
+        tag = uuid.uuid4().hex[:8]
+        agent = User(
+            name=f"Sync Agent {tag}", mobile_number=f"7{tag}", role=UserRole.FIELD_AGENT
+        )
+        existing = Customer(name=f"Sync Existing {tag}", mobile_number=f"5{tag}")
+        db.session.add_all([agent, existing])
+        db.session.commit()
+        existing_mobile = existing.mobile_number
+        token = create_access_token(
+            identity=agent.mobile_number, additional_claims=build_token_claims(agent)
+        )
+
+    uploads = [
+        {
+            "local_id": f"l{i}",
+            "name": f"Sync {tag} {i}",
+            "mobile_number": f"6{tag}{i:04d}",
+        }
+        for i in range(args.customers)
+    ]
+    uploads.append(
+        {"local_id": "existing", "name": "Again", "mobile_number": existing_mobile}
+    )
+    uploads.append(
+        {"local_id": "repeat", "name": "Twice", "mobile_number": f"6{tag}0000"}
+    )
+    response = app.test_client().post(
+        "/api/customer/sync",
+        json={"customers": uploads},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    body = response.get_json(silent=True) or {}
+
+    with app.app_context():
+        stored = {
+            c.mobile_number: (c.id, c.customer_id)
+            for c in Customer.query.filter(
+                Customer.mobile_number.in_([u["mobile_number"] for u in uploads])
+            )
+        }
+    synced = body.get("synced", {}) if response.status_code == 200 else {}
+    mismatched = [
+        u["local_id"]
+        for u in uploads
+        if (
+            synced.get(u["local_id"], {}).get("server_id"),
+            synced.get(u["local_id"], {}).get("customer_id"),
+        )
+        != stored.get(u["mobile_number"])
+    ]
+    created = sum(1 for r in synced.values() if r.get("status") == "created")
+
+    print(
+        f"status: {response.status_code}, created: {created}, errors: {body.get('errors')}"
+    )
+    print(f"ids matching stored rows: {len(uploads) - len(mismatched)}/{len(uploads)}")
+    ok = (
+        response.status_code == 200
+        and created == args.customers
+        and not body.get("errors")
+        and not mismatched
+        and synced["existing"]["status"] == synced["repeat"]["status"] == "duplicate"
+    )
+    print("PASS" if ok else "FAIL")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Concurrency check for idempotent POST /api/collection/submit.
+
+Usage (from backend/):
+    python check_idempotent_submit.py [--threads 32] [--db sqlite:////tmp/vasool_idem.db]
+
+Fires the same Idempotency-Key from many threads at once and verifies
+that exactly one collection is written and every thread receives the
+same response (or 409 if it gave up waiting).
+Then retries once more and checks the response is a replay. Finally it
+simulates a worker that died after committing but before storing the
+response: a retry must get 409 request_already_applied, not a second
+collection.
+Never point --db at a production database.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db", default="sqlite:////tmp/vasool_idem.db")
+    parser.add_argument("--threads", type=int, default=32)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.db
+    os.environ.setdefault("EVENT_LOG_MODE", "sync")
+
+    from flask_jwt_extended import create_access_token
+
+    from app import create_app
+    from extensions import db
+    from models import Collection, Customer, IdempotencyKey, Loan, User
+    from utils.auth_helpers import build_token_claims
+
+    app = create_app()
+    with app.app_context():
+        tag = uuid.uuid4().hex[:8]
+        agent = User(name=f"Idem Agent {tag}", mobile_number=f"7{tag}")
+        customer = Customer(name=f"Idem Customer {tag}", mobile_number=f"6{tag}")
+        db.session.add_all([agent, customer])
+        db.session.flush()
+        loan = Loan(
+            customer_id=customer.id,
+            principal_amount=1000,
+            pending_amount=1000,
+            status="active",
+        )
+        db.session.add(loan)
+        db.session.commit()
+        loan_id, agent_id = loan.id, agent.id
+        token = create_access_token(
+            identity=agent.mobile_number, additional_claims=build_token_claims(agent)
+        )
+
+    key = str(uuid.uuid4())
+    payload = {"loan_id": loan_id, "amount": 100, "payment_mode": "upi"}
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": key}
+    barrier = threading.Barrier(args.threads)
+    results = []
+    lock = threading.Lock()
+
+    def fire():
+        client = app.test_client()
+        barrier.wait()
+        resp = client.post("/api/collection/submit", json=payload, headers=headers)
+        with lock:
+            results.append((resp.status_code, resp.get_json()))
+
+    threads = [threading.Thread(target=fire) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    retry = app.test_client().post(
+        "/api/collection/submit", json=payload, headers=headers
+    )
+
+    with app.app_context():
+        written = Collection.query.filter_by(loan_id=loan_id, agent_id=agent_id).count()
+
+    # Claim committed with the business change, response never stored
+    lost_key = str(uuid.uuid4())
+    lost_headers = dict(headers, **{"Idempotency-Key": lost_key})
+    with app.app_context():
+        from utils.idempotency import _claim
+
+        _claim(
+            "collection_submit",
+            agent_id,
+            lost_key,
+            hashlib.sha256(json.dumps(payload).encode()).hexdigest(),
+            IdempotencyKey.__table__,
+        )
+        db.session.commit()
+    lost = app.test_client().post(
+        "/api/collection/submit",
+        data=json.dumps(payload),
+        content_type="application/json",
+        headers=lost_headers,
+    )
+    with app.app_context():
+        after_lost = Collection.query.filter_by(
+            loan_id=loan_id, agent_id=agent_id
+        ).count()
+    lost_ok = (
+        lost.status_code == 409
+        and lost.get_json()["msg"] == "request_already_applied"
+        and after_lost == written
+    )
+
+    succeeded = [body for status, body in results if status == 201]
+    in_progress = [status for status, _ in results if status == 409]
+    unexpected = [(s, b) for s, b in results if s not in (201, 409)]
+    same_response = (
+        all(body == succeeded[0] for body in succeeded) if succeeded else False
+    )
+
+    print(f"threads: {args.threads}, collections written: {written}")
+    print(
+        f"201 responses: {len(succeeded)} (identical: {same_response}), 409: {len(in_progress)}"
+    )
+    print(f"retry replayed: {retry.headers.get('Idempotent-Replayed') == 'true'}")
+    print(
+        f"lost response: {lost.status_code} {lost.get_json()}, collections {after_lost}"
+    )
+
+    ok = (
+        written == 1
+        and same_response
+        and not unexpected
+        and retry.headers.get("Idempotent-Replayed") == "true"
+        and retry.get_json() == succeeded[0]
+        and lost_ok
+    )
+    if unexpected:
+        print(f"unexpected responses: {unexpected[:3]}")
+    print("PASS" if ok else "FAIL")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
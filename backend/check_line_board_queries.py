@@ -0,0 +1,233 @@
+"""
+Query-count regression check for GET /api/line/<id>/customers
+(utils/line_board.py).
+
+Usage (from backend/):
+    python check_line_board_queries.py [--customers 150] [--db sqlite:////tmp/vasool_board.db]
+
+Builds a line of customers with active and closed loans, today's
+collections (cash, UPI, rejected) and EMIs due, then checks that:
+  * the board costs BOARD_QUERY_COUNT queries for a line of 10 customers
+    and the same for the full line,
+  * it matches the board computed the old way, one loan query per customer
+    and one collection query per loan,
+  * its queries compile for MySQL (the production default) without
+    constructs MySQL lacks, such as aggregate FILTER (WHERE ...).
+Never point --db at a production database.
+"""
+
+import argparse
+import os
+import uuid
+from datetime import datetime, timedelta
+
+
+def _reference_board(line_id, today):
+    """The per-row algorithm the board builder replaced"""
+    from models import Collection, EMISchedule, LineCustomer, Loan
+
+    board = []
+    mappings = (
+        LineCustomer.query.filter_by(line_id=line_id)
+        .order_by(LineCustomer.sequence_order)
+        .all()
+    )
+    end_of_day = datetime.combine(today + timedelta(days=1), datetime.min.time())
+    for m in mappings:
+        loans = (
+            Loan.query.filter_by(customer_id=m.customer.id, status="active")
+            .order_by(Loan.id)
+            .all()
+        )
+        summaries, amount, cash, upi, due_total = [], 0.0, 0.0, 0.0, 0.0
+        for loan in loans:
+            todays = Collection.query.filter(
+                Collection.loan_id == loan.id,
+                Collection.collection_date == today,
+                Collection.status != "rejected",
+            ).all()
+            collected = sum(c.amount for c in todays)
+            amount += collected
+            for c in todays:
+                if c.payment_mode and c.payment_mode.lower() == "cash":
+                    cash += c.amount
+                else:
+                    upi += c.amount
+            due = sum(
+                e.balance if e.balance is not None else e.amount
+                for e in EMISchedule.query.filter(
+                    EMISchedule.loan_id == loan.id,
+                    EMISchedule.status != "paid",
+                    EMISchedule.due_date < end_of_day,
+                )
+            )
+            due_total += due
+            summaries.append(
+                {
+                    "id": loan.id,
+                    "loan_id": loan.loan_id,
+                    "is_collected": len(todays) > 0,
+                    "collected_amount": float(collected),
+                    "pending": loan.pending_amount,
+                    "due_amount": float(due),
+                }
+            )
+        board.append(
+            {
+                "id": m.customer.id,
+                "name": m.customer.name,
+                "mobile": m.customer.mobile_number,
+                "area": m.customer.area,
+                "sequence": m.sequence_order,
+                "is_collected_today": bool(loans)
+                and all(s["is_collected"] for s in summaries),
+                "amount": float(amount),
+                "amount_cash": float(cash),
+                "amount_upi": float(upi),
+                "due_amount": float(due_total),
+                "active_loans": summaries,
+                "loan_count": len(loans),
+            }
+        )
+    return board
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db", default="sqlite:////tmp/vasool_board.db")
+    parser.add_argument("--customers", type=int, default=150)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.db
+    os.environ.setdefault("EVENT_LOG_MODE", "sync")
+
+    from sqlalchemy import event
+    from sqlalchemy.dialects import mysql
+
+    from app import create_app
+    from extensions import db
+    from models import Collection, Customer, EMISchedule, Line, LineCustomer, Loan, User
+    from utils.business_time import business_date
+    from utils.line_board import BOARD_QUERY_COUNT, build_line_board
+
+    app = create_app()
+    with app.app_context():
+        tag = uuid.uuid4().hex[:8]
+        today = business_date()
+        agent = User(name=f"Board Agent {tag}", mobile_number=f"7{tag}")
+        db.session.add(agent)
+        db.session.flush()
+        small = Line(name=f"Board small {tag}", area="Check", agent_id=agent.id)
+        full = Line(name=f"Board full {tag}", area="Check", agent_id=agent.id)
+        db.session.add_all([small, full])
+        db.session.flush()
+
+        modes = ["cash", "upi", "Cash", None]
+        midnight = datetime.combine(today, datetime.min.time())
+        for i in range(args.customers):
+            customer = Customer(
+                name=f"Board {tag} {i}", mobile_number=f"6{tag}{i:04d}", area="Check"
+            )
+            db.session.add(customer)
+            db.session.flush()
+            db.session.add(
+                LineCustomer(
+                    line_id=full.id,
+                    customer_id=customer.id,
+                    sequence_order=args.customers - i,
+                )
+            )
+            if i < 10:
+                db.session.add(
+                    LineCustomer(
+                        line_id=small.id, customer_id=customer.id, sequence_order=i
+                    )
+                )
+            for n in range(i % 3):
+                loan = Loan(
+                    customer_id=customer.id,
+                    principal_amount=1000,
+                    pending_amount=1000 - 10 * i,
+                    status="active" if (i + n) % 4 else "closed",
+                )
+                db.session.add(loan)
+                db.session.flush()
+                for k in range(i % 4):
+                    db.session.add(
+                        Collection(
+                            loan_id=loan.id,
+                            agent_id=agent.id,
+                            amount=10.5 + k,
+                            payment_mode=modes[(i + k) % len(modes)],
+                            status="rejected" if k == 2 else "approved",
+                            collection_date=(
+                                today if k != 1 else today - timedelta(days=1)
+                            ),
+                        )
+                    )
+                for k in range(3):
+                    db.session.add(
+                        EMISchedule(
+                            loan_id=loan.id,
+                            emi_no=k + 1,
+                            due_date=midnight + timedelta(days=k - 1, hours=20),
+                            amount=100,
+                            principal_part=90,
+                            interest_part=10,
+                            balance=100 - 25 * k,
+                            status="paid" if (i + k) % 5 == 0 else "pending",
+                        )
+                    )
+        db.session.commit()
+
+        statements = []
+        event.listen(
+            db.engine, "before_cursor_execute", lambda *a: statements.append(a[2])
+        )
+        mysql_sql = []
+
+        def compile_for_mysql(conn, clause, *args):
+            if hasattr(clause, "compile"):
+                mysql_sql.append(str(clause.compile(dialect=mysql.dialect())))
+
+        event.listen(db.engine, "before_execute", compile_for_mysql)
+
+        def counted(line_id):
+            statements.clear()
+            db.session.expire_all()
+            board = build_line_board(line_id, today)
+            return board, len(statements)
+
+        small_board, small_queries = counted(small.id)
+        full_board, full_queries = counted(full.id)
+        event.remove(db.engine, "before_execute", compile_for_mysql)
+        statements.clear()
+        reference = _reference_board(full.id, today)
+        reference_queries = len(statements)
+
+    print(f"customers: {args.customers}")
+    print(
+        f"queries: 10-customer line {small_queries}, full line {full_queries} "
+        f"(expected {BOARD_QUERY_COUNT}); per-row algorithm {reference_queries}"
+    )
+    mysql_ok = bool(mysql_sql) and not any(" FILTER (" in sql for sql in mysql_sql)
+    print(f"MySQL-compatible SQL: {mysql_ok}")
+    matches = full_board == reference
+    print(f"same board as per-row algorithm: {matches}")
+    if not matches:
+        for new, old in zip(full_board, reference):
+            if new != old:
+                print(f"first difference:\n  board:     {new}\n  reference: {old}")
+                break
+    ok = (
+        small_queries == full_queries == BOARD_QUERY_COUNT
+        and matches
+        and mysql_ok
+        and len(small_board) == 10
+    )
+    print("PASS" if ok else "FAIL")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Concurrency check for the business ID allocator (utils/id_allocator.py).
+
+Usage (from backend/):
+    python check_loan_id_allocator.py [--processes 4] [--threads 8] [--loans 2000]
+                                      [--db sqlite:////tmp/vasool_ids.db]
+
+Several worker processes, each with several threads, create loans through
+POST /api/loan/create at the same time. Every request must succeed and
+every loan_id must be distinct. Never point --db at a production database.
+"""
+
+import argparse
+import multiprocessing
+import os
+import threading
+
+
+def _app(db_url):
+    os.environ["DATABASE_URL"] = db_url
+    os.environ.setdefault("EVENT_LOG_MODE", "sync")
+    from app import create_app
+
+    return create_app()
+
+
+def _worker(db_url, token, customer_id, threads, loans, queue):
+    app = _app(db_url)
+    results = []
+    lock = threading.Lock()
+
+    def fire(count):
+        client = app.test_client()
+        for _ in range(count):
+            resp = client.post(
+                "/api/loan/create",
+                json={"customer_id": customer_id, "principal_amount": 1000},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            with lock:
+                results.append(
+                    (resp.status_code, (resp.get_json() or {}).get("loan_id"))
+                )
+
+    per_thread = [
+        loans // threads + (1 if i < loans % threads else 0) for i in range(threads)
+    ]
+    pool = [threading.Thread(target=fire, args=(n,)) for n in per_thread]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    queue.put(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db", default="sqlite:////tmp/vasool_ids.db")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--loans", type=int, default=2000, help="Total loans to create")
+    args = parser.parse_args()
+
+    app = _app(args.db)
+    import uuid
+
+    from flask_jwt_extended import create_access_token
+
+    from extensions import db
+    from models import Customer, Loan, User, UserRole
+
+    with app.app_context():
+        tag = uuid.uuid4().hex[:8]
+        admin = User(
+            name=f"Ids Admin {tag}", mobile_number=f"7{tag}", role=UserRole.ADMIN
+        )
+        customer = Customer(name=f"Ids Customer {tag}", mobile_number=f"6{tag}")
+        db.session.add_all([admin, customer])
+        db.session.commit()
+        customer_id = customer.id
+        token = create_access_token(identity=admin.mobile_number)
+
+    queue = multiprocessing.Queue()
+    per_process = [
+        args.loans // args.processes + (1 if i < args.loans % args.processes else 0)
+        for i in range(args.processes)
+    ]
+    workers = [
+        multiprocessing.Process(
+            target=_worker, args=(args.db, token, customer_id, args.threads, n, queue)
+        )
+        for n in per_process
+    ]
+    for w in workers:
+        w.start()
+    results = [entry for _ in workers for entry in queue.get()]
+    for w in workers:
+        w.join()
+
+    with app.app_context():
+        stored = [
+            loan_id
+            for (loan_id,) in db.session.query(Loan.loan_id).filter(
+                Loan.customer_id == customer_id
+            )
+        ]
+
+    failed = [(status, loan_id) for status, loan_id in results if status != 201]
+    issued = [loan_id for status, loan_id in results if status == 201]
+    print(f"requests: {len(results)}, created: {len(issued)}, failed: {len(failed)}")
+    print(f"distinct loan_ids: {len(set(issued))}, stored for customer: {len(stored)}")
+    ok = (
+        len(results) == args.loans
+        and not failed
+        and len(set(issued)) == len(issued) == len(stored)
+        and set(issued) == set(stored)
+    )
+    if failed:
+        print(f"failures: {failed[:3]}")
+    print("PASS" if ok else "FAIL")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Export the int8 TorchScript face model and check it against the float model.
+
+Usage (from backend/):
+    python export_face_model.py [--images DIR] [--min-cosine 0.95]
+
+Serve it with FACE_MODEL_VARIANT=int8. Without --images the parity check
+runs on synthetic tensors, which only proves the export is sane; pass a
+folder of real face photos before switching production over.
+"""
+
+import argparse
+import os
+import sys
+
+import torch
+
+from utils.face_utils import (
+    FACE_MODEL_INT8_PATH,
+    build_float_model,
+    embedding_parity,
+    export_int8_model,
+    load_int8_model,
+    preprocess_face,
+)
+
+
+def load_faces(image_dir, limit):
+    faces = []
+    for name in sorted(os.listdir(image_dir)):
+        with open(os.path.join(image_dir, name), "rb") as f:
+            tensor, error = preprocess_face(f.read())
+        if error:
+            print(f"  skipped {name}: {error}")
+            continue
+        faces.append(tensor)
+        if len(faces) >= limit:
+            break
+    return faces
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", default=FACE_MODEL_INT8_PATH)
+    parser.add_argument("--images", help="Folder of face photos for the parity check")
+    parser.add_argument("--samples", type=int, default=32)
+    parser.add_argument("--min-cosine", type=float, default=0.95)
+    args = parser.parse_args()
+
+    path = export_int8_model(args.output)
+    print(
+        f"Exported int8 TorchScript model to {path} ({os.path.getsize(path) / 1e6:.1f} MB)"
+    )
+
+    if args.images:
+        faces = load_faces(args.images, args.samples)
+    else:
+        torch.manual_seed(0)
+        faces = list(torch.randn(args.samples, 3, 224, 224))
+    if not faces:
+        print("No usable faces for the parity check")
+        return 1
+
+    report = embedding_parity(build_float_model(), load_int8_model(path), faces)
+    print(
+        f"Parity on {report['samples']} faces: mean cosine {report['mean_cosine']:.4f}, "
+        f"min cosine {report['min_cosine']:.4f}, "
+        f"decision agreement {report['decision_agreement'] * 100:.1f}%"
+    )
+    if report["min_cosine"] < args.min_cosine:
+        print(f"FAILED: min cosine below {args.min_cosine}, do not enable int8")
+        return 1
+    print("OK: int8 model can be enabled with FACE_MODEL_VARIANT=int8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
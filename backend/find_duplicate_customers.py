@@ -0,0 +1,24 @@
+"""
+Scan all customers for likely duplicates and store them as duplicate
+clusters for admin review (GET /api/customer/duplicate-clusters).
+Replaces the open clusters of the previous run; dismissed groups stay
+dismissed.
+
+Usage (from backend/):  python find_duplicate_customers.py [workers]
+"""
+
+import sys
+
+from app import create_app
+from utils.duplicate_detection import scan_duplicates
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    app = create_app()
+    with app.app_context():
+        summary = scan_duplicates(workers=workers)
+        print(
+            f"{summary['customers']} customers, {summary['blocks']} blocks, "
+            f"{summary['pairs_compared']} pairs compared, {summary['matches']} matches, "
+            f"{summary['clusters']} clusters (run {summary['run_id']})"
+        )
@@ -15,3 +15,41 @@ errorlog = "-"   # stderr
 
 # Security
 forwarded_allow_ips = "*"
+
+
+# Run by the master before any worker starts:
+# - schema sync and backfills (`flask migrate`), once instead of in every
+#   worker; MIGRATE_ON_START=0 when the deploy runs it separately
+# - the shared face inference process (FACE_INFERENCE_MODE=service), so
+#   workers never load their own torch model
+def on_starting(server):
+    import subprocess  # nosec B404
+    import sys
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    if os.getenv("MIGRATE_ON_START", "1") == "1":
+        subprocess.run(  # nosec B603
+            [sys.executable, "-m", "flask", "--app", "app:create_app", "migrate"],
+            cwd=backend_dir,
+            check=True,
+        )
+
+    if os.getenv("FACE_INFERENCE_MODE", "inline") != "service":
+        return
+    server.face_inference = subprocess.Popen(  # nosec B603
+        [sys.executable, "-m", "utils.face_inference"],
+        cwd=backend_dir,
+    )
+
+
+def on_exit(server):
+    proc = getattr(server, "face_inference", None)
+    if proc is not None:
+        proc.terminate()
+
+
+# Flush buffered log/audit rows (utils/event_log.py) before a worker exits
+def worker_exit(server, worker):
+    from utils.event_log import event_log
+
+    event_log.drain()
@@ -0,0 +1,18 @@
+"""
+One-off migration: convert FaceEmbedding rows from JSON float lists to
+packed, L2-normalised float32 blobs.
+
+Usage (from backend/):  python migrate_face_embeddings.py
+"""
+
+from app import create_app
+from extensions import db
+from utils.face_embeddings import migrate_face_embeddings
+
+if __name__ == "__main__":
+    app = create_app()
+    with app.app_context():
+        result = migrate_face_embeddings(db)
+        print(f"Converted {result['converted']} face embeddings")
+        for row in result["failed"]:
+            print(f"  FAILED id={row['id']} user={row['user_id']}: {row['error']}")
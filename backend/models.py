@@ -1,8 +1,16 @@
 from extensions import db
 from datetime import datetime
+from sqlalchemy.orm import validates
+from utils.business_time import business_date
+from utils.match_keys import customer_match_keys
 import enum
 
 
+def normalize_name(name):
+    """Case/whitespace-insensitive form of a user name, used for login lookups"""
+    return name.strip().lower() if name else name
+
+
 class UserRole(enum.Enum):
     ADMIN = "admin"
     FIELD_AGENT = "field_agent"
@@ -12,6 +20,8 @@ class User(db.Model):
     __tablename__ = "users"
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)  # Full Name
+    # normalize_name(name), kept in sync below; indexed for PIN login
+    name_normalized = db.Column(db.String(100), index=True, nullable=True)
     mobile_number = db.Column(db.String(15), unique=True, nullable=False)
     pin_hash = db.Column(db.String(255), nullable=True)  # For Field Agents
     password_hash = db.Column(db.String(255), nullable=True)  # For Admin
@@ -41,6 +51,9 @@ class User(db.Model):
     current_activity = db.Column(db.String(100), default="idle")  # 'idle', 'moving', 'collecting'
     last_biometric_login = db.Column(db.DateTime, nullable=True)
 
+    # Bumped to revoke every token issued before a role/status/credential change
+    token_version = db.Column(db.Integer, default=0, server_default="0", nullable=False)
+
     # Manager Hierarchy
     manager_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
     assigned_agents = db.relationship(
@@ -57,12 +70,20 @@ class User(db.Model):
     )
     devices = db.relationship("Device", backref="user", cascade="all, delete-orphan")
 
+    @validates("name")
+    def _sync_name_normalized(self, key, value):
+        self.name_normalized = normalize_name(value)
+        return value
+
 
 class FaceEmbedding(db.Model):
     __tablename__ = "face_embeddings"
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    embedding_data = db.Column(db.JSON, nullable=False)  # Stores face features
+    embedding_data = db.Column(db.JSON, nullable=True)  # Legacy JSON float list
+    # L2-normalised float32 vector (see utils/face_embeddings.py)
+    embedding_blob = db.Column(db.LargeBinary, nullable=True)
+    model_version = db.Column(db.String(50), nullable=True)
     device_id = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -113,7 +134,7 @@ class Customer(db.Model):
     name = db.Column(db.String(100), nullable=False)
     mobile_number = db.Column(db.String(15), unique=True, nullable=False)
     address = db.Column(db.Text, nullable=True)
-    area = db.Column(db.String(100), nullable=True)
+    area = db.Column(db.String(100), nullable=True, index=True)
     assigned_worker_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
 
     # Lifecycle & Status
@@ -141,20 +162,47 @@ class Customer(db.Model):
     locked_at = db.Column(db.DateTime, nullable=True)
     version = db.Column(db.Integer, default=1)
 
+    # Delta sync: bumped on every write that changes the row or who can see it
+    # (utils/customer_sync.py)
+    change_version = db.Column(db.BigInteger, nullable=True, index=True)
+    # Derived match keys (utils/match_keys.py), kept in sync by _sync_match_keys
+    search_text = db.Column(db.String(255), nullable=True)  # utils/customer_search.py
+    name_key = db.Column(db.String(100), nullable=True, index=True)  # phonetic name
+    mobile_suffix = db.Column(db.String(10), nullable=True, index=True)
+    area_key = db.Column(db.String(100), nullable=True, index=True)  # search_key(area)
+
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Customer list keyset: newest first
+        db.Index("ix_customers_created_id", "created_at", "id"),
+    )
+
     # Relationships
     worker = db.relationship(
         "User", foreign_keys=[assigned_worker_id], backref="assigned_customers"
     )
     locker = db.relationship("User", foreign_keys=[locked_by])
 
+    @validates("name", "mobile_number", "customer_id", "area")
+    def _sync_match_keys(self, key, value):
+        fields = {
+            "name": self.name,
+            "mobile_number": self.mobile_number,
+            "customer_id": self.customer_id,
+            "area": self.area,
+            key: value,
+        }
+        for column, derived in customer_match_keys(**fields).items():
+            setattr(self, column, derived)
+        return value
+
 
 class Loan(db.Model):
     __tablename__ = "loans"
     id = db.Column(db.Integer, primary_key=True)
     loan_id = db.Column(db.String(25), unique=True, nullable=True)  # LN-YYYY-XXXXXX
-    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id"), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id"), nullable=False, index=True)
     principal_amount = db.Column(db.Float, nullable=False)
     interest_type = db.Column(db.String(20), default="flat")  # 'flat', 'reducing'
     interest_rate = db.Column(db.Float, default=10.0)
@@ -232,6 +280,10 @@ class LoanDocument(db.Model):
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+def _collection_business_date(context):
+    return business_date(context.get_current_parameters().get("created_at"))
+
+
 class Collection(db.Model):
     __tablename__ = "collections"
     id = db.Column(db.Integer, primary_key=True)
@@ -246,6 +298,17 @@ class Collection(db.Model):
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # IST business day of created_at; plain column so day filters can use indexes
+    collection_date = db.Column(db.Date, default=_collection_business_date, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_collections_loan_date", "loan_id", "collection_date"),
+        db.Index(
+            "ix_collections_agent_date_mode", "agent_id", "collection_date", "payment_mode"
+        ),
+        # Approval queue keyset: newest pending/flagged first
+        db.Index("ix_collections_status_created", "status", "created_at", "id"),
+    )
 
     # Relationships
     loan = db.relationship(
@@ -412,3 +475,87 @@ class LocationLog(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship("User", backref=db.backref("location_history", cascade="all, delete-orphan"))
+
+
+class IdempotencyKey(db.Model):
+    """Client-supplied retry key and the response it produced (see utils/idempotency.py)"""
+    __tablename__ = "idempotency_keys"
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(32), nullable=False)  # e.g. 'collection_submit'
+    user_id = db.Column(db.Integer, nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.SmallInteger, nullable=True)  # NULL while in progress
+    response_body = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint("scope", "user_id", "key", name="uq_idempotency_scope_user_key"),
+    )
+
+
+class AgentActivityStats(db.Model):
+    """
+    Running per-agent counters read by the collection fraud rules, kept in
+    step with collections by utils/agent_stats.py (rebuild_agent_stats.py
+    recomputes them from history).
+    """
+    __tablename__ = "agent_activity_stats"
+    agent_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    flagged_count = db.Column(db.Integer, default=0, nullable=False)
+    last_collection_at = db.Column(db.DateTime, nullable=True)
+    stats_date = db.Column(db.Date, nullable=True)  # IST day the totals below cover
+    day_count = db.Column(db.Integer, default=0, nullable=False)
+    day_amount = db.Column(db.Float, default=0.0, nullable=False)
+    day_cash_amount = db.Column(db.Float, default=0.0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ChangeCounter(db.Model):
+    """
+    Named monotonically increasing counters: change versions
+    (utils/customer_sync.py) and business ID sequences (utils/id_allocator.py)
+    """
+    __tablename__ = "change_counters"
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, default=0, nullable=False)
+
+
+class CustomerTombstone(db.Model):
+    """Deleted customers, so delta sync can tell devices to drop them"""
+    __tablename__ = "customer_tombstones"
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, nullable=False)
+    change_version = db.Column(db.BigInteger, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DuplicateCluster(db.Model):
+    """
+    Customers that look like the same person, found by the batch scan in
+    utils/duplicate_detection.py (find_duplicate_customers.py)
+    """
+    __tablename__ = "duplicate_clusters"
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(36), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False)
+    max_score = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), default="open", index=True)  # open, dismissed, merged
+    reviewed_by = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    members = db.relationship(
+        "DuplicateClusterMember", backref="cluster", cascade="all, delete-orphan", lazy=True
+    )
+
+
+class DuplicateClusterMember(db.Model):
+    __tablename__ = "duplicate_cluster_members"
+    id = db.Column(db.Integer, primary_key=True)
+    cluster_id = db.Column(
+        db.Integer, db.ForeignKey("duplicate_clusters.id"), nullable=False, index=True
+    )
+    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id"), nullable=False, index=True)
+    best_match_id = db.Column(db.Integer, nullable=True)  # most similar other member
+    score = db.Column(db.Float, nullable=False)  # similarity to best_match_id
@@ -0,0 +1,15 @@
+"""
+Recompute agent_activity_stats (flagged count, last collection time and
+today's totals per agent) from the collections table.
+
+Usage (from backend/):  python rebuild_agent_stats.py
+"""
+
+from app import create_app
+from utils.agent_stats import rebuild_agent_stats
+
+if __name__ == "__main__":
+    app = create_app()
+    with app.app_context():
+        count = rebuild_agent_stats()
+        print(f"Rebuilt stats for {count} agents")
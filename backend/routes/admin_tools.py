@@ -14,7 +14,12 @@ from models import (
     CustomerDocument,
     SystemSetting,
 )
-from utils.auth_helpers import get_user_by_identity
+from utils.auth_helpers import (
+    get_user_by_identity,
+    identity_cache_stats,
+    principal_required,
+)
+from utils.event_log import event_log
 
 admin_tools_bp = Blueprint("admin_tools", __name__)
 
@@ -65,6 +70,20 @@ def get_raw_table_data(table_name):
         return jsonify({"msg": "Error fetching data", "error": str(e)}), 500
 
 
+@admin_tools_bp.route("/identity-cache", methods=["GET"])
+@principal_required(admin=True)
+def get_identity_cache_stats():
+    """Hit/miss counters of this worker's identity cache"""
+    return jsonify(identity_cache_stats()), 200
+
+
+@admin_tools_bp.route("/event-log", methods=["GET"])
+@principal_required(admin=True)
+def get_event_log_stats():
+    """Buffered/written counters of this worker's event log writer"""
+    return jsonify(event_log.stats()), 200
+
+
 @admin_tools_bp.route("/ai-analyst", methods=["POST"])
 @jwt_required()
 def ai_analyst():
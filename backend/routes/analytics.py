@@ -1,22 +1,16 @@
 from flask import Blueprint, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models import db, User, Customer, Loan, Collection, EMISchedule, UserRole
 from datetime import datetime, timedelta
 from sqlalchemy import func
-from utils.auth_helpers import get_user_by_identity
+from utils.auth_helpers import get_admin_principal
 
 analytics_bp = Blueprint("analytics", __name__)
 
 
 def get_admin_user():
-    identity = get_jwt_identity()
-    user = get_user_by_identity(identity)
-    if user:
-         # Normalize role check
-         current_role = user.role.value if hasattr(user.role, 'value') else str(user.role)
-         if current_role == "admin" or current_role == UserRole.ADMIN.value:
-             return user
-    return None
+    # Pure claim check for v2 tokens; legacy tokens fall back to a user lookup
+    return get_admin_principal()
 
 
 @analytics_bp.route("/risk-score/<int:customer_id>", methods=["GET"])
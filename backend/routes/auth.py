@@ -1,16 +1,25 @@
 from flask import Blueprint, request, jsonify
 from extensions import db
-from models import User, UserRole, LoginLog, Device, OTPLog, FaceEmbedding
+from models import User, UserRole, LoginLog, Device, OTPLog, FaceEmbedding, normalize_name
 from flask_jwt_extended import (
     create_access_token,
     create_refresh_token,
     jwt_required,
     get_jwt_identity,
+    get_jwt,
 )
 import bcrypt
 
 from datetime import datetime, timedelta
-from utils.auth_helpers import get_user_by_identity
+from utils.auth_helpers import (
+    get_user_by_identity,
+    invalidate_user_identity,
+    build_token_claims,
+    load_pin_login,
+    revoke_user_tokens,
+    principal_required,
+)
+from utils.event_log import event_log
 
 auth_bp = Blueprint("auth", __name__)
 import logging
@@ -54,12 +63,14 @@ def login_pin():
 
         print(f"Login attempt for: {name}")
 
-        user = User.query.filter(User.name.ilike(name)).first()
+        device_id = data.get("device_id")
+        login = load_pin_login(name, device_id)
 
-        if not user:
+        if not login:
             print(f"User not found: {name}")
             return jsonify({"msg": "invalid_login"}), 401
 
+        user = login.user
         if not user.is_active:
             return jsonify({"msg": "user_inactive"}), 403
 
@@ -72,68 +83,44 @@ def login_pin():
         # Direct PIN check mirroring Admin Login pattern
         if bcrypt.checkpw(pin.encode("utf-8"), user.pin_hash.encode("utf-8")):
             # User PIN is correct. Now check Device Security.
-            device_id = data.get("device_id")
-
-            # Check if this user has any face data registered (Biometric Enabled)
-            from models import FaceEmbedding
-
-            has_biometrics = (
-                FaceEmbedding.query.filter_by(user_id=user.id).first() is not None
-            )
-
-            if has_biometrics:
-                # If biometrics enabled, enforce Trusted Device policy
-                if not device_id:
-                    return (
-                        jsonify(
-                            {
-                                "msg": "requires_face_verification",
-                                "reason": "new_device",
-                                "name": user.name,
-                            }
-                        ),
-                        200,
-                    )
-
-                trusted_device = Device.query.filter_by(
-                    user_id=user.id, device_id=device_id, is_trusted=True
-                ).first()
-                if not trusted_device:
-                    # PIN is good, but Device is Unknown -> Require Face
-                    return (
-                        jsonify(
-                            {
-                                "msg": "requires_face_verification",
-                                "reason": "new_device",
-                                "name": user.name,
-                            }
-                        ),
-                        200,
-                    )
-
-            # If no biometrics or Device is Trusted -> Log in
-            user.last_login = datetime.utcnow()
-
-            # Update device last active if exists
-            if device_id:
-                dev = Device.query.filter_by(
-                    user_id=user.id, device_id=device_id
-                ).first()
-                if dev:
-                    dev.last_active = datetime.utcnow()
+            # If biometrics enabled, enforce Trusted Device policy
+            trusted = login.device is not None and login.device.is_trusted
+            if login.has_biometrics and not trusted:
+                # PIN is good, but Device is Unknown -> Require Face
+                return (
+                    jsonify(
+                        {
+                            "msg": "requires_face_verification",
+                            "reason": "new_device",
+                            "name": user.name,
+                        }
+                    ),
+                    200,
+                )
+
+            # If no biometrics or Device is Trusted -> Log in.
+            # Last login, device touch and audit row go out in one flush.
+            now = datetime.utcnow()
+            user.last_login = now
+            if login.device is not None:
+                login.device.last_active = now
 
             # Simple Audit success login
-            log = LoginLog(
+            event_log.emit(
+                LoginLog,
+                durable=True,
                 user_id=user.id,
                 status="success",
                 ip_address=request.remote_addr,
                 device_info=device_id or "Unknown",
             )
-            db.session.add(log)
             db.session.commit()
 
-            access_token = create_access_token(identity=name)
-            refresh_token = create_refresh_token(identity=name)
+            claims = build_token_claims(user)
+            access_token = create_access_token(identity=name, additional_claims=claims)
+            refresh_token = create_refresh_token(
+                identity=name, additional_claims=claims
+            )
 
             # Resolve role value safely
             current_role = user.role.value if hasattr(user.role, 'value') else str(user.role)
@@ -175,29 +162,19 @@ def verify_face_login():
         file = request.files["file"]
         image_bytes = file.read()
 
-        user = User.query.filter(User.name.ilike(name)).first()
+        user = User.query.filter_by(name_normalized=normalize_name(name)).first()
         if not user:
             return jsonify({"msg": "Invalid Login"}), 401
 
-        # 2. Get registered face
-        from models import FaceEmbedding
+        # 2. Get registered face templates
+        from utils.face_index import face_index
 
-        stored_face = FaceEmbedding.query.filter_by(user_id=user.id).first()
-        if not stored_face:
+        stored_count = face_index.sync_user(user.id)
+        if not stored_count:
             return jsonify({"msg": "Face not registered"}), 401
 
-        # 3. Real ML Verification
-        from utils.face_utils import generate_face_embedding, compare_embeddings
-
-        current_embedding, error = generate_face_embedding(image_bytes)
-
-        if error:
-            return jsonify({"msg": f"AI Error: {error}"}), 422
-
         # Check for model version mismatch (e.g. 128-d vs 1280-d)
-        stored_emb = stored_face.embedding_data
-
-        if len(stored_emb) != len(current_embedding):
+        if not face_index.template_count(user.id):
             return (
                 jsonify(
                     {
@@ -207,7 +184,19 @@ def verify_face_login():
                 400,
             )
 
-        similarity = compare_embeddings(stored_emb, current_embedding)
+        # 3. Real ML Verification
+        from utils.face_inference import generate_face_embedding
+        from utils.face_embeddings import normalize_embedding
+
+        current_embedding, error = generate_face_embedding(image_bytes)
+
+        if error:
+            return jsonify({"msg": f"AI Error: {error}"}), 422
+
+        # Best score over all of the user's templates
+        similarity, _ = face_index.verify(
+            user.id, normalize_embedding(current_embedding), sync=False
+        )
 
         # Threshold for MobileNetV2 features (tuned for reliability)
         if similarity >= 0.75:
@@ -229,8 +218,11 @@ def verify_face_login():
                     device.last_active = datetime.utcnow()
                 db.session.commit()
 
-            access_token = create_access_token(identity=name)
-            refresh_token = create_refresh_token(identity=name)
+            claims = build_token_claims(user)
+            access_token = create_access_token(identity=name, additional_claims=claims)
+            refresh_token = create_refresh_token(
+                identity=name, additional_claims=claims
+            )
 
             return (
                 jsonify(
@@ -253,6 +245,49 @@ def verify_face_login():
         return jsonify({"msg": "server_error", "error": str(e)}), 500
 
 
+@auth_bp.route("/identify-face", methods=["POST"])
+@principal_required(admin=True)
+def identify_face():
+    """1:N lookup: which enrolled users does this face match best?"""
+    if "file" not in request.files:
+        return jsonify({"msg": "Missing face file"}), 400
+
+    try:
+        top_k = int(request.form.get("top_k", 5))
+    except (TypeError, ValueError):
+        return jsonify({"msg": "top_k must be a number"}), 400
+    top_k = max(1, min(top_k, 20))
+
+    from utils.face_inference import generate_face_embedding
+    from utils.face_embeddings import normalize_embedding
+    from utils.face_index import face_index
+
+    embedding, error = generate_face_embedding(request.files["file"].read())
+    if error:
+        return jsonify({"msg": f"AI Error: {error}"}), 422
+
+    matches = face_index.search(normalize_embedding(embedding), top_k=top_k)
+    names = dict(
+        db.session.query(User.id, User.name).filter(
+            User.id.in_([m["user_id"] for m in matches])
+        )
+    )
+    return (
+        jsonify(
+            [
+                {
+                    "user_id": m["user_id"],
+                    "name": names.get(m["user_id"], "Unknown"),
+                    "score": round(m["score"], 4),
+                    "is_match": m["score"] >= 0.75,
+                }
+                for m in matches
+            ]
+        ),
+        200,
+    )
+
+
 @auth_bp.route("/admin-login", methods=["POST"])
 def admin_login():
     data = request.get_json()
@@ -281,13 +316,14 @@ def admin_login():
         password.encode("utf-8"), user.password_hash.encode("utf-8")
     ):
         # Audit failed login
-        log = LoginLog(
+        event_log.emit(
+            LoginLog,
+            durable=True,
             user_id=user.id,
             status="failed",
             device_info=request.headers.get("User-Agent"),
             ip_address=request.remote_addr,
         )
-        db.session.add(log)
         db.session.commit()
         return jsonify({"msg": "Invalid Password"}), 401
 
@@ -295,17 +331,19 @@ def admin_login():
     user.last_login = datetime.utcnow()
 
     # Audit success login
-    log = LoginLog(
+    event_log.emit(
+        LoginLog,
+        durable=True,
         user_id=user.id,
         status="success",
         device_info=request.headers.get("User-Agent"),
         ip_address=request.remote_addr,
     )
-    db.session.add(log)
     db.session.commit()
 
-    access_token = create_access_token(identity=username)
-    refresh_token = create_refresh_token(identity=username)
+    claims = build_token_claims(user)
+    access_token = create_access_token(identity=username, additional_claims=claims)
+    refresh_token = create_refresh_token(identity=username, additional_claims=claims)
 
     return (
         jsonify(
@@ -340,17 +378,19 @@ def admin_verify():
     user.last_login = datetime.utcnow()
 
     # Audit success login
-    log = LoginLog(
+    event_log.emit(
+        LoginLog,
+        durable=True,
         user_id=user.id,
         status="success",
         device_info=request.headers.get("User-Agent"),
         ip_address=request.remote_addr,
     )
-    db.session.add(log)
     db.session.commit()
 
-    access_token = create_access_token(identity=mobile_number)
-    refresh_token = create_refresh_token(identity=mobile_number)
+    claims = build_token_claims(user)
+    access_token = create_access_token(identity=mobile_number, additional_claims=claims)
+    refresh_token = create_refresh_token(identity=mobile_number, additional_claims=claims)
 
     return (
         jsonify(
@@ -369,7 +409,18 @@ def admin_verify():
 @jwt_required(refresh=True)
 def refresh_token():
     current_user = get_jwt_identity()
-    new_token = create_access_token(identity=current_user)
+    user = get_user_by_identity(current_user)
+    if user is None:
+        new_token = create_access_token(identity=current_user)
+        return jsonify({"access_token": new_token}), 200
+
+    # Old refresh tokens carry no version; claimed ones must still be current
+    if get_jwt().get("tv", user.token_version or 0) != (user.token_version or 0):
+        return jsonify({"msg": "token_revoked"}), 401
+
+    new_token = create_access_token(
+        identity=current_user, additional_claims=build_token_claims(user)
+    )
     return jsonify({"access_token": new_token}), 200
 
 
@@ -489,7 +540,7 @@ def register_face():
         file = request.files["file"]
         image_bytes = file.read()
 
-        from utils.face_utils import generate_face_embedding
+        from utils.face_inference import generate_face_embedding
 
         embedding, error = generate_face_embedding(image_bytes)
 
@@ -497,17 +548,22 @@ def register_face():
             return jsonify({"msg": f"AI Error: {error}"}), 422
 
         from models import FaceEmbedding
+        from utils.face_embeddings import FACE_MODEL_VERSION, pack_embedding
+        from utils.face_index import face_index, prune_templates
 
-        # Remove old embedding if exists
-        FaceEmbedding.query.filter_by(user_id=target_user.id).delete()
+        # Replace old templates unless enrolling an additional one
+        append = request.form.get("append", "").lower() in ("1", "true", "yes")
+        prune_templates(target_user.id, keep_latest=append)
 
         new_face = FaceEmbedding(
-            user_id=target_user.id, 
-            embedding_data=embedding, 
-            device_id=device_id
+            user_id=target_user.id,
+            embedding_blob=pack_embedding(embedding),
+            model_version=FACE_MODEL_VERSION,
+            device_id=device_id,
         )
         db.session.add(new_face)
         db.session.commit()
+        face_index.sync_user(target_user.id)
 
         return jsonify({"msg": "face_registered_successfully"}), 201
     except Exception as e:
@@ -569,6 +625,7 @@ def reset_device():
     # Delete or untrust devices for this user
     Device.query.filter_by(user_id=user_id).delete()
     db.session.commit()
+    invalidate_user_identity(int(user_id))
 
     return jsonify({"msg": "Device binding reset"}), 200
 
@@ -614,9 +671,11 @@ def clear_biometrics(user_id):
         return jsonify({"msg": "Access Denied"}), 403
 
     from models import FaceEmbedding
+    from utils.face_index import face_index
 
     FaceEmbedding.query.filter_by(user_id=user_id).delete()
     db.session.commit()
+    face_index.remove_user(user_id)
 
     return jsonify({"msg": "Biometric data cleared successfully"}), 200
 
@@ -643,8 +702,10 @@ def reset_user_pin(user_id):
     )
     u.pin_hash = hashed_pin
     u.is_first_login = True  # Force worker to change it maybe? Or just reset it.
+    revoke_user_tokens(u)
 
     db.session.commit()
+    invalidate_user_identity(u.id)
     return jsonify({"msg": "PIN reset successfully"}), 200
 
 
@@ -718,6 +779,7 @@ def update_user(user_id):
         u.address = data["address"]
     if "id_proof" in data:
         u.id_proof = data["id_proof"]
+    old_access = (u.role, u.is_active, u.is_locked)
     if "role" in data:
         try:
             u.role = UserRole(data["role"])
@@ -729,7 +791,11 @@ def update_user(user_id):
     if "is_locked" in data:
         u.is_locked = bool(data["is_locked"])
 
+    if (u.role, u.is_active, u.is_locked) != old_access:
+        revoke_user_tokens(u)
+
     db.session.commit()
+    invalidate_user_identity(u.id)
     return jsonify({"msg": "User updated successfully"}), 200
 
 
@@ -754,7 +820,9 @@ def toggle_user_status(user_id):
         u.is_locked = bool(data["is_locked"])
         print(f"DEBUG: Toggled user {user_id} is_locked to {u.is_locked}")
 
+    revoke_user_tokens(u)
     db.session.commit()
+    invalidate_user_identity(u.id)
     print(f"DEBUG: Committed status change for user {user_id}")
     return (
         jsonify(
@@ -787,6 +855,11 @@ def delete_user(user_id):
     # Automated cleanup handles dependencies via Relationship Cascades
     db.session.delete(u)
     db.session.commit()
+    invalidate_user_identity(user_id)
+
+    from utils.face_index import face_index
+
+    face_index.remove_user(user_id)
 
     return jsonify({"msg": "User deleted successfully"}), 200
 
@@ -1,4 +1,5 @@
-from flask import Blueprint, request, jsonify
+import bisect
+from flask import Blueprint, request, jsonify, make_response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import (
     db,
@@ -12,8 +13,24 @@ from models import (
     Line,
     LineCustomer,
 )
+from utils.agent_stats import lock_agent_stats, record_new_collection, record_status_change
 from utils.auth_helpers import get_user_by_identity
-from datetime import datetime, timedelta
+from utils.business_time import IST_OFFSET, business_date
+from utils.customer_sync import (
+    SYNC_PAGE_DEFAULT,
+    SYNC_PAGE_MAX,
+    current_change_version,
+    customer_changes,
+    customer_scope,
+    parse_cursor,
+    sync_etag,
+)
+from utils.emi_allocation import apply_payment, load_open_emis, write_emi_updates
+from utils.event_log import event_log
+from utils.id_allocator import CUSTOMER_IDS
+from utils.idempotency import idempotent, request_idempotency_key
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import joinedload
 from utils.interest_utils import (  # noqa: F401
     calculate_flat_emi,
     calculate_reducing_emi,
@@ -24,62 +41,32 @@ from utils.interest_utils import (  # noqa: F401
 collection_bp = Blueprint("collection", __name__)
 
 
-@collection_bp.route("/submit", methods=["POST"])
-@jwt_required()
-def submit_collection():
-    identity = get_jwt_identity()
-    user = get_user_by_identity(identity)
-
-    if not user:
-        return jsonify({"msg": "User not found"}), 404
-
-    data = request.get_json()
-    loan_id = data.get("loan_id")
-    amount = float(data.get("amount"))
-    payment_mode = data.get("payment_mode", "cash")
-    latitude = data.get("latitude")
-    longitude = data.get("longitude")
-    line_id = data.get("line_id")
-
-    if not loan_id or amount is None:
-        return jsonify({"msg": "Missing required fields"}), 400
-
-    loan = Loan.query.get(loan_id)
-    if not loan:
-        return jsonify({"msg": "Loan not found"}), 404
-
-    # --- NEW: ENFORCE ENHANCED SECURITY ---
-    today = datetime.utcnow().date()
-    
-    # 1. Check if already collected today FOR THIS LOAN
-    existing_today = Collection.query.filter(
-        Collection.loan_id == loan_id,
-        db.func.date(Collection.created_at) == today
-    ).first()
-    
-    if existing_today:
-        return jsonify({"msg": "already_collected_today"}), 400
-
-    # 2. Check Time Window if line_id provided
-    if line_id:
-        line = Line.query.get(line_id)
-        if line and line.start_time and line.end_time:
-            # Current time in IST (User preference)
-            ist_now = datetime.utcnow() + timedelta(hours=5, minutes=30)
-            current_time_str = ist_now.strftime("%H:%M")
-            
-            if not (line.start_time <= current_time_str <= line.end_time):
-                return jsonify({
-                    "msg": "collection_window_closed",
-                    "window": f"{line.start_time} - {line.end_time}",
-                    "current": current_time_str
-                }), 403
-
-    # 3. Duplicate Check (Idempotency - Short term)
-    # ...
-
-    # --- PHASE 11: AI-POWERED FRAUD DETECTION & GEOFENCING ---
-    fraud_flag = False
+# Collection rules shared by /submit and /submit-batch
+VELOCITY_WINDOW_SECONDS = 30  # Less than 30 seconds between distinct collections
+GEOFENCE_LIMIT_METERS = 200
+AUTO_APPROVE_DISTANCE_METERS = 50
+BATCH_SUBMIT_LIMIT = 200
+BULK_STATUS_LIMIT = 1000
+APPROVAL_PAGE_DEFAULT = 100
+APPROVAL_PAGE_MAX = 500
+
+
+def _window_closed(line, at_utc):
+    """Returns an error payload if at_utc falls outside the line's IST window"""
+    if not (line and line.start_time and line.end_time):
+        return None
+    current_time_str = (at_utc + IST_OFFSET).strftime("%H:%M")
+    if line.start_time <= current_time_str <= line.end_time:
+        return None
+    return {
+        "msg": "collection_window_closed",
+        "window": f"{line.start_time} - {line.end_time}",
+        "current": current_time_str,
+    }
+
+
+def _fraud_checks(loan, latitude, longitude, last_collected_at, collected_at):
+    """Geofence and velocity rules. Returns (distance, fraud_reasons)."""
     fraud_reason = []
 
     # A. Geofencing Check
@@ -94,61 +81,69 @@ def submit_collection():
         distance = get_distance_meters(
             latitude, longitude, loan.customer.latitude, loan.customer.longitude
         )
-        if distance > 200:  # 200 meters threshold
-            fraud_flag = True
+        if distance > GEOFENCE_LIMIT_METERS:
             fraud_reason.append(
                 f"Geofencing Violation: {round(distance)}m away from customer profile location"
             )
 
     # B. Collection Velocity Check (Anti-Speed Collection)
     # If agent is submitting multiple collections from different customers too fast
-    last_agent_collection = (
-        Collection.query.filter_by(agent_id=user.id)
-        .order_by(Collection.created_at.desc())
-        .first()
-    )
-    if last_agent_collection:
-        time_diff = (
-            datetime.utcnow() - last_agent_collection.created_at
-        ).total_seconds()
-        if time_diff < 30:  # Less than 30 seconds between distinct collections
-            fraud_flag = True
+    if last_collected_at:
+        time_diff = abs((collected_at - last_collected_at).total_seconds())
+        if time_diff < VELOCITY_WINDOW_SECONDS:
             fraud_reason.append(
                 f"Velocity Anomaly: System detected rapid-fire collection ({int(time_diff)}s since last entry)"
             )
 
-    collect_status = "pending"  # Requires admin approval
-    if fraud_flag:
-        collect_status = "flagged"  # Admin must review
+    return distance, fraud_reason
 
+
+def _may_auto_approve(fraud_reason, payment_mode, distance):
+    """Cash collected at the customer's doorstep with no fraud signal"""
+    return (
+        not fraud_reason
+        and payment_mode == "cash"
+        and distance is not None
+        and distance < AUTO_APPROVE_DISTANCE_METERS
+    )
+
+
+def _collection_status(fraud_reason, payment_mode, distance, trusted_agent):
+    if fraud_reason:
+        return "flagged"  # Admin must review
     # --- PHASE 12: AI AUTONOMOUS MANAGER (AUTO-APPROVAL) ---
     # Goal: Zero-touch approval for trusted agents in correct location
     # Reduce manual overhead by 80% for high-trust agents
-    if (
-        not fraud_flag
-        and payment_mode == "cash"
-        and distance is not None
-        and distance < 50
-    ):
-        # Check Agent Trust History
-        # If agent has 0 flagged collections in history, they are trusted
-        flagged_count = Collection.query.filter_by(
-            agent_id=user.id, status="flagged"
-        ).count()
-        if flagged_count == 0:
-            collect_status = "approved"
-            # Log AI auto-approval
-            ai_log = LoanAuditLog(
-                loan_id=loan.id,
-                action="AI_AUTO_APPROVAL",
-                performed_by=user.id,
-                remarks="AI Autonomous Manager: Entry verified via strict geofencing and agent trust score. Auto-approved.",
-            )
-            db.session.add(ai_log)
+    if _may_auto_approve(fraud_reason, payment_mode, distance) and trusted_agent:
+        return "approved"
+    return "pending"  # Requires admin approval
+
+
+def _record_collection(
+    user, loan, collect_status, amount, payment_mode, latitude, longitude,
+    line_id, fraud_reason, created_at=None, emi_rows=None, pending_updates=None,
+):
+    """
+    Adds the collection and its audit entries to the session (caller commits)
+    and allocates approved amounts to the loan's unpaid EMIs (see
+    utils/emi_allocation.py for emi_rows/pending_updates).
+    Returns (collection, open EMI rows after allocation or None).
+    """
+    fraud_flag = bool(fraud_reason)
+    if collect_status == "approved":
+        # Log AI auto-approval
+        event_log.emit(
+            LoanAuditLog,
+            durable=True,
+            loan_id=loan.id,
+            action="AI_AUTO_APPROVAL",
+            performed_by=user.id,
+            remarks="AI Autonomous Manager: Entry verified via strict geofencing and agent trust score. Auto-approved.",
+        )
 
     # 2. Record Collection
     new_collection = Collection(
-        loan_id=loan_id,
+        loan_id=loan.id,
         agent_id=user.id,
         line_id=line_id,
         amount=amount,
@@ -157,86 +152,118 @@ def submit_collection():
         longitude=longitude,
         status=collect_status,
     )
+    new_collection.created_at = created_at or datetime.utcnow()
 
     if fraud_flag:
-        # Log suspected fraud in audit
-        audit_fraud = LoanAuditLog(
+        # Durable: committed together with the flagged collection
+        event_log.emit(
+            LoanAuditLog,
+            durable=True,
             loan_id=loan.id,
             action="FRAUD_ALERT",
             performed_by=user.id,
             remarks=f"SUSPECTED FRAUD: {', '.join(fraud_reason)}",
         )
-        db.session.add(audit_fraud)
 
     db.session.add(new_collection)
 
     # 3. Allocating Payment to EMIs (The "Brain")
     # ONLY apply financial impact if status is approved (Manual or AI)
+    open_rows = None
     if collect_status == "approved":
-        remaining = amount
-        emis = (
-            EMISchedule.query.filter_by(loan_id=loan_id)
-            .filter(EMISchedule.status != "paid")
-            .order_by(EMISchedule.due_date)
-            .all()
+        allocation_details, open_rows = apply_payment(
+            loan, amount, emi_rows, pending_updates
         )
 
-        allocation_details = []
-
-        for emi in emis:
-            if remaining <= 0:
-                break
-
-            # If emi.balance is None (legacy data), assume full amount
-            current_balance = emi.balance if emi.balance is not None else emi.amount
-
-            check_amount = min(remaining, current_balance)
-
-            new_balance = current_balance - check_amount
-            remaining -= check_amount
-
-            emi.balance = new_balance
-            if new_balance <= 0.1:  # Float tolerance
-                emi.status = "paid"
-                emi.balance = 0
-            else:
-                emi.status = "partial"
-
-            allocation_details.append(f"EMI #{emi.emi_no}: Paid {check_amount}")
-
-        # 4. Update Loan Balance
-        loan.pending_amount = max(0, loan.pending_amount - amount)
-
-        # Check for Loan Closure
-        if loan.pending_amount <= 10:  # Small tolerance for calc errors
-            # Verify all EMIs are paid
-            all_paid = (
-                not EMISchedule.query.filter_by(loan_id=loan_id)
-                .filter(EMISchedule.status != "paid")
-                .first()
-            )
-            if all_paid:
-                loan.status = "closed"
-                allocation_details.append("Loan Closed")
-
         # 5. Audit Log (Financial)
-        audit = LoanAuditLog(
+        event_log.emit(
+            LoanAuditLog,
+            durable=True,
             loan_id=loan.id,
             action="COLLECTION_APPROVED",
             performed_by=user.id,
             remarks=f"Financials updated. Collected {amount} via {payment_mode}. "
             + ", ".join(allocation_details),
         )
-        db.session.add(audit)
     else:
-        # Audit Log (Record only)
-        audit = LoanAuditLog(
+        # Audit Log (Record only, no financial impact yet)
+        event_log.emit(
+            LoanAuditLog,
+            durable=True,
             loan_id=loan.id,
             action="COLLECTION_SUBMITTED",
             performed_by=user.id,
             remarks=f"Collection of {amount} registered as {collect_status}. Financials pending approval.",
         )
-        db.session.add(audit)
+
+    return new_collection, open_rows
+
+
+@collection_bp.route("/submit", methods=["POST"])
+@jwt_required()
+@idempotent("collection_submit")
+def submit_collection():
+    identity = get_jwt_identity()
+    user = get_user_by_identity(identity)
+
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+
+    data = request.get_json()
+    loan_id = data.get("loan_id")
+    amount = float(data.get("amount"))
+    payment_mode = data.get("payment_mode", "cash")
+    latitude = data.get("latitude")
+    longitude = data.get("longitude")
+    line_id = data.get("line_id")
+
+    if not loan_id or amount is None:
+        return jsonify({"msg": "Missing required fields"}), 400
+
+    loan = Loan.query.get(loan_id)
+    if not loan:
+        return jsonify({"msg": "Loan not found"}), 404
+
+    # --- NEW: ENFORCE ENHANCED SECURITY ---
+    today = business_date()
+
+    # 1. Check if already collected today FOR THIS LOAN (ix_collections_loan_date).
+    # Clients sending an Idempotency-Key are protected against retries by the
+    # key instead, so a genuine second (partial) payment is allowed.
+    if not request_idempotency_key():
+        existing_today = Collection.query.filter(
+            Collection.loan_id == loan_id,
+            Collection.collection_date == today
+        ).first()
+
+        if existing_today:
+            return jsonify({"msg": "already_collected_today"}), 400
+
+    # 2. Check Time Window if line_id provided
+    if line_id:
+        closed = _window_closed(Line.query.get(line_id), datetime.utcnow())
+        if closed:
+            return jsonify(closed), 403
+
+    # 3. Duplicate Check (Idempotency): handled by @idempotent above
+
+    # --- PHASE 11: AI-POWERED FRAUD DETECTION & GEOFENCING ---
+    # Agent counters (utils/agent_stats.py), locked until commit
+    stats = lock_agent_stats(user.id)
+    distance, fraud_reason = _fraud_checks(
+        loan, latitude, longitude, stats.last_collection_at, datetime.utcnow()
+    )
+
+    # Check Agent Trust History
+    # If agent has 0 flagged collections in history, they are trusted
+    trusted_agent = stats.flagged_count == 0
+    collect_status = _collection_status(fraud_reason, payment_mode, distance, trusted_agent)
+
+    new_collection, _ = _record_collection(
+        user, loan, collect_status, amount, payment_mode, latitude, longitude,
+        line_id, fraud_reason,
+    )
+    record_new_collection(stats, new_collection)
 
     try:
         db.session.commit()
@@ -247,7 +274,7 @@ def submit_collection():
                     "id": new_collection.id,
                     "status": new_collection.status,
                     "loan_balance": loan.pending_amount,
-                    "fraud_warning": fraud_reason if fraud_flag else None,
+                    "fraud_warning": fraud_reason if fraud_reason else None,
                 }
             ),
             201,
@@ -257,21 +284,254 @@ def submit_collection():
         return jsonify({"msg": str(e)}), 500
 
 
+def _parse_captured_at(value, received_at):
+    """
+    Client capture time (ISO-8601 UTC or epoch milliseconds) for offline
+    replay. Missing, unparseable or future values fall back to received_at.
+    """
+    if value in (None, ""):
+        return received_at
+    try:
+        if isinstance(value, (int, float)):
+            captured = datetime.utcfromtimestamp(value / 1000.0)
+        else:
+            captured = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+            if captured.tzinfo is not None:
+                captured = captured.astimezone(timezone.utc).replace(tzinfo=None)
+    except (ValueError, OverflowError, OSError):
+        return received_at
+    if captured > received_at + timedelta(minutes=5):
+        return received_at
+    return captured
+
+
+def _nearest(sorted_times, at):
+    """Closest timestamp to `at` in a sorted list, or None"""
+    i = bisect.bisect_left(sorted_times, at)
+    candidates = sorted_times[max(0, i - 1): i + 1]
+    return min(candidates, key=lambda t: abs((t - at).total_seconds()), default=None)
+
+
+@collection_bp.route("/submit-batch", methods=["POST"])
+@jwt_required()
+@idempotent("collection_batch")
+def submit_collection_batch():
+    """
+    Replays an offline queue: {"collections": [{loan_id, amount, payment_mode,
+    latitude, longitude, line_id, captured_at, client_ref}, ...]}.
+    Items are processed in order with the same rules as /submit, using each
+    item's captured_at for the velocity and time-window checks, and
+    committed once. Returns one result per item.
+    """
+    identity = get_jwt_identity()
+    user = get_user_by_identity(identity)
+
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+
+    data = request.get_json() or {}
+    items = data.get("collections")
+    if not isinstance(items, list) or not items:
+        return jsonify({"msg": "collections list is required"}), 400
+    if len(items) > BATCH_SUBMIT_LIMIT:
+        return jsonify({"msg": f"At most {BATCH_SUBMIT_LIMIT} collections per batch"}), 400
+
+    received_at = datetime.utcnow()
+    results = [None] * len(items)
+    parsed = []
+    for index, item in enumerate(items):
+        item = item if isinstance(item, dict) else {}
+        result = {"index": index, "client_ref": item.get("client_ref")}
+        results[index] = result
+        try:
+            amount = float(item.get("amount"))
+        except (TypeError, ValueError):
+            amount = None
+        if not item.get("loan_id") or amount is None:
+            result.update(status="error", msg="Missing required fields")
+            continue
+        try:
+            # Ids may arrive as strings; the lookups below are keyed by int
+            item = dict(
+                item,
+                loan_id=int(item["loan_id"]),
+                line_id=int(item["line_id"]) if item.get("line_id") else None,
+            )
+        except (TypeError, ValueError):
+            result.update(status="error", msg="Invalid loan_id or line_id")
+            continue
+        parsed.append((index, item, amount, _parse_captured_at(item.get("captured_at"), received_at)))
+
+    # Prefetch everything the rules need in a handful of queries
+    loan_ids = {item["loan_id"] for _, item, _, _ in parsed}
+    line_ids = {item["line_id"] for _, item, _, _ in parsed if item.get("line_id")}
+    loans = {
+        loan.id: loan
+        for loan in Loan.query.options(joinedload(Loan.customer)).filter(Loan.id.in_(loan_ids))
+    }
+    lines = {line.id: line for line in Line.query.filter(Line.id.in_(line_ids))} if line_ids else {}
+    emis_by_loan = load_open_emis(loan_ids)
+    emi_updates = []
+
+    collected_days = set()
+    if not request_idempotency_key():
+        days = {business_date(captured_at) for _, _, _, captured_at in parsed}
+        collected_days = set(
+            db.session.query(Collection.loan_id, Collection.collection_date).filter(
+                Collection.loan_id.in_(loan_ids), Collection.collection_date.in_(days)
+            )
+        )
+
+    # Agent's collection times around the batch, for nearest-neighbour velocity checks
+    window = timedelta(seconds=VELOCITY_WINDOW_SECONDS)
+    capture_times = [captured_at for _, _, _, captured_at in parsed]
+    window_start = min(capture_times, default=received_at) - window
+    window_end = max(capture_times, default=received_at) + window
+    agent_times = sorted(
+        created_at
+        for (created_at,) in db.session.query(Collection.created_at).filter(
+            Collection.agent_id == user.id,
+            # Narrows the scan to ix_collections_agent_date_mode
+            Collection.collection_date.between(
+                business_date(window_start), business_date(window_end)
+            ),
+            Collection.created_at >= window_start,
+            Collection.created_at <= window_end,
+        )
+    )
+    stats = lock_agent_stats(user.id)
+
+    recorded = []
+    for index, item, amount, captured_at in parsed:
+        result = results[index]
+        loan = loans.get(item["loan_id"])
+        if not loan:
+            result.update(status="error", msg="Loan not found")
+            continue
+
+        day = business_date(captured_at)
+        if not request_idempotency_key():
+            if (loan.id, day) in collected_days:
+                result.update(status="error", msg="already_collected_today")
+                continue
+
+        line_id = item.get("line_id")
+        if line_id:
+            closed = _window_closed(lines.get(line_id), captured_at)
+            if closed:
+                result.update(status="error", **closed)
+                continue
+
+        payment_mode = item.get("payment_mode", "cash")
+        latitude, longitude = item.get("latitude"), item.get("longitude")
+        distance, fraud_reason = _fraud_checks(
+            loan, latitude, longitude, _nearest(agent_times, captured_at), captured_at
+        )
+        collect_status = _collection_status(
+            fraud_reason, payment_mode, distance, trusted_agent=stats.flagged_count == 0
+        )
+        collection, open_rows = _record_collection(
+            user, loan, collect_status, amount, payment_mode, latitude, longitude,
+            line_id, fraud_reason, created_at=captured_at,
+            emi_rows=emis_by_loan.get(loan.id, []), pending_updates=emi_updates,
+        )
+        if open_rows is not None:
+            emis_by_loan[loan.id] = open_rows
+
+        # Later items see this one, exactly as sequential /submit calls would
+        collected_days.add((loan.id, day))
+        bisect.insort(agent_times, captured_at)
+        record_new_collection(stats, collection)
+        recorded.append((result, collection, loan, fraud_reason))
+
+    try:
+        write_emi_updates(emi_updates)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), 500
+
+    for result, collection, loan, fraud_reason in recorded:
+        result.update(
+            status="ok",
+            id=collection.id,
+            collection_status=collection.status,
+            loan_balance=loan.pending_amount,
+            fraud_warning=fraud_reason or None,
+        )
+
+    return (
+        jsonify(
+            {
+                "msg": "batch_processed",
+                "submitted": len(recorded),
+                "failed": len(items) - len(recorded),
+                "results": results,
+            }
+        ),
+        200,
+    )
+
+
 @collection_bp.route("/customers", methods=["GET"])
 @jwt_required()
 def get_customers():
-    customers = Customer.query.all()
+    identity = get_jwt_identity()
+    user = get_user_by_identity(identity)
+
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+
+    # RLS: Workers only see their own customers (Direct or via Lines).
+    # Devices should prefer /customers/sync, which only sends changes.
+    query = db.session.query(Customer.id, Customer.name, Customer.mobile_number, Customer.area)
+    scope = customer_scope(user)
+    if scope is not None:
+        query = query.filter(scope)
     return (
         jsonify(
             [
                 {"id": c.id, "name": c.name, "mobile": c.mobile_number, "area": c.area}
-                for c in customers
+                for c in query
             ]
         ),
         200,
     )
 
 
+@collection_bp.route("/customers/sync", methods=["GET"])
+@jwt_required()
+def sync_customer_list():
+    """
+    Delta sync: ?cursor=<cursor from the last response>&limit=<n>.
+    Returns customers added or changed since the cursor, ids to drop in
+    "deleted", the next cursor and has_more. Omit the cursor for a full
+    sync. Supports If-None-Match (304 when nothing changed).
+    """
+    identity = get_jwt_identity()
+    user = get_user_by_identity(identity)
+
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+
+    raw_cursor = request.args.get("cursor", "")
+    try:
+        cursor = parse_cursor(raw_cursor)
+    except ValueError:
+        return jsonify({"msg": "Invalid cursor"}), 400
+    limit = max(1, min(request.args.get("limit", SYNC_PAGE_DEFAULT, type=int), SYNC_PAGE_MAX))
+
+    snapshot = current_change_version()
+    etag = sync_etag(user, raw_cursor, limit, snapshot)
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        response = jsonify(customer_changes(user, cursor, limit, snapshot))
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
 @collection_bp.route("/customers", methods=["POST"])
 @jwt_required()
 def create_customer():
@@ -296,15 +556,7 @@ def create_customer():
         return jsonify({"msg": "Name and Mobile are required"}), 400
 
     # Generate Unique Customer ID
-    current_year = datetime.now().year
-    count = Customer.query.filter(
-        Customer.created_at >= datetime(current_year, 1, 1)
-    ).count()
-    cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
-
-    while Customer.query.filter_by(customer_id=cust_unique_id).first():
-        count += 1
-        cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
+    cust_unique_id = CUSTOMER_IDS.next()
 
     new_customer = Customer(
         name=name,
@@ -355,50 +607,154 @@ def get_customer_loans(customer_id):
     )
 
 
-@collection_bp.route("/pending-collections", methods=["GET"])
-@jwt_required()
-def get_pending_collections():
+def _require_admin():
     identity = get_jwt_identity()
     user = get_user_by_identity(identity)
 
     if not user:
-        return jsonify({"msg": "Admin Access Required"}), 403
+        return None, (jsonify({"msg": "Admin Access Required"}), 403)
 
     # Normalize role check
     current_role = user.role.value if hasattr(user.role, 'value') else user.role
     if current_role != UserRole.ADMIN.value:
-        return jsonify({"msg": "Admin Access Required"}), 403
+        return None, (jsonify({"msg": "Admin Access Required"}), 403)
+    return user, None
 
-    # Get all pending and flagged collections with joins
-    collections = (
-        Collection.query.filter(Collection.status.in_(["pending", "flagged"]))
-        .order_by(Collection.created_at.desc())
-        .all()
+
+def _approval_queue_query(statuses=("pending", "flagged")):
+    """Pending/flagged collections with loan, customer and agent in one joined query"""
+    return (
+        db.session.query(
+            Collection.id,
+            Collection.amount,
+            Collection.payment_mode,
+            Collection.status,
+            Collection.created_at,
+            Collection.latitude,
+            Collection.longitude,
+            Loan.loan_id,
+            Customer.name.label("customer_name"),
+            Customer.area.label("customer_area"),
+            User.name.label("agent_name"),
+        )
+        .outerjoin(Loan, Collection.loan_id == Loan.id)
+        .outerjoin(Customer, Loan.customer_id == Customer.id)
+        .outerjoin(User, Collection.agent_id == User.id)
+        .filter(Collection.status.in_(statuses))
+        .order_by(Collection.created_at.desc(), Collection.id.desc())
     )
 
-    result = []
-    for c in collections:
-        loan = Loan.query.get(c.loan_id)
-        customer = Customer.query.get(loan.customer_id) if loan else None
-        agent = User.query.get(c.agent_id)
 
-        result.append(
+def _queue_entry(row):
+    return {
+        "id": row.id,
+        "amount": row.amount,
+        "payment_mode": row.payment_mode,
+        "status": row.status,
+        "created_at": row.created_at.isoformat() + "Z",
+        "customer_name": row.customer_name or "Unknown",
+        "customer_area": row.customer_area or "",
+        "loan_id": row.loan_id or "",
+        "agent_name": row.agent_name or "Unknown",
+        "latitude": row.latitude,
+        "longitude": row.longitude,
+    }
+
+
+@collection_bp.route("/pending-collections", methods=["GET"])
+@jwt_required()
+def get_pending_collections():
+    user, error = _require_admin()
+    if error:
+        return error
+
+    # Get all pending and flagged collections with joins
+    return jsonify([_queue_entry(row) for row in _approval_queue_query()]), 200
+
+
+@collection_bp.route("/approval-queue", methods=["GET"])
+@jwt_required()
+def get_approval_queue():
+    """
+    Keyset-paginated /pending-collections: ?limit=<n>&cursor=<next_cursor>
+    &status=pending|flagged&agent_id=<id>. Newest first.
+    """
+    user, error = _require_admin()
+    if error:
+        return error
+
+    limit = max(1, min(request.args.get("limit", APPROVAL_PAGE_DEFAULT, type=int), APPROVAL_PAGE_MAX))
+    status = request.args.get("status")
+    if status and status not in ("pending", "flagged"):
+        return jsonify({"msg": "Invalid status"}), 400
+
+    query = _approval_queue_query((status,) if status else ("pending", "flagged"))
+    agent_id = request.args.get("agent_id", type=int)
+    if agent_id:
+        query = query.filter(Collection.agent_id == agent_id)
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            created_at, _, last_id = cursor.partition("|")
+            created_at, last_id = datetime.fromisoformat(created_at), int(last_id)
+        except ValueError:
+            return jsonify({"msg": "Invalid cursor"}), 400
+        query = query.filter(
+            (Collection.created_at < created_at)
+            | ((Collection.created_at == created_at) & (Collection.id < last_id))
+        )
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return (
+        jsonify(
             {
-                "id": c.id,
-                "amount": c.amount,
-                "payment_mode": c.payment_mode,
-                "status": c.status,
-                "created_at": c.created_at.isoformat() + "Z",
-                "customer_name": customer.name if customer else "Unknown",
-                "customer_area": customer.area if customer else "",
-                "loan_id": loan.loan_id if loan else "",
-                "agent_name": agent.name if agent else "Unknown",
-                "latitude": c.latitude,
-                "longitude": c.longitude,
+                "items": [_queue_entry(row) for row in rows],
+                "next_cursor": (
+                    f"{rows[-1].created_at.isoformat()}|{rows[-1].id}" if has_more else None
+                ),
+                "has_more": has_more,
             }
-        )
+        ),
+        200,
+    )
 
-    return jsonify(result), 200
+
+def _apply_status_change(
+    user, collection, status, loan, stats, emi_rows=None, pending_updates=None
+):
+    """
+    Sets a reviewed collection's status (caller commits). Approving applies
+    the amount to the loan's EMIs; see utils/emi_allocation.py for
+    emi_rows/pending_updates. Returns the loan's open EMI rows afterwards,
+    or None when nothing was allocated.
+    """
+    old_status = collection.status
+    collection.status = status
+    if stats is not None:
+        record_status_change(stats, old_status, status)
+
+    if status != "approved" or old_status == "approved" or not loan:
+        return None
+
+    # Applying financial update only now
+    allocation_details, open_rows = apply_payment(
+        loan, collection.amount, emi_rows, pending_updates
+    )
+
+    # Audit log
+    event_log.emit(
+        LoanAuditLog,
+        durable=True,
+        loan_id=loan.id,
+        action="COLLECTION_APPROVED_BY_ADMIN",
+        performed_by=user.id,
+        remarks=f"Admin manual approval. Collected {collection.amount}. "
+        + ", ".join(allocation_details),
+    )
+    return open_rows
 
 
 @collection_bp.route("/<int:collection_id>/status", methods=["PATCH"])
@@ -425,63 +781,105 @@ def update_collection_status(collection_id):
     if not collection:
         return jsonify({"msg": "Collection not found"}), 404
 
-    old_status = collection.status
-    collection.status = status
-
-    if status == "approved" and old_status != "approved":
-        loan = Loan.query.get(collection.loan_id)
-        if loan:
-            # Applying financial update only now
-
-            remaining = collection.amount
-            emis = (
-                EMISchedule.query.filter_by(loan_id=loan.id)
-                .filter(EMISchedule.status != "paid")
-                .order_by(EMISchedule.due_date)
-                .all()
-            )
-
-            allocation_details = []
-            for emi in emis:
-                if remaining <= 0:
-                    break
-                current_balance = emi.balance if emi.balance is not None else emi.amount
-                check_amount = min(remaining, current_balance)
-                emi.balance = current_balance - check_amount
-                remaining -= check_amount
-                if emi.balance <= 0.1:
-                    emi.status = "paid"
-                    emi.balance = 0
-                else:
-                    emi.status = "partial"
-                allocation_details.append(f"EMI #{emi.emi_no}: Paid {check_amount}")
-
-            loan.pending_amount = max(0, loan.pending_amount - collection.amount)
-            if loan.pending_amount <= 10:
-                all_paid = (
-                    not EMISchedule.query.filter_by(loan_id=loan.id)
-                    .filter(EMISchedule.status != "paid")
-                    .first()
-                )
-                if all_paid:
-                    loan.status = "closed"
-
-            # Audit log
-            audit = LoanAuditLog(
-                loan_id=loan.id,
-                action="COLLECTION_APPROVED_BY_ADMIN",
-                performed_by=user.id,
-                remarks=f"Admin manual approval. Collected {collection.amount}. "
-                + ", ".join(allocation_details),
-            )
-            db.session.add(audit)
-    else:
-        collection.status = status
+    stats = lock_agent_stats(collection.agent_id) if collection.agent_id else None
+    loan = Loan.query.get(collection.loan_id)
+    _apply_status_change(user, collection, status, loan, stats)
 
     db.session.commit()
     return jsonify({"msg": "collection_updated_successfully", "status": status}), 200
 
 
+@collection_bp.route("/bulk-status", methods=["POST"])
+@jwt_required()
+def bulk_update_collection_status():
+    """
+    {"ids": [...], "status": "approved"|"rejected"} in one transaction.
+    Collections are grouped per loan and applied oldest first, so each
+    loan's EMIs are loaded once and written back with one UPDATE.
+    """
+    identity = get_jwt_identity()
+    user = get_user_by_identity(identity)
+
+    if not user:
+        return jsonify({"msg": "Access Denied"}), 403
+
+    # Normalize role check
+    current_role = user.role.value if hasattr(user.role, 'value') else user.role
+    if current_role == UserRole.FIELD_AGENT.value:
+        return jsonify({"msg": "Access Denied"}), 403
+
+    data = request.get_json() or {}
+    status = data.get("status")
+    if status not in ["approved", "rejected"]:
+        return jsonify({"msg": "Invalid status"}), 400
+
+    try:
+        ids = list(dict.fromkeys(int(i) for i in data.get("ids") or []))
+    except (TypeError, ValueError):
+        return jsonify({"msg": "ids must be a list of collection ids"}), 400
+    if not ids:
+        return jsonify({"msg": "ids list is required"}), 400
+    if len(ids) > BULK_STATUS_LIMIT:
+        return jsonify({"msg": f"At most {BULK_STATUS_LIMIT} collections per request"}), 400
+
+    # Row locks stop two reviewers from approving (and allocating) the same entry twice
+    collections = (
+        Collection.query.filter(Collection.id.in_(ids))
+        .order_by(Collection.loan_id, Collection.created_at, Collection.id)
+        .with_for_update()
+        .all()
+    )
+    found = {c.id for c in collections}
+    results = {
+        collection_id: {"id": collection_id, "status": "error", "msg": "Collection not found"}
+        for collection_id in ids
+        if collection_id not in found
+    }
+
+    loan_ids = {c.loan_id for c in collections}
+    loans = {loan.id: loan for loan in Loan.query.filter(Loan.id.in_(loan_ids))} if loan_ids else {}
+    approving = {
+        c.loan_id for c in collections if status == "approved" and c.status != "approved"
+    }
+    emis_by_loan = load_open_emis(approving) if approving else {}
+    agent_stats = {
+        agent_id: lock_agent_stats(agent_id)
+        for agent_id in sorted({c.agent_id for c in collections if c.agent_id})
+    }
+    emi_updates = []
+
+    for collection in collections:
+        old_status = collection.status
+        open_rows = _apply_status_change(
+            user, collection, status, loans.get(collection.loan_id),
+            agent_stats.get(collection.agent_id),
+            emi_rows=emis_by_loan.get(collection.loan_id, []),
+            pending_updates=emi_updates,
+        )
+        if open_rows is not None:
+            emis_by_loan[collection.loan_id] = open_rows
+        results[collection.id] = {"id": collection.id, "status": "ok", "previous": old_status}
+
+    try:
+        write_emi_updates(emi_updates)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), 500
+
+    return (
+        jsonify(
+            {
+                "msg": "collections_updated_successfully",
+                "status": status,
+                "updated": len(collections),
+                "results": [results[collection_id] for collection_id in ids],
+            }
+        ),
+        200,
+    )
+
+
 @collection_bp.route("/stats/financials", methods=["GET"])
 @jwt_required()
 def get_financial_stats():
@@ -507,11 +905,11 @@ def get_financial_stats():
         .scalar()
         or 0
     )
-    today = datetime.utcnow().date()
+    today = business_date()
     today_total = (
         db.session.query(db.func.sum(Collection.amount))
         .filter(
-            db.func.date(Collection.created_at) == today,
+            Collection.collection_date == today,
             Collection.status == "approved",
         )
         .scalar()
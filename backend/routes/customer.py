@@ -10,14 +10,87 @@ from models import (
     Loan,
     PassbookToken,
     Collection,
+    DuplicateCluster,
+    DuplicateClusterMember,
 )
+from collections import defaultdict
 from datetime import datetime, timedelta
 import uuid
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only, selectinload
 from utils.auth_helpers import get_user_by_identity
+from utils.customer_search import customer_search
+from utils.customer_sync import customer_scope, mark_customers_changed
+from utils.duplicate_detection import find_similar_customers
+from utils.id_allocator import CUSTOMER_IDS
+from utils.match_keys import customer_match_keys, search_key
 
 customer_bp = Blueprint("customer", __name__)
 
 
+SYNC_INSERT_ATTEMPTS = 3
+
+
+def _sync_rows(customers_to_sync, user, success_map, error_map):
+    """
+    Validates the upload, resolves duplicates with one IN query and returns
+    (local_id, row) pairs for the customers to insert. Fills success_map
+    with duplicates and error_map with invalid entries.
+    """
+    candidates = []
+    for cust_data in customers_to_sync:
+        local_id = cust_data.get("local_id")
+        try:
+            name, mobile = cust_data["name"], cust_data["mobile_number"]
+        except Exception as e:
+            error_map[local_id] = str(e)
+            continue
+        if not name or not mobile:
+            error_map[local_id] = "Name and Mobile are required"
+            continue
+        candidates.append((local_id, cust_data, name, mobile))
+
+    mobiles = {mobile for _, _, _, mobile in candidates}
+    existing = {
+        mobile: (server_id, customer_id)
+        for server_id, customer_id, mobile in db.session.query(
+            Customer.id, Customer.customer_id, Customer.mobile_number
+        ).filter(Customer.mobile_number.in_(mobiles))
+    } if mobiles else {}
+
+    rows = []
+    first_upload = {}  # mobile -> local_id of the first new customer using it
+    for local_id, cust_data, name, mobile in candidates:
+        if mobile in existing:
+            # If already exists, return the existing ID
+            server_id, customer_id = existing[mobile]
+            success_map[local_id] = {
+                "server_id": server_id,
+                "customer_id": customer_id,
+                "status": "duplicate",
+            }
+            continue
+        if mobile in first_upload:
+            # Same mobile twice in one upload: the later entry maps to the first
+            success_map[local_id] = {"status": "duplicate", "same_as": first_upload[mobile]}
+            continue
+        first_upload[mobile] = local_id
+        rows.append((local_id, {
+            "name": name,
+            "mobile_number": mobile,
+            "address": cust_data.get("address"),
+            "area": cust_data.get("area"),
+            "assigned_worker_id": user.id if user.role == UserRole.FIELD_AGENT else None,
+            "id_proof_number": cust_data.get("id_proof_number"),
+            "profile_image": cust_data.get("profile_image"),
+            "status": "active",
+            "latitude": cust_data.get("latitude"),
+            "longitude": cust_data.get("longitude"),
+            "created_at": datetime.utcnow(),
+        }))
+    return rows
+
+
 @customer_bp.route("/sync", methods=["POST"])
 @jwt_required()
 def sync_customers():
@@ -34,77 +107,71 @@ def sync_customers():
         return jsonify({"msg": "User not found"}), 404
 
     data = request.get_json()
-    print(f"Request data: {data}")
     customers_to_sync = data.get("customers", [])
     print(f"Number of customers to sync: {len(customers_to_sync)}")
 
-    success_map = {}
-    error_map = {}
-
-    current_year = datetime.now().year
-
-    for cust_data in customers_to_sync:
-        local_id = cust_data.get("local_id")
-        try:
-            # Check for duplicate by mobile number
-            existing = Customer.query.filter_by(
-                mobile_number=cust_data["mobile_number"]
-            ).first()
-            if existing:
-                # If already exists, return the existing ID
-                success_map[local_id] = {
-                    "server_id": existing.id,
-                    "customer_id": existing.customer_id,
-                    "status": "duplicate",
-                }
-                continue
-
-            # Generate Unique Customer ID
-            count = Customer.query.filter(
-                Customer.created_at >= datetime(current_year, 1, 1)
-            ).count()
-            cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
-
-            # Double check uniqueness loop
-            while Customer.query.filter_by(customer_id=cust_unique_id).first():
-                count += 1
-                cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
-
-            new_customer = Customer(
-                name=cust_data["name"],
-                mobile_number=cust_data["mobile_number"],
-                address=cust_data.get("address"),
-                area=cust_data.get("area"),
-                customer_id=cust_unique_id,
-                assigned_worker_id=(
-                    user.id if user.role == UserRole.FIELD_AGENT else None
+    for attempt in range(SYNC_INSERT_ATTEMPTS):
+        success_map = {}
+        error_map = {}
+        rows = _sync_rows(customers_to_sync, user, success_map, error_map)
+        if not rows:
+            break
+
+        # One reserved block of CUST-YYYY-NNNNNN IDs and one multi-row INSERT
+        customer_ids = CUSTOMER_IDS.take(len(rows))
+        values = [
+            dict(
+                row,
+                customer_id=customer_id,
+                **customer_match_keys(
+                    row["name"], row["mobile_number"], customer_id, row["area"]
                 ),
-                id_proof_number=cust_data.get("id_proof_number"),
-                profile_image=cust_data.get("profile_image"),
-                status="active",
-                latitude=cust_data.get("latitude"),
-                longitude=cust_data.get("longitude"),
-                created_at=datetime.utcnow(),
             )
+            for (_, row), customer_id in zip(rows, customer_ids)
+        ]
+        try:
+            # executemany INSERT, then the new ids by mobile: MySQL has no
+            # INSERT ... RETURNING
+            db.session.execute(db.insert(Customer), values)
+            inserted = db.session.query(Customer.id, Customer.mobile_number).filter(
+                Customer.mobile_number.in_([row["mobile_number"] for row in values])
+            ).all()
+            # Core INSERTs skip the flush hook; stamped with one version at commit
+            mark_customers_changed(
+                db.session, Customer.id.in_([server_id for server_id, _ in inserted])
+            )
+            db.session.commit()
+        except IntegrityError as e:
+            # A concurrent sync created one of these mobiles: re-check and retry
+            db.session.rollback()
+            print(f"Sync insert conflict (attempt {attempt + 1}): {e.orig}")
+            if attempt + 1 == SYNC_INSERT_ATTEMPTS:
+                for local_id, _ in rows:
+                    error_map[local_id] = str(e.orig)
+            continue
 
-            db.session.add(new_customer)
-            db.session.flush()
-
+        server_ids = dict((mobile, server_id) for server_id, mobile in inserted)
+        for (local_id, row), customer_id in zip(rows, customer_ids):
             success_map[local_id] = {
-                "server_id": new_customer.id,
-                "customer_id": new_customer.customer_id,
+                "server_id": server_ids[row["mobile_number"]],
+                "customer_id": customer_id,
                 "status": "created",
             }
+        break
 
-        except Exception as e:
-            db.session.rollback()
-            error_map[local_id] = str(e)
+    # Entries repeating a mobile from the same upload share its result
+    for local_id, result in list(success_map.items()):
+        if "same_as" not in result:
             continue
-
-    db.session.commit()
+        first = result["same_as"]
+        if first in success_map:
+            success_map[local_id] = dict(success_map[first], status="duplicate")
+        else:
+            del success_map[local_id]
+            error_map[local_id] = error_map.get(first, "Sync failed")
 
     response_data = {"msg": "Sync complete", "synced": success_map, "errors": error_map}
-    print(f"=== SYNC RESPONSE: {response_data} ===")
+    print(f"=== SYNC RESPONSE: {len(success_map)} synced, {len(error_map)} errors ===")
     return jsonify(response_data), 200
 
 
@@ -137,22 +204,7 @@ def create_customer_online():
             )
 
         # Generate Unique Customer ID
-        current_year = datetime.now().year
-        # Fix PostgreSQL Date Comparison logic
-        try:
-             count = Customer.query.filter(
-                db.extract('year', Customer.created_at) == current_year
-            ).count()
-        except:
-             # Fallback for SQLite/MySQL if extract fails
-             count = Customer.query.filter(
-                Customer.created_at >= datetime(current_year, 1, 1)
-            ).count()
-        cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
-
-        while Customer.query.filter_by(customer_id=cust_unique_id).first():
-            count += 1
-            cust_unique_id = f"CUST-{current_year}-{str(count + 1).zfill(6)}"
+        cust_unique_id = CUSTOMER_IDS.next()
 
         new_customer = Customer(
             name=data["name"],
@@ -232,73 +284,147 @@ def get_customer_by_qr(qr_code):
     )
 
 
+# /list fields: name in the response -> Customer columns it needs
+CUSTOMER_LIST_FIELDS = {
+    "id": (),
+    "customer_id": ("customer_id",),
+    "name": ("name",),
+    "mobile": ("mobile_number",),
+    "area": ("area",),
+    "address": ("address",),
+    "active_loans": (),
+    "status": ("status",),
+    "assigned_worker_id": ("assigned_worker_id",),
+}
+CUSTOMER_PAGE_MAX = 500
+
+
+def _customer_list_entry(c, fields):
+    entry = {}
+    for field in fields:
+        if field == "active_loans":
+            entry[field] = [
+                {
+                    "loan_id": loan.loan_id,
+                    "amount": loan.principal_amount,
+                    "pending": loan.pending_amount,
+                    "next_emi_date": loan.start_date.strftime("%Y-%m-%d"),
+                }
+                for loan in c.loans
+                if loan.status == "active"
+            ]
+        elif field == "mobile":
+            entry[field] = c.mobile_number
+        else:
+            entry[field] = getattr(c, field)
+    return entry
+
+
 @customer_bp.route("/list", methods=["GET"])
 @jwt_required()
 def list_customers():
+    """
+    ?page=<n>&per_page=<n>, or keyset paging with ?cursor= (empty for the
+    first page, then next_cursor) which stays fast on deep pages.
+    ?fields=id,name,... limits the customer fields returned;
+    ?include_total=0 skips the count.
+    """
     identity = get_jwt_identity()
     user = get_user_by_identity(identity)
 
     if not user:
         return jsonify({"msg": "User not found"}), 404
 
-    page = request.args.get("page", 1, type=int)
-    per_page = request.args.get("per_page", 50, type=int)
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = max(1, min(request.args.get("per_page", 50, type=int), CUSTOMER_PAGE_MAX))
     search = request.args.get("search", "")
+    cursor = request.args.get("cursor")
+    include_total = request.args.get("include_total", "1" if cursor is None else "0") not in (
+        "0",
+        "false",
+    )
 
-    query = Customer.query
+    fields = list(CUSTOMER_LIST_FIELDS)
+    if request.args.get("fields"):
+        fields = [f.strip() for f in request.args["fields"].split(",") if f.strip()]
+        unknown = [f for f in fields if f not in CUSTOMER_LIST_FIELDS]
+        if unknown:
+            return jsonify({"msg": f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    columns = {"created_at"}
+    for field in fields:
+        columns.update(CUSTOMER_LIST_FIELDS[field])
+    query = Customer.query.options(
+        load_only(*[getattr(Customer, name) for name in sorted(columns)])
+    )
+    if "active_loans" in fields:
+        # One IN query for the page's active loans instead of one per customer
+        query = query.options(selectinload(Customer.loans.and_(Loan.status == "active")))
 
     # RLS: Workers only see their own customers (Direct or via Lines)
-    if user.role == UserRole.FIELD_AGENT:
-        from models import Line, LineCustomer
-        query = query.distinct().outerjoin(
-            LineCustomer, Customer.id == LineCustomer.customer_id
-        ).outerjoin(
-            Line, LineCustomer.line_id == Line.id
-        ).filter(
-            (Customer.assigned_worker_id == user.id) | (Line.agent_id == user.id)
+    scope = customer_scope(user)
+    if scope is not None:
+        query = query.filter(scope)
+
+    total = None
+    if cursor is not None:
+        if search:
+            return jsonify({"msg": "cursor paging cannot be combined with search"}), 400
+        if include_total:
+            total = query.order_by(None).count()
+        if cursor:
+            try:
+                created_at, _, last_id = cursor.partition("|")
+                created_at, last_id = datetime.fromisoformat(created_at), int(last_id)
+            except ValueError:
+                return jsonify({"msg": "Invalid cursor"}), 400
+            query = query.filter(
+                (Customer.created_at < created_at)
+                | ((Customer.created_at == created_at) & (Customer.id < last_id))
+            )
+        rows = (
+            query.order_by(Customer.created_at.desc(), Customer.id.desc())
+            .limit(per_page + 1)
+            .all()
         )
-
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (Customer.name.ilike(search_term))
-            | (Customer.mobile_number.ilike(search_term))
-            | (Customer.customer_id.ilike(search_term))
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        return (
+            jsonify(
+                {
+                    "customers": [_customer_list_entry(c, fields) for c in rows],
+                    "next_cursor": (
+                        f"{rows[-1].created_at.isoformat()}|{rows[-1].id}" if has_more else None
+                    ),
+                    "has_more": has_more,
+                    "total": total,
+                }
+            ),
+            200,
         )
 
-    pagination = query.order_by(Customer.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-
+    if search:
+        # Ranked matches on name / mobile / customer_id (utils/customer_search.py)
+        query = customer_search.apply(query, search, scope)
+    else:
+        query = query.order_by(Customer.created_at.desc(), Customer.id.desc())
+
+    if include_total:
+        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        rows, has_more = pagination.items, pagination.has_next
+        total, pages = pagination.total, pagination.pages
+    else:
+        rows = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows, pages = rows[:per_page], None
     return (
         jsonify(
             {
-                "customers": [
-                    {
-                        "id": c.id,
-                        "customer_id": c.customer_id,
-                        "name": c.name,
-                        "mobile": c.mobile_number,
-                        "area": c.area,
-                        "address": c.address,
-                        "active_loans": [
-                            {
-                                "loan_id": loan.loan_id,
-                                "amount": loan.principal_amount,
-                                "pending": loan.pending_amount,
-                                "next_emi_date": loan.start_date.strftime("%Y-%m-%d"),
-                            }
-                            for loan in c.loans
-                            if loan.status == "active"
-                        ],
-                        "status": c.status,
-                        "assigned_worker_id": c.assigned_worker_id,
-                    }
-                    for c in pagination.items
-                ],
-                "total": pagination.total,
-                "pages": pagination.pages,
+                "customers": [_customer_list_entry(c, fields) for c in rows],
+                "total": total,
+                "pages": pages,
                 "current_page": page,
+                "has_more": has_more,
             }
         ),
         200,
@@ -506,26 +632,23 @@ def check_duplicate():
                 }
             )
 
-    # Fuzzy name + area match
-    if name and area:
-        similar = (
-            Customer.query.filter(
-                Customer.name.ilike(f"%{name}%"), Customer.area == area
-            )
-            .limit(5)
-            .all()
-        )
-
-        for sim in similar:
+    # Fuzzy match on phonetic name, area and mobile (utils/duplicate_detection.py)
+    if name:
+        for sim, score in find_similar_customers(name, mobile, area):
             if sim.mobile_number != mobile:
                 duplicates.append(
                     {
-                        "type": "similar_name_area",
+                        "type": (
+                            "similar_name_area"
+                            if area and sim.area_key == search_key(area)
+                            else "similar"
+                        ),
                         "customer_id": sim.customer_id,
                         "name": sim.name,
                         "mobile": sim.mobile_number,
                         "area": sim.area,
-                        "confidence": "medium",
+                        "score": score,
+                        "confidence": "high" if score >= 0.85 else "medium",
                     }
                 )
 
@@ -541,6 +664,85 @@ def check_duplicate():
     )
 
 
+@customer_bp.route("/duplicate-clusters", methods=["GET"])
+@jwt_required()
+def list_duplicate_clusters():
+    """Suspected duplicate groups from the last batch scan (admin only)"""
+    user = get_user_by_identity(get_jwt_identity())
+    if not user or user.role != UserRole.ADMIN:
+        return jsonify({"msg": "Admin access required"}), 403
+
+    status = request.args.get("status", "open")
+    page = request.args.get("page", 1, type=int)
+    per_page = min(request.args.get("per_page", 50, type=int), 200)
+    pagination = (
+        DuplicateCluster.query.filter_by(status=status)
+        .order_by(DuplicateCluster.max_score.desc(), DuplicateCluster.id)
+        .paginate(page=page, per_page=per_page, error_out=False)
+    )
+    cluster_ids = [c.id for c in pagination.items]
+    members = defaultdict(list)
+    rows = (
+        db.session.query(DuplicateClusterMember, Customer)
+        .join(Customer, Customer.id == DuplicateClusterMember.customer_id)
+        .filter(DuplicateClusterMember.cluster_id.in_(cluster_ids))
+        .order_by(DuplicateClusterMember.score.desc())
+    )
+    for member, customer in rows:
+        members[member.cluster_id].append(
+            {
+                "id": customer.id,
+                "customer_id": customer.customer_id,
+                "name": customer.name,
+                "mobile": customer.mobile_number,
+                "area": customer.area,
+                "best_match_id": member.best_match_id,
+                "score": member.score,
+            }
+        )
+
+    return (
+        jsonify(
+            {
+                "clusters": [
+                    {
+                        "id": c.id,
+                        "size": c.size,
+                        "max_score": c.max_score,
+                        "status": c.status,
+                        "created_at": c.created_at.isoformat() if c.created_at else None,
+                        "members": members[c.id],
+                    }
+                    for c in pagination.items
+                ],
+                "total": pagination.total,
+                "pages": pagination.pages,
+                "current_page": page,
+            }
+        ),
+        200,
+    )
+
+
+@customer_bp.route("/duplicate-clusters/<int:cluster_id>", methods=["PATCH"])
+@jwt_required()
+def review_duplicate_cluster(cluster_id):
+    """Mark a duplicate group dismissed (not the same person) or merged (admin only)"""
+    user = get_user_by_identity(get_jwt_identity())
+    if not user or user.role != UserRole.ADMIN:
+        return jsonify({"msg": "Admin access required"}), 403
+
+    status = (request.get_json() or {}).get("status")
+    if status not in ("open", "dismissed", "merged"):
+        return jsonify({"msg": "status must be open, dismissed or merged"}), 400
+
+    cluster = DuplicateCluster.query.get_or_404(cluster_id)
+    cluster.status = status
+    cluster.reviewed_by = user.id
+    db.session.commit()
+    return jsonify({"msg": f"Cluster marked {status}"}), 200
+
+
 @customer_bp.route("/<int:id>/notes", methods=["POST"])
 @jwt_required()
 def add_customer_note(id):
@@ -12,9 +12,13 @@ from models import (
     Collection,
 )
 from utils.auth_helpers import get_user_by_identity
+from utils.customer_sync import mark_customers_changed
 from datetime import datetime
 from utils.interest_utils import get_distance_meters
+from utils.line_board import build_line_board
 from utils.ml_risk import risk_engine
+from utils.route_planner import ROUTE_PRIORITY_METERS, plan_route
+from utils.worker_assignment import assign_new_customers
 
 
 line_bp = Blueprint("line", __name__)
@@ -208,71 +212,8 @@ def get_line_customers(line_id):
     if not line:
         return jsonify({"msg": "Line not found"}), 404
 
-    customers_mapping = (
-        LineCustomer.query.filter_by(line_id=line_id)
-        .order_by(LineCustomer.sequence_order)
-        .all()
-    )
-
-    today = datetime.utcnow().date()
-    # Simplified check: Has ANY loan of this customer been collected today on THIS line?
-    # Usually a customer has one loan per line.
-    
-    results = []
-    results = []
-    for m in customers_mapping:
-        # Get active loans for this customer
-        active_loans = Loan.query.filter_by(customer_id=m.customer.id, status='active').all()
-        loan_summaries = []
-        fully_collected = True if active_loans else False
-        total_collected_amount = 0.0
-        total_cash = 0.0
-        total_upi = 0.0
-        
-        for l in active_loans:
-            todays_collections = Collection.query.filter(
-                Collection.loan_id == l.id,
-                db.func.date(Collection.created_at) == today,
-                Collection.status != 'rejected'
-            ).all()
-
-            collected_amount = sum(c.amount for c in todays_collections)
-            total_collected_amount += collected_amount
-            
-            # Calculate breakdown
-            for c in todays_collections:
-                if c.payment_mode and c.payment_mode.lower() == 'cash':
-                    total_cash += c.amount
-                else:
-                    total_upi += c.amount
-
-            is_collected = len(todays_collections) > 0
-            
-            loan_summaries.append({
-                "id": l.id,
-                "loan_id": l.loan_id,
-                "is_collected": is_collected,
-                "collected_amount": float(collected_amount),
-                "pending": l.pending_amount
-            })
-            if not is_collected:
-                fully_collected = False
-
-        results.append({
-            "id": m.customer.id,
-            "name": m.customer.name,
-            "mobile": m.customer.mobile_number,
-            "area": m.customer.area,
-            "sequence": m.sequence_order,
-            "is_collected_today": fully_collected,
-            "amount": float(total_collected_amount),
-            "amount_cash": float(total_cash),
-            "amount_upi": float(total_upi),
-            "active_loans": loan_summaries,
-            "loan_count": len(active_loans)
-        })
-
-    return jsonify(results), 200
+    # Fixed number of queries however long the line (utils/line_board.py)
+    return jsonify(build_line_board(line_id)), 200
 
 
 @line_bp.route("/<int:line_id>/reorder", methods=["POST"])
@@ -330,69 +271,133 @@ def toggle_line_lock(line_id):
     return jsonify({"msg": "line_status_updated", "is_locked": line.is_locked}), 200
 
 
+def _risk_by_customer(customer_ids):
+    """
+    customer id -> default risk (0-100) of the customer's first active loan,
+    from three set-based queries and one model call
+    """
+    loans = {}
+    for loan in (
+        db.session.query(
+            Loan.id, Loan.customer_id, Loan.pending_amount, Loan.principal_amount
+        )
+        .filter(Loan.customer_id.in_(customer_ids), Loan.status == "active")
+        .order_by(Loan.id.desc())
+    ):
+        loans[loan.customer_id] = loan  # Lowest id wins
+    if not loans:
+        return {}
+
+    today = datetime.utcnow()
+    loan_ids = [loan.id for loan in loans.values()]
+    missed = dict(
+        db.session.query(EMISchedule.loan_id, db.func.count(EMISchedule.id))
+        .filter(
+            EMISchedule.loan_id.in_(loan_ids),
+            EMISchedule.status != "paid",
+            EMISchedule.due_date < today,
+        )
+        .group_by(EMISchedule.loan_id)
+        .all()
+    )
+    last_paid = dict(
+        db.session.query(Collection.loan_id, db.func.max(Collection.created_at))
+        .filter(Collection.loan_id.in_(loan_ids), Collection.status == "approved")
+        .group_by(Collection.loan_id)
+        .all()
+    )
+
+    features = []
+    for loan in loans.values():
+        misses = missed.get(loan.id, 0)
+        last_pay = last_paid.get(loan.id)
+        days_since = (today - last_pay).days if last_pay else 30
+        # utilization = (pending/principal)*100
+        util = (
+            (loan.pending_amount / loan.principal_amount * 100)
+            if loan.principal_amount > 0
+            else 50
+        )
+        features.append((misses, misses * 10, days_since, 0, util))
+    scores = risk_engine.predict_risk_batch(features)
+    return dict(zip(loans, scores))
+
+
 @line_bp.route("/<int:line_id>/optimize", methods=["POST"])
 @jwt_required()
 def optimize_line_route(line_id):
     """
-    AI-Powered Route Optimization
-    Calculates priority based on: Proximity (40%) and AI Risk Score (60%)
+    Plans the visiting order of the line (utils/route_planner.py): the
+    shortest walk from the agent's position, with high-risk customers
+    pulled forward as a soft constraint.
+    Body: latitude, longitude (agent position, optional), priority_meters
+    (risk pull, 0 = shortest walk), apply (save as the line's sequence).
+    Returns the customers in visiting order.
     """
-    data = request.get_json()
+    data = request.get_json() or {}
     current_lat = data.get("latitude")
     current_lng = data.get("longitude")
 
-    Line.query.get_or_404(line_id)
-    mappings = LineCustomer.query.filter_by(line_id=line_id).all()
-
-    results = []
-    today = datetime.utcnow()
-
-    for mapping in mappings:
-        customer = mapping.customer
-        # 1. Fetch AI Risk Score for this customer's active loan
-        active_loan = Loan.query.filter_by(
-            customer_id=customer.id, status="active"
-        ).first()
-
-        risk_score = 0
-        if active_loan:
-            # Simplified feature extraction for speed
-            missed = EMISchedule.query.filter(
-                EMISchedule.loan_id == active_loan.id,
-                EMISchedule.status != "paid",
-                EMISchedule.due_date < today,
-            ).count()
-
-            last_pay = (
-                Collection.query.filter_by(loan_id=active_loan.id, status="approved")
-                .order_by(Collection.created_at.desc())
-                .first()
-            )
-            days_since = (today - last_pay.created_at).days if last_pay else 30
+    line = Line.query.get_or_404(line_id)
+    if data.get("apply"):
+        user = get_user_by_identity(get_jwt_identity())
+        if not user:
+            return jsonify({"msg": "User not found"}), 404
+        # Same rule as /reorder: Admin OR the assigned agent
+        if user.role != UserRole.ADMIN and line.agent_id != user.id:
+            return jsonify({"msg": "Access Denied"}), 403
 
-            # utilization = (pending/principal)*100
-            util = (
-                (active_loan.pending_amount / active_loan.principal_amount * 100)
-                if active_loan.principal_amount > 0
-                else 50
-            )
+    try:
+        priority_meters = float(data.get("priority_meters", ROUTE_PRIORITY_METERS))
+    except (TypeError, ValueError):
+        return jsonify({"msg": "priority_meters must be a number"}), 400
+    if not 0 <= priority_meters < float("inf"):  # Also rejects NaN
+        return jsonify({"msg": "priority_meters must be a finite number, 0 or more"}), 400
+
+    start = None
+    if current_lat is not None and current_lng is not None:
+        try:
+            start = (float(current_lat), float(current_lng))
+        except (TypeError, ValueError):
+            return jsonify({"msg": "latitude and longitude must be numbers"}), 400
+        if not (-90 <= start[0] <= 90 and -180 <= start[1] <= 180):
+            return jsonify({"msg": "latitude/longitude out of range"}), 400
+
+    members = (
+        db.session.query(LineCustomer, Customer)
+        .join(Customer, Customer.id == LineCustomer.customer_id)
+        .filter(LineCustomer.line_id == line_id)
+        .order_by(LineCustomer.sequence_order)
+        .all()
+    )
+    risk = _risk_by_customer([customer.id for _, customer in members])
+
+    stops = [
+        (customer.latitude, customer.longitude)
+        if customer.latitude is not None and customer.longitude is not None
+        else None
+        for _, customer in members
+    ]
+    plan = plan_route(
+        stops,
+        start=start,
+        priorities=[risk.get(customer.id, 0) / 100 for _, customer in members],
+        priority_meters=priority_meters,
+    )
 
-            prob, _ = risk_engine.predict_risk(missed, missed * 10, days_since, 0, util)
-            risk_score = prob
+    results = []
+    for position, (index, leg) in enumerate(zip(plan["order"], plan["legs"]), 1):
+        mapping, customer = members[index]
+        risk_score = risk.get(customer.id, 0)
 
-        # 2. Proximity Analysis
+        # Proximity to the agent: 0m = 100, 5000m+ = 0
         dist_score = 0
         distance = None
-        if current_lat and current_lng and customer.latitude and customer.longitude:
+        if start and stops[index]:
             distance = get_distance_meters(
-                current_lat, current_lng, customer.latitude, customer.longitude
+                start[0], start[1], customer.latitude, customer.longitude
             )
-            # Normalize distance (closer = higher score). 0m = 100, 5000m+ = 0
             dist_score = max(0, 100 - (distance / 50))
-
-        # 3. Final AI Priority Calculation
-        # Priority = (Proximity * 0.4) + (Risk * 0.6)
-        # We prioritize high-risk customers who are close by
         priority = (dist_score * 0.4) + (risk_score * 0.6)
 
         results.append(
@@ -401,15 +406,19 @@ def optimize_line_route(line_id):
                 "name": customer.name,
                 "mobile": customer.mobile_number,
                 "area": customer.area,
-                "sequence": mapping.sequence_order,
+                "sequence": position if data.get("apply") else mapping.sequence_order,
+                "route_position": position,
+                "leg_meters": round(leg) if leg is not None else None,
                 "risk_score": round(risk_score, 1),
                 "distance_meters": round(distance) if distance is not None else None,
                 "ai_priority": round(priority, 1),
             }
         )
+        if data.get("apply"):
+            mapping.sequence_order = position
 
-    # Sort by AI Priority (Highest first)
-    results.sort(key=lambda x: x["ai_priority"], reverse=True)
+    if data.get("apply"):
+        db.session.commit()
 
     return jsonify(results), 200
 
@@ -433,6 +442,17 @@ def bulk_reassign_agent():
         return jsonify({"msg": "Both source and target agents are required"}), 400
 
     try:
+        # Bulk updates skip the flush hook, so mark the moved customers first
+        mark_customers_changed(
+            db.session,
+            (Customer.assigned_worker_id == from_agent_id)
+            | Customer.id.in_(
+                db.select(LineCustomer.customer_id)
+                .join(Line, LineCustomer.line_id == Line.id)
+                .where(Line.agent_id == from_agent_id)
+            ),
+        )
+
         # 1. Update all Lines assigned to the agent
         lines_updated = Line.query.filter_by(agent_id=from_agent_id).update(
             {Line.agent_id: to_agent_id}
@@ -459,6 +479,36 @@ def bulk_reassign_agent():
     except Exception as e:
         db.session.rollback()
         return jsonify({"msg": str(e)}), 500
+
+
+@line_bp.route("/assign-new-customers", methods=["POST"])
+@jwt_required()
+def assign_unserved_customers():
+    """
+    Places open customers that no active agent serves (new, or left by a
+    deactivated agent) with a nearby agent that has room. Existing
+    assignments and lines are left as they are (utils/worker_assignment.py).
+    Body: max_per_worker (default 50), apply (default false: preview only).
+    """
+    user = get_user_by_identity(get_jwt_identity())
+    if not user or user.role != UserRole.ADMIN:
+        return jsonify({"msg": "Access Denied"}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        max_per_worker = int(data.get("max_per_worker", 50))
+    except (TypeError, ValueError):
+        return jsonify({"msg": "max_per_worker must be a number"}), 400
+    if max_per_worker < 1:
+        return jsonify({"msg": "max_per_worker must be at least 1"}), 400
+
+    try:
+        return jsonify(assign_new_customers(max_per_worker, apply=bool(data.get("apply")))), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), 500
+
+
 @line_bp.route("/<int:line_id>/customer/<int:customer_id>", methods=["DELETE"])
 @jwt_required()
 def remove_customer_from_line(line_id, customer_id):
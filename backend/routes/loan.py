@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, User, Loan, EMISchedule, LoanAuditLog, Collection
 from datetime import datetime
 from utils.auth_helpers import get_user_by_identity
+from utils.id_allocator import LOAN_IDS
 from utils.interest_utils import (
     calculate_flat_emi,
     calculate_reducing_emi,
@@ -46,18 +47,8 @@ def create_loan():
         return jsonify({"msg": "Customer ID and Amount are required"}), 400
 
     try:
-        # Generate Temporary Loan ID logic
-        year = datetime.utcnow().year
-        # Fixed for PostgreSQL compatibility
-        try:
-             count = Loan.query.filter(
-                db.extract('year', Loan.created_at) == year
-            ).count()
-        except:
-             # Fallback
-             count = Loan.query.filter(Loan.created_at >= datetime(year, 1, 1)).count()
-
-        loan_id_str = f"LN-{year}-{count + 1:06d}"
+        # Loan ID from the shared per-year sequence (utils/id_allocator.py)
+        loan_id_str = LOAN_IDS.next()
 
         new_loan = Loan(
             loan_id=loan_id_str,
@@ -9,20 +9,12 @@ from fpdf import FPDF
 reports_bp = Blueprint("reports", __name__)
 
 
-from utils.auth_helpers import get_user_by_identity
+from utils.auth_helpers import get_user_by_identity, get_admin_principal
+from utils.business_time import business_date
 
 def get_admin_user():
-    identity = get_jwt_identity()
-    # Safe lookup helper prevents PostgreSQL 500 error
-    user = get_user_by_identity(identity)
-    
-    if user:
-         # Normalize role check
-         current_role = user.role.value if hasattr(user.role, 'value') else user.role
-         if current_role == "admin" or current_role == UserRole.ADMIN.value:
-             return user
-    return None
-    return None
+    # Pure claim check for v2 tokens; legacy tokens fall back to a user lookup
+    return get_admin_principal()
 
 
 @reports_bp.route("/stats/kpi", methods=["GET"])
@@ -630,6 +622,7 @@ def get_work_targets():
 
     try:
         today = datetime.utcnow().date()
+        collection_day = business_date()
         
         # If admin, fetch for all lines. If agent, only for their lines.
         if user.role == UserRole.ADMIN:
@@ -655,13 +648,9 @@ def get_work_targets():
                     if pending_emis:
                         # Check if any collection (approved or pending) exists for this loan today
                         # to avoid showing it in work targets if already collected.
-                        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-                        today_end = datetime.utcnow().replace(hour=23, minute=59, second=59, microsecond=999999)
-                        
                         already_collected = Collection.query.filter(
                             Collection.loan_id == loan.id,
-                            Collection.created_at >= today_start,
-                            Collection.created_at <= today_end,
+                            Collection.collection_date == collection_day,
                             Collection.status != 'rejected'
                         ).first()
                         
@@ -695,7 +684,7 @@ def get_validation_errors():
         # Aggregate flags from N8n (Simulated for UI, in reality N8n would POST here or we'd fetch from logs)
         # For the dashboard, we show a summary of today's 'alerts' detected by the agent.
         alerts = Collection.query.filter(
-            func.date(Collection.created_at) == today,
+            Collection.collection_date == business_date(),
             Collection.status == 'pending' # Alerts usually happen during pending phase
         ).count()
         
@@ -1,16 +1,15 @@
 from flask import Blueprint, jsonify, Response
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models import (
     db,
     User,
     Loan,
     Collection,
     EMISchedule,
-    UserRole,
     LoanAuditLog,
     LoginLog,
 )
-from utils.auth_helpers import get_user_by_identity
+from utils.auth_helpers import get_admin_principal
 from datetime import datetime, timedelta
 import csv
 import io
@@ -19,11 +18,8 @@ security_bp = Blueprint("security", __name__)
 
 
 def get_admin_user():
-    identity = get_jwt_identity()
-    user = get_user_by_identity(identity)
-    if user and user.role == UserRole.ADMIN:
-        return user
-    return None
+    # Pure claim check for v2 tokens; legacy tokens fall back to a user lookup
+    return get_admin_principal()
 
 
 @security_bp.route("/audit-export", methods=["GET"])
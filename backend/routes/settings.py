@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from models import db, SystemSetting, User, UserRole
 
 
@@ -17,18 +17,12 @@ DEFAULTS = {
     "error_detection_webhook_url": "https://n8n.your-instance.com/webhook/error-detection",
 }
 
-from utils.auth_helpers import get_user_by_identity
+from utils.auth_helpers import get_admin_principal
 
 
 def get_admin_user():
-    identity = get_jwt_identity()
-    user = get_user_by_identity(identity)
-    if user:
-        # Normalize role check
-        current_role = user.role.value if hasattr(user.role, 'value') else str(user.role)
-        if current_role == "admin":
-            return user
-    return None
+    # Pure claim check for v2 tokens; legacy tokens fall back to a user lookup
+    return get_admin_principal()
 
 
 @settings_bp.route("/", methods=["GET"])
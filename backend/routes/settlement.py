@@ -1,9 +1,10 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, User, Collection, DailySettlement, UserRole
-from datetime import datetime, date
+from datetime import datetime
 from sqlalchemy import func
 from utils.auth_helpers import get_user_by_identity
+from utils.business_time import business_date
 
 settlement_bp = Blueprint("settlement", __name__)
 
@@ -24,7 +25,7 @@ def get_todays_status():
     if current_role != UserRole.ADMIN.value:
         return jsonify({"msg": "Access Denied"}), 403
 
-    today = date.today()
+    today = business_date()
 
     # 1. Get all agents
     agents = User.query.filter_by(role=UserRole.FIELD_AGENT).all()
@@ -37,7 +38,7 @@ def get_todays_status():
         total_cash = (
             db.session.query(func.sum(Collection.amount))
             .filter(Collection.agent_id == agent.id)
-            .filter(func.date(Collection.created_at) == today)
+            .filter(Collection.collection_date == today)
             .filter(Collection.payment_mode == "cash")
             .scalar()
             or 0.0
@@ -95,13 +96,13 @@ def verify_settlement():
     expenses = float(data.get("expenses", 0))
     notes = data.get("notes", "")
 
-    today = date.today()
+    today = business_date()
 
     # Recalculate system cash to be safe
     system_cash = (
         db.session.query(func.sum(Collection.amount))
         .filter(Collection.agent_id == agent_id)
-        .filter(func.date(Collection.created_at) == today)
+        .filter(Collection.collection_date == today)
         .filter(Collection.payment_mode == "cash")
         .scalar()
         or 0.0
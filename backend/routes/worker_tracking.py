@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, User, UserRole, LocationLog
 from datetime import datetime
 from utils.auth_helpers import get_user_by_identity
+from utils.event_log import event_log
 
 tracking_bp = Blueprint("tracking", __name__)
 
@@ -31,14 +32,14 @@ def update_tracking():
         user.current_activity = activity
     
     # Save to History Log
-    log = LocationLog(
+    event_log.emit(
+        LocationLog,
         user_id=user.id,
         latitude=user.last_latitude,
         longitude=user.last_longitude,
         activity=activity,
         timestamp=user.last_location_update
     )
-    db.session.add(log)
     
     db.session.commit()
     return jsonify({"msg": "tracking_updated", "status": user.duty_status}), 200
@@ -127,13 +128,27 @@ def self_enroll_biometric():
             return jsonify({"msg": "missing_embedding"}), 400
             
         from models import FaceEmbedding, Device
-        
-        # Remove old embedding
-        FaceEmbedding.query.filter_by(user_id=user.id).delete()
-        
+        from utils.face_embeddings import (
+            CLIENT_MODEL_VERSION,
+            CorruptEmbeddingError,
+            pack_embedding,
+        )
+
+        try:
+            embedding_blob = pack_embedding(embedding)
+        except (CorruptEmbeddingError, TypeError, ValueError):
+            return jsonify({"msg": "invalid_embedding"}), 400
+
+        from utils.face_index import face_index, prune_templates
+
+        # Replace old templates unless enrolling an additional one
+        prune_templates(user.id, keep_latest=bool(data.get("append")))
+
         new_face = FaceEmbedding(
             user_id=user.id,
-            embedding_data=embedding,
+            embedding_blob=embedding_blob,
+            # Not taken from the body: the index only matches versions it knows
+            model_version=CLIENT_MODEL_VERSION,
             device_id=device_id
         )
         db.session.add(new_face)
@@ -154,6 +169,7 @@ def self_enroll_biometric():
                 device.last_active = datetime.utcnow()
         
         db.session.commit()
+        face_index.sync_user(user.id)
         return jsonify({"msg": "face_enrolled"}), 200
         
     except Exception as e:
@@ -0,0 +1,143 @@
+"""
+Per-agent activity counters (AgentActivityStats) for the collection rules.
+
+Auto-approval needs "has this agent ever had a flagged collection" and the
+velocity rule needs "when did this agent last collect". Counting or
+sorting the agent's whole history on every submit grows with that
+history, so both live in one row per agent that is updated in the same
+transaction as the collection that changes them:
+
+    stats = lock_agent_stats(user.id)          # SELECT ... FOR UPDATE
+    ... rules read stats.flagged_count / stats.last_collection_at ...
+    record_new_collection(stats, collection)   # after adding it
+    record_status_change(stats, old, new)      # on approve/reject
+
+The row lock also serialises concurrent submits by the same agent.
+Run rebuild_agent_stats.py if the table ever drifts (e.g. manual SQL).
+"""
+
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import AgentActivityStats, Collection
+from utils.business_time import business_date
+
+
+def _history_counters(agent_id):
+    """Counters recomputed from the agent's collections (aggregate queries)"""
+    flagged_count, last_collection_at = (
+        db.session.query(
+            # sum(case) rather than FILTER (WHERE ...), which MySQL lacks
+            db.func.sum(db.case((Collection.status == "flagged", 1), else_=0)),
+            db.func.max(Collection.created_at),
+        )
+        .filter(Collection.agent_id == agent_id)
+        .one()
+    )
+    today = business_date()
+    day_count, day_amount, day_cash_amount = (
+        db.session.query(
+            db.func.count(Collection.id),
+            db.func.coalesce(db.func.sum(Collection.amount), 0.0),
+            db.func.coalesce(
+                db.func.sum(
+                    db.case(
+                        (Collection.payment_mode == "cash", Collection.amount),
+                        else_=0.0,
+                    )
+                ),
+                0.0,
+            ),
+        )
+        .filter(Collection.agent_id == agent_id, Collection.collection_date == today)
+        .one()
+    )
+    return {
+        "flagged_count": int(flagged_count or 0),
+        "last_collection_at": last_collection_at,
+        "stats_date": today,
+        "day_count": day_count or 0,
+        "day_amount": float(day_amount or 0),
+        "day_cash_amount": float(day_cash_amount or 0),
+    }
+
+
+def _locked(agent_id):
+    return (
+        AgentActivityStats.query.filter_by(agent_id=agent_id).with_for_update().first()
+    )
+
+
+def lock_agent_stats(agent_id):
+    """
+    The agent's stats row, locked until the caller commits. Seeded from the
+    agent's history the first time it is needed.
+    """
+    stats = _locked(agent_id)
+    if stats is not None:
+        return stats
+    try:
+        with db.session.begin_nested():
+            stats = AgentActivityStats(agent_id=agent_id, **_history_counters(agent_id))
+            db.session.add(stats)
+    except IntegrityError:
+        # Another request created it first
+        stats = _locked(agent_id)
+    return stats
+
+
+def record_new_collection(stats, collection):
+    """Counts a collection that was just added to the session"""
+    created_at = collection.created_at or datetime.utcnow()
+    if collection.status == "flagged":
+        stats.flagged_count += 1
+    if stats.last_collection_at is None or created_at > stats.last_collection_at:
+        stats.last_collection_at = created_at
+
+    # Daily totals cover the current IST day; offline replays of older days
+    # only move the counters above.
+    day = business_date(created_at)
+    if stats.stats_date is not None and day < stats.stats_date:
+        return
+    if stats.stats_date != day:
+        stats.stats_date = day
+        stats.day_count = 0
+        stats.day_amount = 0.0
+        stats.day_cash_amount = 0.0
+    stats.day_count += 1
+    stats.day_amount += collection.amount
+    if collection.payment_mode == "cash":
+        stats.day_cash_amount += collection.amount
+
+
+def record_status_change(stats, old_status, new_status):
+    """Keeps flagged_count right when a reviewer changes a collection's status"""
+    if old_status == new_status:
+        return
+    if old_status == "flagged":
+        stats.flagged_count = max(0, stats.flagged_count - 1)
+    if new_status == "flagged":
+        stats.flagged_count += 1
+
+
+def rebuild_agent_stats():
+    """Recomputes every agent's row from the collections table. Returns the row count."""
+    agent_ids = {
+        agent_id for (agent_id,) in db.session.query(Collection.agent_id).distinct()
+    }
+    agent_ids.update(
+        agent_id for (agent_id,) in db.session.query(AgentActivityStats.agent_id)
+    )
+    agent_ids.discard(None)
+    for agent_id in sorted(agent_ids):
+        counters = _history_counters(agent_id)
+        stats = _locked(agent_id)
+        if stats is None:
+            db.session.add(AgentActivityStats(agent_id=agent_id, **counters))
+        else:
+            for name, value in counters.items():
+                setattr(stats, name, value)
+        db.session.commit()
+    return len(agent_ids)
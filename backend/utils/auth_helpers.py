@@ -1,15 +1,106 @@
-from models import User, UserRole
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
 
-def get_user_by_identity(identity):
+from flask import g, has_request_context, jsonify
+from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
+from extensions import db
+from sqlalchemy import and_, false
+
+from models import Device, FaceEmbedding, User, UserRole, normalize_name
+
+# Snapshot of the fields needed to re-resolve a JWT identity cheaply.
+IdentitySnapshot = namedtuple(
+    "IdentitySnapshot", ["user_id", "role", "is_active", "token_version"]
+)
+
+# The authenticated caller as described by the access token claims.
+Principal = namedtuple("Principal", ["id", "name", "role", "token_version"])
+
+IDENTITY_CACHE_TTL = int(os.getenv("IDENTITY_CACHE_TTL", 60))  # seconds
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", 2048))
+
+
+class IdentityCache:
     """
-    Safely retrieves a user by identity (Username, Mobile, or ID).
-    Handles type checks to avoid PostgreSQL integer casting errors.
+    Bounded TTL/LRU cache (per process) mapping a JWT identity to an
+    IdentitySnapshot, so repeated requests skip the OR lookup on users.
     """
-    if not identity:
+
+    def __init__(self, maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # identity -> (snapshot, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, identity):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(identity)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._entries[identity]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(identity)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, identity, snapshot):
+        with self._lock:
+            self._entries[identity] = (snapshot, time.monotonic() + self.ttl)
+            self._entries.move_to_end(identity)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            stale = [
+                k for k, (snap, _) in self._entries.items() if snap.user_id == user_id
+            ]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+identity_cache = IdentityCache()
+
+
+def _request_memo():
+    """Per-request memo of identity -> User, stored on flask.g"""
+    if not has_request_context():
         return None
-        
+    if "identity_users" not in g:
+        g.identity_users = {}
+    return g.identity_users
+
+
+def _query_user_by_identity(identity):
     query = User.query
-    
+
     # safe check for ID (integer)
     is_id = False
     if isinstance(identity, int):
@@ -32,5 +123,209 @@ def get_user_by_identity(identity):
             | (User.username == identity)
             | (User.name == identity)
         ).first()
-        
+
     return user
+
+
+def _role_value(role):
+    return role.value if hasattr(role, "value") else str(role)
+
+
+def _snapshot(user):
+    return IdentitySnapshot(
+        user.id, _role_value(user.role), bool(user.is_active), user.token_version or 0
+    )
+
+
+def get_user_by_identity(identity):
+    """
+    Safely retrieves a user by identity (Username, Mobile, or ID).
+    Handles type checks to avoid PostgreSQL integer casting errors.
+
+    Resolution order: per-request memo on flask.g, then the process-wide
+    identity cache (primary-key fetch), then the full OR query.
+    """
+    if not identity:
+        return None
+
+    memo = _request_memo()
+    if memo is not None and identity in memo:
+        return memo[identity]
+
+    user = None
+    snapshot = identity_cache.get(identity)
+    if snapshot is not None:
+        user = User.query.get(snapshot.user_id)
+        if user is None:
+            # Row vanished under us (deleted by another worker)
+            identity_cache.invalidate_user(snapshot.user_id)
+
+    if user is None:
+        user = _query_user_by_identity(identity)
+        if user is not None:
+            identity_cache.put(identity, _snapshot(user))
+
+    if memo is not None:
+        memo[identity] = user
+    return user
+
+
+def invalidate_user_identity(user_id):
+    """Drop cached identities for a user after it was changed or deleted"""
+    identity_cache.invalidate_user(user_id)
+    memo = _request_memo()
+    if memo:
+        for key in [k for k, u in memo.items() if u is not None and u.id == user_id]:
+            del memo[key]
+
+
+def identity_cache_stats():
+    return identity_cache.stats()
+
+
+# --- PIN login ---
+
+PinLoginContext = namedtuple("PinLoginContext", ["user", "has_biometrics", "device"])
+
+
+def load_pin_login(name, device_id=None):
+    """
+    One round trip for PIN login: the user (indexed lookup on
+    name_normalized), whether any face template exists, and the caller's
+    Device row if device_id is registered to this user.
+    Returns None when the name is unknown.
+    """
+    has_biometrics = (
+        db.session.query(FaceEmbedding.id)
+        .filter(FaceEmbedding.user_id == User.id)
+        .exists()
+        .label("has_biometrics")
+    )
+    device_match = (
+        and_(Device.user_id == User.id, Device.device_id == device_id)
+        if device_id
+        else false()
+    )
+    row = (
+        db.session.query(User, has_biometrics, Device)
+        .outerjoin(Device, device_match)
+        .filter(User.name_normalized == normalize_name(name))
+        .order_by(User.id)
+        .first()
+    )
+    if row is None:
+        return None
+    user, biometrics, device = row
+    return PinLoginContext(user, bool(biometrics), device)
+
+
+def backfill_normalized_names(batch_size=500):
+    """Fills users.name_normalized for rows created before the column existed"""
+    updated = 0
+    while True:
+        users = User.query.filter(User.name_normalized.is_(None)).limit(batch_size).all()
+        if not users:
+            break
+        for user in users:
+            user.name_normalized = normalize_name(user.name) or ""
+        db.session.commit()
+        updated += len(users)
+    if updated:
+        print(f"Backfilled name_normalized for {updated} users")
+    return updated
+
+
+# --- Claim-based principal (token format v2) ---
+
+
+def build_token_claims(user):
+    """Additional JWT claims so protected routes can skip the identity lookup"""
+    return {
+        "uid": user.id,
+        "role": _role_value(user.role),
+        "tv": user.token_version or 0,
+    }
+
+
+def revoke_user_tokens(user):
+    """Invalidate every token issued to the user; caller commits"""
+    user.token_version = (user.token_version or 0) + 1
+
+
+def _user_snapshot_by_id(user_id):
+    key = ("uid", user_id)
+    snapshot = identity_cache.get(key)
+    if snapshot is None:
+        row = (
+            db.session.query(User.id, User.role, User.is_active, User.token_version)
+            .filter(User.id == user_id)
+            .first()
+        )
+        if row is None:
+            return None
+        snapshot = IdentitySnapshot(
+            row.id, _role_value(row.role), bool(row.is_active), row.token_version or 0
+        )
+        identity_cache.put(key, snapshot)
+    return snapshot
+
+
+def _resolve_principal():
+    identity = get_jwt_identity()
+    claims = get_jwt()
+
+    if "uid" in claims:
+        # Checked against the cached snapshot, not the claims: a deactivated
+        # or demoted user loses access without waiting for a version bump
+        snapshot = _user_snapshot_by_id(claims["uid"])
+        if (
+            snapshot is None
+            or not snapshot.is_active
+            or snapshot.token_version != claims.get("tv", 0)
+        ):
+            return None
+        return Principal(
+            snapshot.user_id, identity, snapshot.role, snapshot.token_version
+        )
+
+    # Legacy token: identity is a name/username/mobile only
+    user = get_user_by_identity(identity)
+    if user is None:
+        return None
+    return Principal(user.id, identity, _role_value(user.role), user.token_version or 0)
+
+
+def get_current_principal():
+    """Resolved caller for the current request (memoized on flask.g)"""
+    if "principal" not in g:
+        g.principal = _resolve_principal()
+    return g.principal
+
+
+def get_admin_principal():
+    principal = get_current_principal()
+    if principal and principal.role == UserRole.ADMIN.value:
+        return principal
+    return None
+
+
+def principal_required(admin=False):
+    """
+    jwt_required() that also resolves the caller into a Principal.
+    Handlers read it with get_current_principal().
+    """
+
+    def wrapper(fn):
+        @wraps(fn)
+        @jwt_required()
+        def decorator(*args, **kwargs):
+            principal = get_current_principal()
+            if principal is None:
+                return jsonify({"msg": "token_revoked"}), 401
+            if admin and principal.role != UserRole.ADMIN.value:
+                return jsonify({"msg": "Admin access required"}), 403
+            return fn(*args, **kwargs)
+
+        return decorator
+
+    return wrapper
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+# Business day boundaries follow India Standard Time; timestamps are stored in UTC
+IST_OFFSET = timedelta(hours=5, minutes=30)
+
+
+def ist_now():
+    return datetime.utcnow() + IST_OFFSET
+
+
+def business_date(utc_dt=None):
+    """IST calendar date for a UTC timestamp (default: now)"""
+    return ((utc_dt or datetime.utcnow()) + IST_OFFSET).date()
+
+
+def backfill_collection_dates(db, batch_size=5000):
+    """
+    Fills collections.collection_date for rows written before the column
+    existed, in primary-key batches so large tables never lock for long.
+    """
+    from sqlalchemy import bindparam
+    from models import Collection
+
+    table = Collection.__table__
+    stmt = (
+        table.update()
+        .where(table.c.id == bindparam("row_id"))
+        .values(collection_date=bindparam("day"))
+    )
+    updated, last_id = 0, 0
+    while True:
+        rows = (
+            db.session.query(Collection.id, Collection.created_at)
+            .filter(Collection.collection_date.is_(None), Collection.id > last_id)
+            .order_by(Collection.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        db.session.execute(
+            stmt,
+            [
+                {"row_id": row_id, "day": business_date(created_at)}
+                for row_id, created_at in rows
+            ],
+        )
+        db.session.commit()
+        last_id = rows[-1][0]
+        updated += len(rows)
+    if updated:
+        print(f"Backfilled collection_date for {updated} collections")
+    return updated
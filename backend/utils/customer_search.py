@@ -0,0 +1,307 @@
+"""
+Customer search over name, mobile number and customer_id.
+
+Every customer carries search_text: its normalised name, mobile digits
+and customer_id (utils/match_keys.py). A search term is normalised the
+same way and matched as a substring, served by one of:
+
+  * "trigram" - PostgreSQL with pg_trgm: a GIN trigram index on
+    search_text answers LIKE '%term%' without a table scan. The index is
+    created by flask migrate; workers only check that it exists.
+  * "memory" - any other database: an in-process trigram inverted index
+    built at startup. Before each search it reads the customers whose
+    change_version moved (utils/customer_sync.py), so creates and updates
+    made by any worker show up straight away. Terms matching more than
+    SEARCH_MATCH_LIMIT customers fall through to the LIKE scan, so every
+    match can still be paged.
+  * "sql" - a plain LIKE scan. Used when CUSTOMER_SEARCH_BACKEND=sql, and
+    for terms shorter than three characters.
+
+Matches are ranked: exact mobile or customer_id first, then mobile
+prefixes, then name prefixes, then word prefixes, then any other
+substring.
+
+    query = customer_search.apply(Customer.query, term)
+"""
+
+import os
+import re
+import threading
+from collections import defaultdict
+
+from sqlalchemy import bindparam, case, false, text
+from sqlalchemy.exc import DBAPIError
+
+from extensions import db
+from models import Customer, CustomerTombstone
+from utils.customer_sync import current_change_version
+from utils.match_keys import customer_match_keys, customer_search_text, search_key
+
+CUSTOMER_SEARCH_BACKEND = os.getenv(
+    "CUSTOMER_SEARCH_BACKEND", "auto"
+)  # auto|trigram|memory|sql
+SEARCH_MATCH_LIMIT = int(
+    os.getenv("CUSTOMER_SEARCH_MATCH_LIMIT", 500)
+)  # most matches served from the in-memory index
+TRIGRAM_INDEX = "ix_customers_search_trgm"
+
+
+def normalise_term(term):
+    """Search term in search_text form; phone-like terms keep only their digits"""
+    term = (term or "").strip()
+    if re.fullmatch(r"[\d\s+()-]+", term):
+        if term.startswith("+91"):
+            term = term[3:]  # Numbers are stored without the country code
+        return re.sub(r"\D", "", term)
+    return search_key(term)
+
+
+def _grams(value):
+    return {value[i : i + 3] for i in range(len(value) - 2)}
+
+
+def _rank(term, doc):
+    search_text, mobile, customer_key = doc
+    if term == mobile or term == customer_key:
+        return 0
+    if mobile.startswith(term):
+        return 1
+    if search_text.startswith(term):
+        return 2
+    if f" {term}" in f" {search_text}":
+        return 3
+    return 4
+
+
+class NgramIndex:
+    """Trigram -> customer ids, verified against each customer's current text"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.docs = {}  # customer id -> (search_text, mobile digits, customer_id key)
+        self.postings = defaultdict(list)
+        self.version = None  # change version the index is current up to
+
+    def _put(self, customer_id, name, mobile_number, business_id):
+        search_text = customer_search_text(name, mobile_number, business_id)
+        previous = self.docs.get(customer_id)
+        self.docs[customer_id] = (
+            search_text,
+            re.sub(r"\D", "", mobile_number or ""),
+            search_key(business_id),
+        )
+        if previous and previous[0] == search_text:
+            return
+        # Postings of the old text are left behind; search() re-checks the text
+        for gram in _grams(search_text):
+            self.postings[gram].append(customer_id)
+
+    def _rows(self):
+        return db.session.query(
+            Customer.id, Customer.name, Customer.mobile_number, Customer.customer_id
+        )
+
+    def build(self):
+        with self.lock:
+            snapshot = current_change_version()
+            self.docs = {}
+            self.postings = defaultdict(list)
+            for row in self._rows().yield_per(10000):
+                self._put(*row)
+            self.version = snapshot
+
+    def refresh(self):
+        """Applies customer changes committed since the last build/refresh"""
+        with self.lock:
+            if self.version is None:
+                self.build()
+                return
+            snapshot = current_change_version()
+            if snapshot == self.version:
+                return
+            changed = self._rows().filter(
+                Customer.change_version > self.version,
+                Customer.change_version <= snapshot,
+            )
+            for row in changed:
+                self._put(*row)
+            deleted = db.session.query(CustomerTombstone.customer_id).filter(
+                CustomerTombstone.change_version > self.version,
+                CustomerTombstone.change_version <= snapshot,
+            )
+            for (customer_id,) in deleted:
+                self.docs.pop(customer_id, None)
+            self.version = snapshot
+
+    def search(self, term, limit, within=None):
+        """
+        Ranked ids of customers whose text contains term (len(term) >= 3),
+        optionally only among the ids in within. None when more than limit
+        customers match.
+        """
+        with self.lock:
+            postings = [self.postings.get(gram) for gram in _grams(term)]
+            if not all(postings):
+                return []
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:3]:
+                if len(candidates) <= 64:
+                    break
+                candidates.intersection_update(posting)
+            if within is not None:
+                candidates.intersection_update(within)
+            docs = self.docs
+            matches = [
+                cid for cid in candidates if cid in docs and term in docs[cid][0]
+            ]
+            if len(matches) > limit:
+                return None
+            return sorted(
+                matches, key=lambda cid: (_rank(term, docs[cid]), docs[cid][0], cid)
+            )
+
+
+class CustomerSearch:
+    def __init__(self):
+        self.backend = "sql"
+        self.index = NgramIndex()
+
+    def init_app(self, app):
+        """Picks the backend and builds the in-memory index if that is the one used"""
+        backend = CUSTOMER_SEARCH_BACKEND
+        if backend in ("auto", "trigram"):
+            backend = "trigram" if _trigram_index_exists() else "memory"
+        self.backend = backend
+        if backend == "memory":
+            self.index.build()
+            print(
+                f"Customer search: in-memory index of {len(self.index.docs)} customers"
+            )
+        else:
+            print(f"Customer search: {backend} backend")
+
+    def _rank_sql(self, term):
+        return case(
+            (Customer.mobile_number == term, 0),
+            (Customer.mobile_number.like(f"{term}%"), 1),
+            (Customer.search_text.like(f"{term}%"), 2),
+            (Customer.search_text.like(f"% {term}%"), 3),
+            else_=4,
+        )
+
+    def apply(self, query, term, scope=None):
+        """
+        Filters query (on Customer) to matches of term, best first. Pass the
+        caller's row-level scope filter so the in-memory index ranks only
+        customers the user can see.
+        """
+        term = normalise_term(term)
+        if not term:
+            return query
+        if self.backend == "memory" and len(term) >= 3:
+            within = None
+            if scope is not None:
+                within = {cid for (cid,) in db.session.query(Customer.id).filter(scope)}
+            with self.index.lock:
+                self.index.refresh()
+                ids = self.index.search(term, SEARCH_MATCH_LIMIT, within)
+            if ids is not None:
+                if not ids:
+                    return query.filter(false())
+                position = case(
+                    {cid: pos for pos, cid in enumerate(ids)}, value=Customer.id
+                )
+                return query.filter(Customer.id.in_(ids)).order_by(position)
+        return query.filter(Customer.search_text.like(f"%{term}%")).order_by(
+            self._rank_sql(term), Customer.search_text, Customer.id
+        )
+
+
+customer_search = CustomerSearch()
+
+
+def _trigram_index_exists():
+    if db.engine.dialect.name != "postgresql":
+        return False
+    with db.engine.connect() as conn:
+        found = conn.execute(
+            text("SELECT 1 FROM pg_indexes WHERE indexname = :name"),
+            {"name": TRIGRAM_INDEX},
+        ).first()
+    if found is None:
+        print(f"Customer search: {TRIGRAM_INDEX} missing (run flask migrate)")
+    return found is not None
+
+
+def create_trigram_index(db):
+    """Creates the pg_trgm extension and the search_text GIN index (PostgreSQL)"""
+    if db.engine.dialect.name != "postgresql":
+        return False
+    if CUSTOMER_SEARCH_BACKEND not in ("auto", "trigram"):
+        return False
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} "
+                    "ON customers USING gin (search_text gin_trgm_ops)"
+                )
+            )
+        return True
+    except DBAPIError as e:
+        print(f"Customer search: pg_trgm unavailable ({e.orig}), using in-memory index")
+        return False
+
+
+def backfill_match_keys(db, batch_size=5000):
+    """Fills the derived customer match keys for rows created before they existed"""
+    table = Customer.__table__
+    update = (
+        table.update()
+        .where(table.c.id == bindparam("row_id"))
+        .values(
+            search_text=bindparam("search_value"),
+            name_key=bindparam("name_value"),
+            mobile_suffix=bindparam("suffix_value"),
+            area_key=bindparam("area_value"),
+        )
+    )
+    updated = 0
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                db.select(
+                    table.c.id,
+                    table.c.name,
+                    table.c.mobile_number,
+                    table.c.customer_id,
+                    table.c.area,
+                )
+                .where(
+                    table.c.search_text.is_(None)
+                    | table.c.name_key.is_(None)
+                    | table.c.area_key.is_(None)
+                )
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            params = []
+            for row in rows:
+                keys = customer_match_keys(*row[1:])
+                params.append(
+                    {
+                        "row_id": row.id,
+                        "search_value": keys["search_text"],
+                        "name_value": keys["name_key"],
+                        "suffix_value": keys["mobile_suffix"],
+                        "area_value": keys["area_key"],
+                    }
+                )
+            conn.execute(update, params)
+        updated += len(rows)
+    if updated:
+        print(f"Backfilled search and match keys for {updated} customers")
+    return updated
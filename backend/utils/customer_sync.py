@@ -0,0 +1,409 @@
+"""
+Delta sync of the customer list for offline devices.
+
+Every write that changes a customer, or changes which agents can see it
+(line membership, line agent, assigned worker), stamps the customer with
+a new change_version taken from the "customers" row of change_counters.
+Deleted customers leave a CustomerTombstone with their version. A device
+keeps the cursor from its last sync and asks for everything after it:
+
+    GET /api/collection/customers/sync?cursor=<cursor>
+
+Customers that changed but are no longer visible to the agent come back
+in "deleted", so reassignments drop off the device too.
+
+Changes are collected while the transaction runs and stamped when it
+commits: the counter row is bumped with a plain UPDATE just before the
+COMMIT, so its row lock is held only for the stamping statements and
+the commit itself. Versions therefore commit in order and a cursor can
+never skip a change that commits late. The counter row is created by
+flask migrate (and by create_app for a new database), never on the
+request path.
+"""
+
+import hashlib
+from collections import namedtuple
+
+from sqlalchemy import and_, event, inspect, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import (
+    ChangeCounter,
+    Customer,
+    CustomerTombstone,
+    Line,
+    LineCustomer,
+    UserRole,
+)
+
+CUSTOMER_COUNTER = "customers"
+PENDING_KEY = "customer_changes"  # session.info entry stamped at commit
+SYNC_PAGE_DEFAULT = 1000
+SYNC_PAGE_MAX = 5000
+
+# version/last_id: position in the change stream; full: paging a first sync
+SyncCursor = namedtuple("SyncCursor", ["version", "last_id", "full"])
+
+SYNC_FIELDS = (
+    Customer.id,
+    Customer.customer_id,
+    Customer.name,
+    Customer.mobile_number,
+    Customer.area,
+    Customer.address,
+    Customer.status,
+    Customer.latitude,
+    Customer.longitude,
+    Customer.change_version,
+)
+
+
+# --- Version stamping ---
+
+
+def next_change_version(connection, name=CUSTOMER_COUNTER):
+    """Increments the named counter inside the caller's transaction"""
+    counters = ChangeCounter.__table__
+    result = connection.execute(
+        counters.update()
+        .where(counters.c.name == name)
+        .values(value=counters.c.value + 1)
+    )
+    if result.rowcount == 0:
+        raise RuntimeError(f"change_counters row {name!r} missing, run flask migrate")
+    return connection.execute(
+        select(counters.c.value).where(counters.c.name == name)
+    ).scalar_one()
+
+
+def current_change_version(name=CUSTOMER_COUNTER):
+    return (
+        db.session.query(ChangeCounter.value)
+        .filter(ChangeCounter.name == name)
+        .scalar()
+        or 0
+    )
+
+
+def seed_change_counter(db, name=CUSTOMER_COUNTER):
+    """Creates the counter row at the highest version already stamped"""
+    counters = ChangeCounter.__table__
+    try:
+        with db.engine.begin() as conn:
+            exists = conn.execute(
+                select(counters.c.name).where(counters.c.name == name)
+            ).first()
+            if exists:
+                return False
+            highest = max(
+                conn.execute(select(db.func.max(Customer.change_version))).scalar()
+                or 0,
+                conn.execute(
+                    select(db.func.max(CustomerTombstone.change_version))
+                ).scalar()
+                or 0,
+            )
+            conn.execute(counters.insert().values(name=name, value=highest))
+    except IntegrityError:
+        return False  # Another process created it first
+    return True
+
+
+def _pending(session):
+    return session.info.setdefault(
+        PENDING_KEY, {"customers": [], "ids": set(), "deleted": set()}
+    )
+
+
+def mark_customers_changed(session, criterion):
+    """
+    Queues every customer matching criterion to be stamped at commit. For
+    bulk query.update() calls, which bypass the flush hook below (call it
+    before the update).
+    """
+    ids = session.connection().execute(select(Customer.id).where(criterion))
+    _pending(session)["ids"].update(ids.scalars())
+
+
+def _changed(obj, *attrs):
+    state = inspect(obj)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+
+def _before_flush(session, flush_context, instances):
+    customers = []  # ORM objects, ids known after the flush
+    customer_ids = set()  # persistent customers
+    line_ids = set()  # lines whose agent changed
+    deleted_ids = set()
+
+    def line_member(mapping):
+        if mapping.customer_id is not None:
+            customer_ids.add(mapping.customer_id)
+        elif mapping.__dict__.get("customer") is not None:
+            customers.append(mapping.__dict__["customer"])
+
+    for obj in session.new:
+        if isinstance(obj, Customer):
+            customers.append(obj)
+        elif isinstance(obj, LineCustomer):
+            line_member(obj)
+
+    for obj in session.dirty:
+        if isinstance(obj, Customer):
+            if session.is_modified(obj, include_collections=False):
+                customers.append(obj)
+        elif isinstance(obj, LineCustomer):
+            if _changed(obj, "line_id", "customer_id"):
+                line_member(obj)
+                customer_ids.update(
+                    inspect(obj).attrs.customer_id.history.deleted or ()
+                )
+        elif isinstance(obj, Line):
+            if _changed(obj, "agent_id"):
+                line_ids.add(obj.id)
+
+    for obj in session.deleted:
+        if isinstance(obj, Customer):
+            deleted_ids.add(obj.id)
+        elif isinstance(obj, LineCustomer):
+            customer_ids.add(obj.customer_id)
+        elif isinstance(obj, Line):
+            line_ids.add(obj.id)
+
+    if not (customers or customer_ids or line_ids or deleted_ids):
+        return
+
+    if line_ids:
+        # Members as of this flush, before a deleted line takes them along
+        members = session.connection().execute(
+            select(LineCustomer.customer_id).where(LineCustomer.line_id.in_(line_ids))
+        )
+        customer_ids.update(members.scalars())
+    pending = _pending(session)
+    pending["customers"].extend(customers)
+    pending["ids"].update(customer_ids)
+    pending["deleted"].update(deleted_ids)
+
+
+def _before_commit(session):
+    """Stamps the transaction's changes with one new version, right before COMMIT"""
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending is None:
+        return
+    deleted_ids = pending["deleted"]
+    customer_ids = pending["ids"] | {c.id for c in pending["customers"]}
+    customer_ids -= deleted_ids
+    customer_ids.discard(None)
+    if not (customer_ids or deleted_ids):
+        return
+
+    connection = session.connection()
+    version = next_change_version(connection)
+    if customer_ids:
+        table = Customer.__table__
+        connection.execute(
+            table.update()
+            .where(table.c.id.in_(customer_ids))
+            .values(change_version=version)
+        )
+    if deleted_ids:
+        connection.execute(
+            CustomerTombstone.__table__.insert(),
+            [
+                {"customer_id": customer_id, "change_version": version}
+                for customer_id in deleted_ids
+            ],
+        )
+
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)  # Rolled back, nothing to stamp
+
+
+def install_change_tracking():
+    """Registers the session hooks that stamp customer change versions"""
+    hooks = (
+        ("before_flush", _before_flush),
+        ("before_commit", _before_commit),
+        ("after_transaction_end", _after_transaction_end),
+    )
+    for name, hook in hooks:
+        if not event.contains(Session, name, hook):
+            event.listen(Session, name, hook)
+
+
+def backfill_change_versions(db):
+    """Stamps customers that predate change tracking. Returns the row count."""
+    table = Customer.__table__
+    with db.engine.begin() as conn:
+        pending = conn.execute(
+            select(db.func.count())
+            .select_from(table)
+            .where(table.c.change_version.is_(None))
+        ).scalar()
+        if not pending:
+            return 0
+        version = next_change_version(conn)
+        conn.execute(
+            table.update()
+            .where(table.c.change_version.is_(None))
+            .values(change_version=version)
+        )
+    print(f"Schema sync: stamped {pending} customers with change version {version}")
+    return pending
+
+
+# --- Reading changes ---
+
+
+def customer_scope(user):
+    """Row-level filter for the customers a user may see (None: all)"""
+    if user.role != UserRole.FIELD_AGENT:
+        return None
+    on_agent_line = db.exists().where(
+        LineCustomer.customer_id == Customer.id,
+        LineCustomer.line_id == Line.id,
+        Line.agent_id == user.id,
+    )
+    return or_(Customer.assigned_worker_id == user.id, on_agent_line)
+
+
+def parse_cursor(value):
+    """
+    Cursor strings handed out by customer_changes() -> SyncCursor:
+      ""              full sync from the start
+      "f<v>.<id>"     next page of a full sync pinned at version v
+      "<v>"           changes after version v
+      "<v>.<id>"      next page of changes, inside version v
+    Raises ValueError for anything else.
+    """
+    if value in (None, ""):
+        return SyncCursor(None, 0, True)
+    value = str(value)
+    full = value.startswith("f")
+    version, _, last_id = value[1 if full else 0 :].partition(".")
+    version = int(version)
+    last_id = int(last_id) if last_id else None
+    if (
+        version < 0
+        or (last_id is not None and last_id < 0)
+        or (full and last_id is None)
+    ):
+        raise ValueError(value)
+    return SyncCursor(version, last_id, full)
+
+
+def sync_etag(user, cursor, limit, snapshot):
+    raw = f"{user.id}:{user.role}:{cursor}:{limit}:{snapshot}"
+    return hashlib.sha1(raw.encode()).hexdigest()  # nosec B324 - not security related
+
+
+def _serialize(row):
+    return {
+        "id": row.id,
+        "customer_id": row.customer_id,
+        "name": row.name,
+        "mobile": row.mobile_number,
+        "area": row.area,
+        "address": row.address,
+        "status": row.status,
+        "latitude": row.latitude,
+        "longitude": row.longitude,
+        "version": row.change_version,
+    }
+
+
+def _full_sync(user, cursor, limit, snapshot):
+    """Visible customers by id, pinned at one version; later edits come as deltas"""
+    if cursor.version is not None:
+        snapshot = cursor.version
+    query = db.session.query(*SYNC_FIELDS).filter(
+        Customer.id > cursor.last_id, Customer.change_version <= snapshot
+    )
+    scope = customer_scope(user)
+    if scope is not None:
+        query = query.filter(scope)
+    rows = query.order_by(Customer.id).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "customers": [_serialize(row) for row in rows],
+        "deleted": [],
+        "cursor": f"f{snapshot}.{rows[-1].id}" if has_more else str(snapshot),
+        "has_more": has_more,
+    }
+
+
+def _after(version_col, id_col, cursor):
+    if cursor.last_id is None:
+        return version_col > cursor.version
+    return or_(
+        version_col > cursor.version,
+        and_(version_col == cursor.version, id_col > cursor.last_id),
+    )
+
+
+def customer_changes(user, cursor, limit, snapshot):
+    """
+    At most limit changes after cursor, up to the snapshot version, oldest
+    first. Changed customers the user can no longer see, and deleted ones,
+    are listed in "deleted".
+    """
+    if cursor.full:
+        return _full_sync(user, cursor, limit, snapshot)
+
+    scope = customer_scope(user)
+    visible = db.literal(True) if scope is None else db.case((scope, True), else_=False)
+    customers = (
+        db.session.query(*SYNC_FIELDS, visible.label("visible"))
+        .filter(
+            _after(Customer.change_version, Customer.id, cursor),
+            Customer.change_version <= snapshot,
+        )
+        .order_by(Customer.change_version, Customer.id)
+        .limit(limit + 1)
+    )
+    tombstones = (
+        db.session.query(
+            CustomerTombstone.change_version, CustomerTombstone.customer_id
+        )
+        .filter(
+            _after(
+                CustomerTombstone.change_version, CustomerTombstone.customer_id, cursor
+            ),
+            CustomerTombstone.change_version <= snapshot,
+        )
+        .order_by(CustomerTombstone.change_version, CustomerTombstone.customer_id)
+        .limit(limit + 1)
+    )
+    entries = [(row.change_version, row.id, row) for row in customers]
+    entries.extend((version, customer_id, None) for version, customer_id in tombstones)
+    entries.sort(key=lambda entry: entry[:2])
+
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    upserts, deleted = [], []
+    for _, customer_id, row in entries:
+        if row is not None and row.visible:
+            upserts.append(_serialize(row))
+        else:
+            deleted.append(customer_id)
+
+    if has_more:
+        next_cursor = f"{entries[-1][0]}.{entries[-1][1]}"
+    else:
+        next_cursor = str(snapshot)
+    return {
+        "customers": upserts,
+        "deleted": deleted,
+        "cursor": next_cursor,
+        "has_more": has_more,
+    }
@@ -0,0 +1,378 @@
+"""
+Duplicate customer detection.
+
+Comparing every customer with every other one is O(n^2). Instead each
+customer gets a few blocking keys and only customers that share a key
+are compared:
+
+  * n:<name key>           same phonetic name, any word order (Murugan K / K Muruggan)
+  * a:<area>:<code>        same area and a sound-alike word in the name
+  * m:<mobile suffix>      same last seven mobile digits (+91 / 0 / typo in the prefix)
+
+Candidate pairs are scored on name (phonetic token Jaccard or edit
+distance), mobile number and area. Two entry points:
+
+  * find_similar_customers(): the check-duplicate endpoint. The blocks of
+    one new customer come straight from indexed columns (name_key,
+    mobile_suffix, area_key).
+  * scan_duplicates(): the whole customer base, scored in parallel worker
+    processes, with matches grouped into DuplicateCluster rows for review
+    (find_duplicate_customers.py).
+"""
+
+import os
+import uuid
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+from sqlalchemy import and_, or_
+
+from extensions import db
+from models import Customer, DuplicateCluster, DuplicateClusterMember
+from utils.match_keys import MOBILE_SUFFIX_DIGITS, mobile_digits, name_key, search_key
+
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", 0.7))  # batch clusters
+DUPLICATE_WARN_THRESHOLD = float(
+    os.getenv("DUPLICATE_WARN_THRESHOLD", 0.6)
+)  # check endpoint
+DUPLICATE_BLOCK_LIMIT = int(os.getenv("DUPLICATE_BLOCK_LIMIT", 50))
+DUPLICATE_SCAN_WORKERS = int(os.getenv("DUPLICATE_SCAN_WORKERS", 0))  # 0: one per CPU
+NEIGHBOUR_WINDOW = 10  # comparisons per customer inside an oversized block
+CANDIDATE_LIMIT = 200  # rows read per block by the check endpoint
+PAIRS_PER_TASK = 200000  # comparisons per worker task
+
+# name: sorted normalised words; codes: sorted phonetic codes (Customer.name_key);
+# code_set: the same codes as a set, for Jaccard scores
+Record = namedtuple("Record", ["id", "name", "codes", "code_set", "mobile", "area"])
+
+
+def make_record(customer_id, name, mobile_number, area):
+    codes = tuple(name_key(name).split())
+    return Record(
+        customer_id,
+        " ".join(sorted(search_key(name).split())),
+        codes,
+        frozenset(codes),
+        mobile_digits(mobile_number),
+        search_key(area),
+    )
+
+
+def blocking_keys(record):
+    keys = []
+    if record.codes:
+        keys.append("n:" + " ".join(record.codes))
+        if record.area:
+            keys.extend(f"a:{record.area}:{code}" for code in record.code_set)
+    if len(record.mobile) >= MOBILE_SUFFIX_DIGITS:
+        keys.append("m:" + record.mobile[-MOBILE_SUFFIX_DIGITS:])
+    return keys
+
+
+# --- Scoring ---
+
+
+def edit_distance(a, b, limit=None):
+    """Levenshtein distance; with limit, any distance above it comes back as limit + 1"""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if limit is not None and len(a) - len(b) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def name_similarity(a, b, needed=0.0):
+    """
+    max(phonetic token Jaccard, 1 - edit distance / length). The edit
+    distance is only worked out as far as it could still beat both the
+    Jaccard score and needed; otherwise the Jaccard score is returned.
+    """
+    if not a.name or not b.name:
+        return 0.0
+    codes_a, codes_b = a.code_set, b.code_set
+    jaccard = (
+        len(codes_a & codes_b) / len(codes_a | codes_b) if codes_a and codes_b else 0.0
+    )
+    longest = max(len(a.name), len(b.name))
+    limit = int((1 - max(jaccard, needed)) * longest + 1e-9)
+    if limit < 0 or jaccard == 1.0:
+        return jaccard
+    return max(jaccard, 1 - edit_distance(a.name, b.name, limit) / longest)
+
+
+def _one_typo(a, b):
+    """Equal-length strings differing by one wrong or two swapped adjacent characters"""
+    differing = sum(map(str.__ne__, a, b))
+    if differing != 2:
+        return differing == 1
+    i = next(i for i, (x, y) in enumerate(zip(a, b)) if x != y)
+    return a[i] == b[i + 1] and a[i + 1] == b[i]
+
+
+def mobile_similarity(a, b):
+    if not a.mobile or not b.mobile:
+        return 0.0
+    if a.mobile == b.mobile:
+        return 1.0
+    if len(a.mobile) == len(b.mobile) == 10 and _one_typo(a.mobile, b.mobile):
+        return 0.8
+    if a.mobile[-MOBILE_SUFFIX_DIGITS:] == b.mobile[-MOBILE_SUFFIX_DIGITS:]:
+        return 0.6
+    return 0.0
+
+
+def similarity(a, b, threshold=0.0):
+    """
+    0..1; name weighs most, a shared phone alone (family members) is not
+    enough. Pairs that cannot reach threshold may come back under-scored.
+    """
+    same_area = 1.0 if a.area and a.area == b.area else 0.0
+    rest = 0.3 * mobile_similarity(a, b) + 0.1 * same_area
+    score = rest + 0.6 * name_similarity(a, b, (threshold - rest) / 0.6)
+    return round(score, 3)
+
+
+# --- Batch scan ---
+
+
+def build_blocks(records):
+    """Id lists of the blocks with at least two customers"""
+    blocks = defaultdict(list)
+    for record in records.values():
+        for key in blocking_keys(record):
+            blocks[key].append(record.id)
+    return [ids for ids in blocks.values() if len(ids) > 1]
+
+
+def block_pairs(ids, records):
+    """
+    Pairs to compare inside one block. Blocks larger than
+    DUPLICATE_BLOCK_LIMIT (very common names in a big area) are sorted by
+    name and each customer is compared with its NEIGHBOUR_WINDOW nearest
+    neighbours only.
+    """
+    if len(ids) <= DUPLICATE_BLOCK_LIMIT:
+        return combinations(ids, 2)
+    ids = sorted(ids, key=lambda cid: (records[cid].name, records[cid].mobile))
+    return (
+        (cid, other)
+        for i, cid in enumerate(ids)
+        for other in ids[i + 1 : i + 1 + NEIGHBOUR_WINDOW]
+    )
+
+
+_worker_records = {}
+
+
+def _init_worker(records):
+    global _worker_records
+    _worker_records = records
+
+
+def _score_blocks(blocks, threshold):
+    """(matches, comparisons) for a batch of blocks"""
+    records = _worker_records
+    matches = {}
+    compared = 0
+    for ids in blocks:
+        for a, b in block_pairs(ids, records):
+            compared += 1
+            pair = (a, b) if a < b else (b, a)
+            if pair in matches:
+                continue
+            score = similarity(records[a], records[b], threshold)
+            if score >= threshold:
+                matches[pair] = score
+    return matches, compared
+
+
+def _batches(blocks):
+    batch, size = [], 0
+    for ids in blocks:
+        batch.append(ids)
+        if len(ids) <= DUPLICATE_BLOCK_LIMIT:
+            size += len(ids) * (len(ids) - 1) // 2
+        else:
+            size += len(ids) * NEIGHBOUR_WINDOW
+        if size >= PAIRS_PER_TASK:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def score_blocks(records, blocks, threshold=DUPLICATE_THRESHOLD, workers=None):
+    """
+    Scores the pairs of every block in worker processes. Returns
+    ({(a, b): score} for pairs at or above threshold, comparisons made).
+    """
+    workers = workers or DUPLICATE_SCAN_WORKERS or os.cpu_count() or 1
+    batches = list(_batches(blocks))
+    if workers == 1 or len(batches) == 1:
+        _init_worker(records)
+        results = [_score_blocks(batch, threshold) for batch in batches]
+    else:
+        with ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(records,)
+        ) as pool:
+            results = list(pool.map(_score_blocks, batches, [threshold] * len(batches)))
+
+    matches, compared = {}, 0
+    for found, count in results:
+        matches.update(found)  # A pair sharing several blocks scores the same in each
+        compared += count
+    return matches, compared
+
+
+def group_matches(matches):
+    """
+    Clusters of matched {(a, b): score} pairs (union-find). Returns a list of
+    {customer id: (best match id, score)} dicts.
+    """
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    best = {}
+    for (a, b), score in matches.items():
+        parent[find(a)] = find(b)
+        for cid, other in ((a, b), (b, a)):
+            if cid not in best or score > best[cid][1]:
+                best[cid] = (other, score)
+
+    clusters = defaultdict(dict)
+    for cid, match in best.items():
+        clusters[find(cid)][cid] = match
+    return list(clusters.values())
+
+
+def scan_duplicates(workers=None, threshold=DUPLICATE_THRESHOLD):
+    """
+    Scans all customers and replaces the open DuplicateCluster rows with the
+    result. Groups a reviewer already dismissed are not raised again.
+    Returns a summary dict.
+    """
+    rows = db.session.query(
+        Customer.id, Customer.name, Customer.mobile_number, Customer.area
+    ).yield_per(10000)
+    records = {row.id: make_record(*row) for row in rows}
+    blocks = build_blocks(records)
+    matches, compared = score_blocks(records, blocks, threshold, workers)
+    clusters = group_matches(matches)
+
+    dismissed = defaultdict(set)
+    for cluster_id, customer_id in (
+        db.session.query(
+            DuplicateClusterMember.cluster_id, DuplicateClusterMember.customer_id
+        )
+        .join(DuplicateCluster)
+        .filter(DuplicateCluster.status == "dismissed")
+    ):
+        dismissed[cluster_id].add(customer_id)
+    dismissed = {frozenset(members) for members in dismissed.values()}
+
+    open_clusters = db.session.query(DuplicateCluster.id).filter(
+        DuplicateCluster.status == "open"
+    )
+    DuplicateClusterMember.query.filter(
+        DuplicateClusterMember.cluster_id.in_(open_clusters.scalar_subquery())
+    ).delete(synchronize_session=False)
+    DuplicateCluster.query.filter(DuplicateCluster.status == "open").delete(
+        synchronize_session=False
+    )
+
+    run_id = str(uuid.uuid4())
+    written = 0
+    for members in clusters:
+        if frozenset(members) in dismissed:
+            continue
+        cluster = DuplicateCluster(
+            run_id=run_id,
+            size=len(members),
+            max_score=max(score for _, score in members.values()),
+        )
+        cluster.members = [
+            DuplicateClusterMember(customer_id=cid, best_match_id=other, score=score)
+            for cid, (other, score) in sorted(members.items())
+        ]
+        db.session.add(cluster)
+        written += 1
+    db.session.commit()
+
+    return {
+        "run_id": run_id,
+        "customers": len(records),
+        "blocks": len(blocks),
+        "pairs_compared": compared,
+        "matches": len(matches),
+        "clusters": written,
+    }
+
+
+# --- Single customer ---
+
+
+def find_similar_customers(name, mobile_number, area, limit=5, exclude_id=None):
+    """
+    Existing customers that look like a new one, best first, as
+    (customer, score) pairs scoring at least DUPLICATE_WARN_THRESHOLD.
+    """
+    probe = make_record(None, name, mobile_number, area)
+    blocks = []
+    if probe.codes:
+        blocks.append(Customer.name_key == " ".join(probe.codes))
+        if probe.area:
+            blocks.append(
+                and_(
+                    Customer.area_key == probe.area,
+                    or_(
+                        *[
+                            Customer.name_key.like(f"%{code}%")
+                            for code in probe.code_set
+                        ]
+                    ),
+                )
+            )
+    if len(probe.mobile) >= MOBILE_SUFFIX_DIGITS:
+        blocks.append(Customer.mobile_suffix == probe.mobile[-MOBILE_SUFFIX_DIGITS:])
+
+    candidates = {}
+    for block in blocks:
+        query = Customer.query.filter(block)
+        if exclude_id is not None:
+            query = query.filter(Customer.id != exclude_id)
+        for customer in query.limit(CANDIDATE_LIMIT):
+            candidates[customer.id] = customer
+
+    scored = []
+    for customer in candidates.values():
+        record = make_record(
+            customer.id, customer.name, customer.mobile_number, customer.area
+        )
+        score = similarity(probe, record)
+        if score >= DUPLICATE_WARN_THRESHOLD:
+            scored.append((customer, score))
+    scored.sort(key=lambda item: (-item[1], item[0].id))
+    return scored[:limit]
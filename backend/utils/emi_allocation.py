@@ -0,0 +1,122 @@
+"""
+Payment-to-EMI allocation.
+
+A payment is applied to a loan's unpaid EMIs oldest-due first. The engine
+works on lightweight EmiRow tuples instead of ORM objects: the running
+cumulative balance tells how much reaches each EMI, and all touched rows
+are written back with one executemany UPDATE.
+
+    details, open_rows = apply_payment(loan, amount)   # caller commits
+"""
+
+from collections import namedtuple
+from itertools import accumulate
+
+from sqlalchemy import bindparam
+
+from extensions import db
+from models import EMISchedule
+
+PAID_TOLERANCE = 0.1  # Float tolerance: a balance this small counts as paid
+CLOSE_TOLERANCE = 10  # Small tolerance for calc errors on loan closure
+
+EmiRow = namedtuple("EmiRow", ["id", "emi_no", "due_date", "balance", "status"])
+EmiUpdate = namedtuple("EmiUpdate", ["id", "emi_no", "paid", "balance", "status"])
+Allocation = namedtuple("Allocation", ["updates", "open_rows", "all_paid"])
+
+
+def load_open_emis(loan_ids):
+    """loan_id -> unpaid EmiRows ordered by due date, in one query"""
+    schedule = EMISchedule.__table__
+    rows = db.session.execute(
+        db.select(
+            schedule.c.loan_id,
+            schedule.c.id,
+            schedule.c.emi_no,
+            schedule.c.due_date,
+            # If balance is None (legacy data), assume full amount
+            db.func.coalesce(schedule.c.balance, schedule.c.amount),
+            schedule.c.status,
+        )
+        .where(schedule.c.loan_id.in_(list(loan_ids)), schedule.c.status != "paid")
+        .order_by(schedule.c.loan_id, schedule.c.due_date, schedule.c.id)
+    )
+    by_loan = {loan_id: [] for loan_id in loan_ids}
+    for loan_id, *fields in rows:
+        by_loan[loan_id].append(EmiRow(*fields))
+    return by_loan
+
+
+def allocate(rows, amount):
+    """
+    Pure allocation of amount across rows (already ordered by due date).
+    Returns the updates for touched EMIs, the rows still open afterwards,
+    and whether every EMI ends up paid.
+    """
+    updates = []
+    open_rows = []
+    paid_before = 0.0
+    for row, paid_through in zip(rows, accumulate(r.balance for r in rows)):
+        remaining = amount - paid_before
+        paid_before = paid_through
+        if remaining <= 0:
+            open_rows.append(row)
+            continue
+
+        paid = min(remaining, row.balance)
+        balance = row.balance - paid
+        if balance <= PAID_TOLERANCE:
+            updates.append(EmiUpdate(row.id, row.emi_no, paid, 0, "paid"))
+        else:
+            updates.append(EmiUpdate(row.id, row.emi_no, paid, balance, "partial"))
+            open_rows.append(row._replace(balance=balance, status="partial"))
+
+    return Allocation(updates, open_rows, not open_rows)
+
+
+def write_emi_updates(updates):
+    """One executemany UPDATE for every touched EMI"""
+    if not updates:
+        return
+    schedule = EMISchedule.__table__
+    db.session.execute(
+        schedule.update()
+        .where(schedule.c.id == bindparam("emi_id"))
+        .values(balance=bindparam("new_balance"), status=bindparam("new_status")),
+        [
+            {"emi_id": u.id, "new_balance": u.balance, "new_status": u.status}
+            for u in updates
+        ],
+    )
+
+
+def settle_loan(loan, amount, all_paid):
+    """Reduces the loan balance and closes it once settled. Returns True if closed."""
+    loan.pending_amount = max(0, loan.pending_amount - amount)
+    if loan.pending_amount <= CLOSE_TOLERANCE and all_paid:
+        loan.status = "closed"
+        return True
+    return False
+
+
+def apply_payment(loan, amount, rows=None, pending_updates=None):
+    """
+    Allocates an approved payment and updates the loan (caller commits).
+    rows defaults to a fresh load of the loan's unpaid EMIs. When a
+    pending_updates list is given the EMI updates are appended to it for
+    the caller to write in one go; otherwise they are written now.
+    Returns (allocation_details, open_rows) - pass open_rows to the next
+    payment on the same loan.
+    """
+    if rows is None:
+        rows = load_open_emis([loan.id])[loan.id]
+    allocation = allocate(rows, amount)
+    if pending_updates is None:
+        write_emi_updates(allocation.updates)
+    else:
+        pending_updates.extend(allocation.updates)
+
+    details = [f"EMI #{u.emi_no}: Paid {u.paid}" for u in allocation.updates]
+    if settle_loan(loan, amount, allocation.all_paid):
+        details.append("Loan Closed")
+    return details, allocation.open_rows
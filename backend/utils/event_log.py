@@ -0,0 +1,201 @@
+"""
+Append-only writer for log/event tables (LoginLog, LocationLog,
+LoanAuditLog, CustomerSyncLog, ...).
+
+    event_log.emit(LocationLog, user_id=..., latitude=..., longitude=...)
+        Telemetry fast path: the row is buffered in process and written by a
+        background thread with one executemany INSERT per table, whenever
+        EVENT_LOG_BATCH_SIZE rows are waiting or EVENT_LOG_FLUSH_MS elapsed.
+
+    event_log.emit(LoanAuditLog, durable=True, loan_id=..., action="FRAUD_ALERT")
+        Durable before response: the row joins the caller's db.session and
+        is committed atomically with the business change it describes.
+
+Buffered rows are written even if the request later rolls back, so audit
+rows (logins, collection and loan actions) are always durable; the caller
+commits, also on error responses such as a failed login. The buffer is
+for telemetry only.
+
+EVENT_LOG_MODE=sync makes every emit durable (tests, scripts, debugging).
+The buffer is drained on interpreter exit and from gunicorn's worker_exit.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime
+
+from extensions import db
+
+EVENT_LOG_MODE = os.getenv("EVENT_LOG_MODE", "async")  # async | sync
+EVENT_LOG_BATCH_SIZE = int(os.getenv("EVENT_LOG_BATCH_SIZE", 200))
+EVENT_LOG_FLUSH_MS = float(os.getenv("EVENT_LOG_FLUSH_MS", 500))
+EVENT_LOG_QUEUE_SIZE = int(os.getenv("EVENT_LOG_QUEUE_SIZE", 10000))
+
+
+def _stamp_defaults(model, values):
+    """
+    Evaluates callable DateTime defaults (created_at/timestamp columns) at
+    emit time, so buffered rows carry when the event happened, not when
+    the batch was flushed.
+    """
+    for column in model.__table__.columns:
+        if column.name in values or column.default is None:
+            continue
+        if column.default.is_callable and isinstance(column.type, DateTime):
+            values[column.name] = datetime.utcnow()
+    return values
+
+
+class EventLogWriter:
+    def __init__(
+        self,
+        mode=EVENT_LOG_MODE,
+        batch_size=EVENT_LOG_BATCH_SIZE,
+        flush_ms=EVENT_LOG_FLUSH_MS,
+        queue_size=EVENT_LOG_QUEUE_SIZE,
+    ):
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.overflow = 0
+
+    def init_app(self, app):
+        self._app = app
+        atexit.register(self.drain)
+
+    @property
+    def is_async(self):
+        return self.mode != "sync" and self._app is not None
+
+    # --- Producer side ---
+
+    def emit(self, model, durable=False, **values):
+        """Records one row of model. Returns the ORM object when written durably."""
+        if durable or not self.is_async or self._stopping.is_set():
+            return self._add_to_session(model, values)
+
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((model.__table__, _stamp_defaults(model, values)))
+        except queue.Full:
+            # Never drop events: fall back to the caller's transaction
+            self.overflow += 1
+            return self._add_to_session(model, values)
+        return None
+
+    def _add_to_session(self, model, values):
+        row = model(**values)
+        db.session.add(row)
+        return row
+
+    def _ensure_thread(self):
+        # Started lazily so each forked gunicorn worker gets its own thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="event-log-writer", daemon=True
+                )
+                self._thread.start()
+
+    # --- Consumer side ---
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        by_table = {}
+        for table, values in batch:
+            # executemany needs identical key sets per statement
+            by_table.setdefault((table, frozenset(values)), []).append(values)
+
+        with self._app.app_context():
+            for (table, _), rows in by_table.items():
+                try:
+                    db.session.execute(table.insert(), rows)
+                    db.session.commit()
+                    self.written += len(rows)
+                    self.batches += 1
+                except Exception as e:
+                    db.session.rollback()
+                    print(
+                        f"Event log: batch insert into {table.name} failed ({e}), retrying per row"
+                    )
+                    self._write_rows(table, rows)
+            db.session.remove()
+
+    def _write_rows(self, table, rows):
+        for values in rows:
+            try:
+                db.session.execute(table.insert(), values)
+                db.session.commit()
+                self.written += 1
+            except Exception as e:
+                db.session.rollback()
+                self.failed += 1
+                print(f"Event log: dropped {table.name} row {values}: {e}")
+
+    def drain(self, timeout=5.0):
+        """Flushes everything buffered in this process (worker shutdown)"""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and self._pid == os.getpid():
+            thread.join(self.flush_interval + 1.0)
+
+        deadline = time.monotonic() + timeout
+        batch = []
+        while time.monotonic() < deadline:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch and self._app is not None:
+            self._write(batch)
+
+    def stats(self):
+        return {
+            "mode": "async" if self.is_async else "sync",
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+            "overflow": self.overflow,
+        }
+
+
+event_log = EventLogWriter()
@@ -0,0 +1,113 @@
+"""
+Binary storage for face embeddings.
+Vectors are L2-normalised once and stored as packed little-endian float32,
+so verification is a single dot product on a zero-copy view.
+"""
+
+import os
+
+import numpy as np
+
+EMBEDDING_DTYPE = np.dtype("<f4")
+EMBEDDING_DIM = 1280  # MobileNetV2 pooled features
+# 'float' or 'int8' server model (utils/face_utils.py). The variant is part of
+# the stored version so templates from one are never matched against the other.
+FACE_MODEL_VARIANT = os.getenv("FACE_MODEL_VARIANT", "float")
+FLOAT_MODEL_VERSION = "mobilenet_v2-imagenet-1280"
+FACE_MODEL_VERSION = (
+    FLOAT_MODEL_VERSION
+    if FACE_MODEL_VARIANT == "float"
+    else f"{FLOAT_MODEL_VERSION}-{FACE_MODEL_VARIANT}"
+)
+CLIENT_MODEL_VERSION = "client"  # Embeddings computed on the device
+
+
+class CorruptEmbeddingError(ValueError):
+    pass
+
+
+def normalize_embedding(vector):
+    """Returns a unit-length float32 copy of the vector"""
+    arr = np.asarray(vector, dtype=EMBEDDING_DTYPE).reshape(-1)
+    if arr.size == 0 or not np.all(np.isfinite(arr)):
+        raise CorruptEmbeddingError("Embedding is empty or contains NaN/Inf")
+    norm = np.linalg.norm(arr)
+    if norm == 0:
+        raise CorruptEmbeddingError("Embedding has zero norm")
+    return arr / norm
+
+
+def pack_embedding(vector):
+    """Normalise and serialise an embedding for FaceEmbedding.embedding_blob"""
+    return normalize_embedding(vector).tobytes()
+
+
+def unpack_embedding(blob, dim=None):
+    """Zero-copy read-only float32 view over a stored blob"""
+    if not blob or len(blob) % EMBEDDING_DTYPE.itemsize:
+        raise CorruptEmbeddingError(
+            f"Invalid embedding blob ({len(blob or b'')} bytes)"
+        )
+    arr = np.frombuffer(blob, dtype=EMBEDDING_DTYPE)
+    if dim is not None and arr.size != dim:
+        raise CorruptEmbeddingError(f"Embedding has {arr.size} dims, expected {dim}")
+    return arr
+
+
+def stored_embedding(face):
+    """Unit vector for a FaceEmbedding row, converting legacy JSON rows on the fly"""
+    if face.embedding_blob is not None:
+        return unpack_embedding(face.embedding_blob)
+    if face.embedding_data:
+        return normalize_embedding(face.embedding_data)
+    raise CorruptEmbeddingError(f"Face embedding {face.id} has no data")
+
+
+def cosine_similarity(unit_a, unit_b):
+    """Both vectors must already be L2-normalised"""
+    if unit_a.shape != unit_b.shape:
+        raise CorruptEmbeddingError(
+            f"Embedding size mismatch ({unit_a.size} vs {unit_b.size})"
+        )
+    return float(np.dot(unit_a, unit_b))
+
+
+def migrate_face_embeddings(db, batch_size=200):
+    """
+    Converts legacy JSON embeddings into packed float32 blobs.
+    Rows that cannot be decoded are reported and left untouched.
+    """
+    from models import FaceEmbedding
+
+    converted, failed = 0, []
+    last_id = 0
+    while True:
+        rows = (
+            FaceEmbedding.query.filter(
+                FaceEmbedding.embedding_blob.is_(None), FaceEmbedding.id > last_id
+            )
+            .order_by(FaceEmbedding.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        for face in rows:
+            last_id = face.id
+            try:
+                vector = normalize_embedding(face.embedding_data or [])
+            except CorruptEmbeddingError as e:
+                failed.append({"id": face.id, "user_id": face.user_id, "error": str(e)})
+                continue
+            face.embedding_blob = vector.tobytes()
+            # Legacy rows predate the int8 model
+            face.model_version = (
+                FLOAT_MODEL_VERSION
+                if vector.size == EMBEDDING_DIM
+                else CLIENT_MODEL_VERSION
+            )
+            face.embedding_data = None
+            converted += 1
+        db.session.commit()
+
+    return {"converted": converted, "failed": failed}
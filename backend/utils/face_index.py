@@ -0,0 +1,285 @@
+"""
+In-memory face template index.
+
+Every enrolled template (all users, all templates) lives as one row of a
+contiguous, L2-normalised float32 matrix, so 1:1 verification against all of
+a user's templates and 1:N identification are single matrix products.
+
+The index is loaded lazily on first use and refreshed incrementally:
+new rows are picked up by primary key (id > last seen id), and each 1:1
+verification reconciles the user's rows with the database so templates
+cleared by another worker are never matched.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from utils.face_embeddings import (
+    CLIENT_MODEL_VERSION,
+    EMBEDDING_DIM,
+    EMBEDDING_DTYPE,
+    FACE_MODEL_VERSION,
+    FLOAT_MODEL_VERSION,
+    CorruptEmbeddingError,
+    normalize_embedding,
+    unpack_embedding,
+)
+
+MAX_TEMPLATES_PER_USER = int(os.getenv("FACE_MAX_TEMPLATES_PER_USER", 5))
+FACE_INDEX_RELOAD_SECONDS = int(os.getenv("FACE_INDEX_RELOAD_SECONDS", 600))
+# Unversioned rows are legacy float-model (or client) embeddings
+_INDEXED_VERSIONS = (FACE_MODEL_VERSION, CLIENT_MODEL_VERSION) + (
+    (None,) if FACE_MODEL_VERSION == FLOAT_MODEL_VERSION else ()
+)
+
+
+def _row_vector(blob, data):
+    if blob is not None:
+        return unpack_embedding(blob, dim=EMBEDDING_DIM)
+    vector = normalize_embedding(data or [])
+    if vector.size != EMBEDDING_DIM:
+        raise CorruptEmbeddingError(f"Embedding has {vector.size} dims")
+    return vector
+
+
+class FaceIndex:
+    def __init__(self, dim=EMBEDDING_DIM, reload_seconds=FACE_INDEX_RELOAD_SECONDS):
+        self.dim = dim
+        self.reload_seconds = reload_seconds
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._matrix = np.zeros((0, self.dim), dtype=EMBEDDING_DTYPE)
+        self._face_ids = np.zeros(0, dtype=np.int64)
+        self._user_ids = np.zeros(0, dtype=np.int64)
+        self._active = np.zeros(0, dtype=bool)
+        self._size = 0
+        self._row_of_face = {}
+        self._user_rows = {}
+        self._max_face_id = 0
+        self._loaded_at = None
+
+    # --- Storage ---
+
+    def _grow(self, extra):
+        needed = self._size + extra
+        capacity = len(self._matrix)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 64)
+        matrix = np.zeros((capacity, self.dim), dtype=EMBEDDING_DTYPE)
+        matrix[: self._size] = self._matrix[: self._size]
+        self._matrix = matrix
+        for name in ("_face_ids", "_user_ids", "_active"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[: self._size] = old[: self._size]
+            setattr(self, name, new)
+
+    def _append(self, face_id, user_id, vector):
+        if face_id in self._row_of_face:
+            return
+        self._grow(1)
+        row = self._size
+        self._matrix[row] = vector
+        self._face_ids[row] = face_id
+        self._user_ids[row] = user_id
+        self._active[row] = True
+        self._size += 1
+        self._row_of_face[face_id] = row
+        self._user_rows.setdefault(user_id, []).append(row)
+        self._max_face_id = max(self._max_face_id, face_id)
+
+    def _drop_row(self, row):
+        self._active[row] = False
+        face_id = int(self._face_ids[row])
+        user_id = int(self._user_ids[row])
+        self._row_of_face.pop(face_id, None)
+        rows = self._user_rows.get(user_id)
+        if rows is not None:
+            rows.remove(row)
+            if not rows:
+                del self._user_rows[user_id]
+
+    def _compact_if_sparse(self):
+        live = len(self._row_of_face)
+        if self._size < 256 or live > self._size * 0.75:
+            return
+        keep = np.flatnonzero(self._active[: self._size])
+        matrix = np.ascontiguousarray(self._matrix[keep])
+        face_ids, user_ids = self._face_ids[keep], self._user_ids[keep]
+        max_face_id, loaded_at = self._max_face_id, self._loaded_at
+        self._reset()
+        self._max_face_id, self._loaded_at = max_face_id, loaded_at
+        self._grow(len(keep))
+        for face_id, user_id, vector in zip(face_ids, user_ids, matrix):
+            self._append(int(face_id), int(user_id), vector)
+
+    # --- Loading ---
+
+    def _load_rows(self, query):
+        loaded, other_model = 0, 0
+        for face_id, user_id, blob, data, version in query.yield_per(500):
+            if version not in _INDEXED_VERSIONS:
+                other_model += 1
+                continue
+            try:
+                vector = _row_vector(blob, data)
+            except CorruptEmbeddingError as e:
+                print(f"Face index: skipping embedding {face_id}: {e}")
+                continue
+            self._append(face_id, user_id, vector)
+            loaded += 1
+        if other_model:
+            print(
+                f"Face index: skipped {other_model} templates not enrolled with "
+                f"{FACE_MODEL_VERSION}, those users must re-enrol"
+            )
+        return loaded
+
+    def _base_query(self):
+        from models import db, FaceEmbedding
+
+        return db.session.query(
+            FaceEmbedding.id,
+            FaceEmbedding.user_id,
+            FaceEmbedding.embedding_blob,
+            FaceEmbedding.embedding_data,
+            FaceEmbedding.model_version,
+        )
+
+    def _ensure_loaded(self):
+        stale = (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at > self.reload_seconds
+        )
+        if stale:
+            self._reset()
+            self._load_rows(self._base_query())
+            self._loaded_at = time.monotonic()
+        else:
+            self._refresh_new()
+
+    def _refresh_new(self):
+        from models import FaceEmbedding
+
+        query = self._base_query().filter(FaceEmbedding.id > self._max_face_id)
+        return self._load_rows(query.order_by(FaceEmbedding.id))
+
+    # --- Public API ---
+
+    def sync_user(self, user_id):
+        """
+        Reconcile one user's rows with the database (after enroll/clear).
+        Returns how many templates the database holds for the user.
+        """
+        from models import db, FaceEmbedding
+
+        with self._lock:
+            self._ensure_loaded()
+            live_ids = {
+                face_id
+                for (face_id,) in db.session.query(FaceEmbedding.id).filter(
+                    FaceEmbedding.user_id == user_id
+                )
+            }
+            for row in list(self._user_rows.get(user_id, [])):
+                if int(self._face_ids[row]) not in live_ids:
+                    self._drop_row(row)
+            missing = live_ids - set(self._row_of_face)
+            if missing:
+                self._load_rows(
+                    self._base_query().filter(FaceEmbedding.id.in_(missing))
+                )
+            self._compact_if_sparse()
+            return len(live_ids)
+
+    def remove_user(self, user_id):
+        with self._lock:
+            for row in list(self._user_rows.get(user_id, [])):
+                self._drop_row(row)
+            self._compact_if_sparse()
+
+    def template_count(self, user_id):
+        with self._lock:
+            return len(self._user_rows.get(user_id, []))
+
+    def verify(self, user_id, probe, sync=True):
+        """
+        Scores a normalised probe against all of a user's templates.
+        Returns (best_score, template_count); best_score is None if none.
+        """
+        with self._lock:
+            if sync:
+                self.sync_user(user_id)
+            rows = list(self._user_rows.get(user_id, []))
+            if not rows:
+                return None, 0
+            scores = self._matrix[rows] @ probe
+        return float(scores.max()), len(rows)
+
+    def search(self, probe, top_k=5):
+        """1:N lookup: best-scoring users for a normalised probe"""
+        with self._lock:
+            self._ensure_loaded()
+            if not self._row_of_face:
+                return []
+            scores = self._matrix[: self._size] @ probe
+            scores[~self._active[: self._size]] = -np.inf
+            user_ids = self._user_ids[: self._size]
+
+            # Best template per user: over-fetch rows, then keep first per user
+            fetch = min(self._size, top_k * MAX_TEMPLATES_PER_USER)
+            candidates = np.argpartition(-scores, fetch - 1)[:fetch]
+            candidates = candidates[np.argsort(-scores[candidates])]
+
+        results, seen = [], set()
+        for row in candidates:
+            if not np.isfinite(scores[row]):
+                break
+            user_id = int(user_ids[row])
+            if user_id in seen:
+                continue
+            seen.add(user_id)
+            results.append({"user_id": user_id, "score": float(scores[row])})
+            if len(results) == top_k:
+                break
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "templates": len(self._row_of_face),
+                "users": len(self._user_rows),
+                "rows_allocated": len(self._matrix),
+                "matrix_mb": round(self._matrix.nbytes / 1e6, 2),
+            }
+
+
+face_index = FaceIndex()
+
+
+def prune_templates(user_id, keep_latest=False):
+    """
+    Makes room for a new template: deletes all of the user's templates, or
+    with keep_latest only the oldest beyond MAX_TEMPLATES_PER_USER - 1.
+    Caller commits and then calls face_index.sync_user().
+    """
+    from models import db, FaceEmbedding
+
+    keep = MAX_TEMPLATES_PER_USER - 1 if keep_latest else 0
+    stale_ids = [
+        face_id
+        for (face_id,) in db.session.query(FaceEmbedding.id)
+        .filter(FaceEmbedding.user_id == user_id)
+        .order_by(FaceEmbedding.id.desc())
+        .offset(keep)
+    ]
+    if stale_ids:
+        FaceEmbedding.query.filter(FaceEmbedding.id.in_(stale_ids)).delete(
+            synchronize_session=False
+        )
@@ -0,0 +1,228 @@
+"""
+Face embedding inference dispatch.
+
+FACE_INFERENCE_MODE=inline  (default) runs MobileNetV2 inside the request
+                            thread, one model per gunicorn worker.
+FACE_INFERENCE_MODE=service sends the image to one shared inference process
+                            over a Unix socket. That process keeps a single
+                            warm model and groups concurrent requests into
+                            one batched forward pass.
+
+The service is started by gunicorn_config.py, or manually with:
+    python -m utils.face_inference
+"""
+
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+FACE_INFERENCE_MODE = os.getenv("FACE_INFERENCE_MODE", "inline")
+FACE_INFERENCE_SOCKET = os.getenv(
+    "FACE_INFERENCE_SOCKET", "/tmp/vasool_face_inference.sock"  # nosec B108
+)
+MAX_BATCH = int(os.getenv("FACE_INFERENCE_MAX_BATCH", 8))
+MAX_WAIT_MS = float(os.getenv("FACE_INFERENCE_MAX_WAIT_MS", 15))
+QUEUE_SIZE = int(os.getenv("FACE_INFERENCE_QUEUE_SIZE", 64))
+TIMEOUT = float(os.getenv("FACE_INFERENCE_TIMEOUT", 10))  # seconds
+
+_HEADER = struct.Struct("!I")
+_MAX_FRAME = 32 * 1024 * 1024
+STATUS_OK = b"\x00"
+STATUS_ERROR = b"\x01"
+
+
+class InferenceBusy(RuntimeError):
+    pass
+
+
+# --- Framing: 4-byte big-endian length + payload ---
+
+
+def _send_frame(sock, payload):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed mid-frame")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_frame(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > _MAX_FRAME:
+        raise ConnectionError(f"Frame too large ({size} bytes)")
+    return _recv_exact(sock, size)
+
+
+# --- Client (gunicorn workers) ---
+
+
+def _remote_embedding(image_bytes):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(TIMEOUT)
+            sock.connect(FACE_INFERENCE_SOCKET)
+            _send_frame(sock, image_bytes)
+            reply = _recv_frame(sock)
+    except (OSError, ConnectionError) as e:
+        print(f"ERROR reaching face inference service: {e}")
+        return None, "Face service unavailable. Please try again."
+
+    status, body = reply[:1], reply[1:]
+    if status == STATUS_OK:
+        return np.frombuffer(body, dtype="<f4").tolist(), None
+    return None, body.decode("utf-8")
+
+
+def generate_face_embedding(image_bytes):
+    """Same contract as face_utils.generate_face_embedding: (embedding, error)"""
+    if FACE_INFERENCE_MODE == "service":
+        return _remote_embedding(image_bytes)
+
+    from utils.face_utils import generate_face_embedding as generate_inline
+
+    return generate_inline(image_bytes)
+
+
+# --- Server (single shared process) ---
+
+
+class _Job:
+    __slots__ = ("tensor", "event", "result", "error")
+
+    def __init__(self, tensor):
+        self.tensor = tensor
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingEmbedder:
+    """
+    Collects jobs from many connection threads and runs them through
+    embed_fn in batches of up to max_batch, waiting at most max_wait_ms
+    for a batch to fill. The queue is bounded; a full queue is rejected.
+    """
+
+    def __init__(
+        self,
+        embed_fn,
+        max_batch=MAX_BATCH,
+        max_wait_ms=MAX_WAIT_MS,
+        queue_size=QUEUE_SIZE,
+    ):
+        self._embed_fn = embed_fn
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.batches = 0
+        self.items = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, tensor, timeout=TIMEOUT):
+        job = _Job(tensor)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise InferenceBusy("Face service busy. Please retry.")
+        if not job.event.wait(timeout):
+            raise TimeoutError("Face inference timed out")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._max_wait
+        while len(batch) < self._max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                outputs = self._embed_fn([job.tensor for job in batch])
+                for job, row in zip(batch, outputs):
+                    job.result = row
+            except Exception as e:
+                for job in batch:
+                    job.error = e
+            finally:
+                self.batches += 1
+                self.items += len(batch)
+                for job in batch:
+                    job.event.set()
+
+
+class _InferenceHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        from utils.face_utils import preprocess_face
+
+        try:
+            image_bytes = _recv_frame(self.request)
+        except (OSError, ConnectionError):
+            return
+
+        face_tensor, error = preprocess_face(image_bytes)
+        if error:
+            _send_frame(self.request, STATUS_ERROR + error.encode("utf-8"))
+            return
+
+        try:
+            embedding = self.server.embedder.submit(face_tensor)
+        except (InferenceBusy, TimeoutError) as e:
+            _send_frame(self.request, STATUS_ERROR + str(e).encode("utf-8"))
+            return
+        except Exception as e:
+            message = f"Face processing error: {str(e)}"
+            _send_frame(self.request, STATUS_ERROR + message.encode("utf-8"))
+            return
+
+        _send_frame(self.request, STATUS_OK + np.asarray(embedding, "<f4").tobytes())
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = QUEUE_SIZE
+
+    def __init__(self, path, embedder):
+        self.embedder = embedder
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _InferenceHandler)
+        os.chmod(path, 0o660)
+
+
+def serve(path=FACE_INFERENCE_SOCKET):
+    from utils.face_utils import _get_ai_resources, embed_faces
+
+    # Warm the model before accepting connections
+    _get_ai_resources()
+    embedder = BatchingEmbedder(embed_faces)
+    with InferenceServer(path, embedder) as server:
+        print(f"Face inference service listening on {path} (max batch {MAX_BATCH})")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve()
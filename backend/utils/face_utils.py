@@ -1,9 +1,18 @@
+import io
+import os
+import time
+
 import cv2
 import numpy as np
 import torch
 import torchvision.models as models
 import torchvision.transforms as transforms
 from PIL import Image
+from utils.face_embeddings import (
+    FACE_MODEL_VARIANT,
+    cosine_similarity,
+    normalize_embedding,
+)
 
 
 # AI components will be lazy-loaded to save memory on Render (512MB limit)
@@ -14,19 +23,85 @@ face_cascade = cv2.CascadeClassifier(
     cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
 )
 
+# FACE_MODEL_VARIANT (utils/face_embeddings.py): 'float' builds MobileNetV2
+# from torchvision weights; 'int8' loads the pre-exported quantized
+# TorchScript artifact (see export_face_model.py)
+FACE_MODEL_INT8_PATH = os.getenv(
+    "FACE_MODEL_INT8_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "ml",
+        "face_mobilenet_v2_int8.pt",
+    ),
+)
+
+# 'standard' keeps the PIL/torchvision preprocessing; 'fast' uses reduced
+# JPEG decode and numpy normalisation (see preprocess_face_fast)
+FACE_PIPELINE_MODE = os.getenv("FACE_PIPELINE", "standard")
+FAST_DECODE_MIN_DIM = int(os.getenv("FACE_FAST_DECODE_MIN_DIM", 960))
+
+
+def build_float_model():
+    float_model = models.mobilenet_v2(pretrained=True)
+    float_model.classifier = torch.nn.Identity()
+    float_model.eval()
+    return float_model
+
+
+def build_int8_model():
+    """Statically quantized MobileNetV2 backbone (torchvision, ImageNet-calibrated)"""
+    from torchvision.models import quantization as quantized_models
+
+    torch.backends.quantized.engine = _quantized_engine()
+    int8_model = quantized_models.mobilenet_v2(pretrained=True, quantize=True)
+    int8_model.classifier = torch.nn.Identity()
+    int8_model.eval()
+    return int8_model
+
+
+def _quantized_engine():
+    engines = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "qnnpack"):
+        if engine in engines:
+            return engine
+    return engines[0]
+
+
+def load_int8_model(path=FACE_MODEL_INT8_PATH):
+    torch.backends.quantized.engine = _quantized_engine()
+    return torch.jit.load(path, map_location="cpu").eval()
+
+
+def export_int8_model(path=FACE_MODEL_INT8_PATH):
+    """Trace, freeze and save the quantized backbone as TorchScript"""
+    int8_model = build_int8_model()
+    example = torch.randn(1, 3, 224, 224)
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(int8_model, example))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    torch.jit.save(scripted, path)
+    return path
+
+
 def _get_ai_resources():
     global model, device, transform
     if model is None:
-        import torchvision.models as models
-        import torchvision.transforms as transforms
-        
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        # Load a efficient pre-trained model
-        model = models.mobilenet_v2(pretrained=True)
-        model.classifier = torch.nn.Identity()
-        model.to(device)
-        model.eval()
-        
+        if FACE_MODEL_VARIANT == "int8":
+            # No silent float fallback: templates are stored as the int8 version
+            if not os.path.exists(FACE_MODEL_INT8_PATH):
+                raise RuntimeError(
+                    f"FACE_MODEL_VARIANT=int8 but {FACE_MODEL_INT8_PATH} is missing "
+                    "(run export_face_model.py)"
+                )
+            # Quantized kernels are CPU only
+            device = torch.device("cpu")
+            model = load_int8_model()
+        else:
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            # Load a efficient pre-trained model
+            model = build_float_model()
+            model.to(device)
+
         transform = transforms.Compose([
             transforms.Resize((224, 224)),
             transforms.ToTensor(),
@@ -35,20 +110,60 @@ def _get_ai_resources():
     return model, device, transform
 
 
-def generate_face_embedding(image_bytes):
+def embedding_parity(reference_model, candidate_model, face_tensors, threshold=0.75):
     """
-    1. Detect face using OpenCV Haar Cascade (Low Memory).
-    2. Preprocess and generate 1280-d embedding using MobileNetV2.
+    Compares two embedding models on the same preprocessed faces.
+    Reports per-face cosine between their outputs and whether pairwise
+    match decisions at the login threshold agree.
     """
-    import time
+    batch = torch.stack(list(face_tensors))
+    with torch.no_grad():
+        ref = reference_model(batch).cpu().numpy()
+        cand = candidate_model(batch).cpu().numpy()
+    ref = np.stack([normalize_embedding(r) for r in ref])
+    cand = np.stack([normalize_embedding(c) for c in cand])
+
+    self_cosine = np.einsum("ij,ij->i", ref, cand)
+    ref_decisions = (ref @ ref.T) >= threshold
+    cand_decisions = (cand @ cand.T) >= threshold
+    return {
+        "samples": len(ref),
+        "mean_cosine": float(self_cosine.mean()),
+        "min_cosine": float(self_cosine.min()),
+        "decision_agreement": float((ref_decisions == cand_decisions).mean()),
+    }
+
+
+def _mark(timings, stage, start):
+    """Record elapsed ms for a pipeline stage and return the new start time"""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = round((now - start) * 1000, 2)
+    return now
+
+
+def preprocess_face(image_bytes, mode=None, timings=None):
+    """
+    Detect the largest face using OpenCV Haar Cascade (Low Memory) and
+    return it as a normalised 3x224x224 tensor ready for the model.
+
+    mode: 'standard' or 'fast' (defaults to FACE_PIPELINE_MODE).
+    timings: optional dict filled with decode/detect/preprocess ms.
+    """
+    if (mode or FACE_PIPELINE_MODE) == "fast":
+        face_array, error = preprocess_face_fast(image_bytes, timings)
+        if error:
+            return None, error
+        return torch.from_numpy(face_array), None
 
-    start_time = time.time()
     try:
+        start = time.perf_counter()
         # Load image
         img_array = np.frombuffer(image_bytes, np.uint8)
         img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
         if img is None:
             return None, "Invalid image data"
+        start = _mark(timings, "decode", start)
 
         # Performance: Scale down image for detection
         height, width = img.shape[:2]
@@ -78,6 +193,7 @@ def generate_face_embedding(image_bytes):
             y1, y2 = max(0, y-pad_h), min(height, y+h+pad_h)
             x1, x2 = max(0, x-pad_w), min(width, x+w+pad_w)
             face_img = img[y1:y2, x1:x2]
+        start = _mark(timings, "detect", start)
 
         if face_img is None or face_img.size == 0:
             return None, "Could not isolate face clearly. Please try again in better lighting."
@@ -86,16 +202,121 @@ def generate_face_embedding(image_bytes):
         face_rgb = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
         pil_img = Image.fromarray(face_rgb)
 
-        # Preprocess and generate embedding using lazy-loaded model
-        model, device, transform = _get_ai_resources()
-        input_tensor = transform(pil_img).unsqueeze(0).to(device)
+        _, _, transform = _get_ai_resources()
+        face_tensor = transform(pil_img)
+        _mark(timings, "preprocess", start)
+        return face_tensor, None
 
-        with torch.no_grad():
-            embedding = model(input_tensor)
+    except Exception as e:
+        print(f"ERROR in preprocess_face: {str(e)}")
+        return None, f"Face processing error: {str(e)}"
 
-        embedding_list = embedding.cpu().numpy().flatten().tolist()
-        return embedding_list, None
 
+# --- Fast pipeline (FACE_PIPELINE=fast) ---
+# Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg itself, the
+# cascade runs on that reduced image, and the crop is resized and
+# normalised straight into a CHW float32 array (no PIL round trip).
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def _image_size(image_bytes):
+    """(width, height) from the image header without decoding pixels"""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as header:
+            return header.size
+    except Exception:
+        return None
+
+
+def _decode_reduced(image_bytes):
+    size = _image_size(image_bytes)
+    img_array = np.frombuffer(image_bytes, np.uint8)
+    if size:
+        longest = max(size)
+        for factor, flag in _REDUCED_FLAGS:
+            if longest // factor >= FAST_DECODE_MIN_DIM:
+                return cv2.imdecode(img_array, flag)
+    return cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+
+
+def preprocess_face_fast(image_bytes, timings=None):
+    """Returns (3x224x224 float32 array, error)"""
+    try:
+        start = time.perf_counter()
+        img = _decode_reduced(image_bytes)
+        if img is None:
+            return None, "Invalid image data"
+        start = _mark(timings, "decode", start)
+
+        height, width = img.shape[:2]
+        max_dim = 600
+        scale = min(1.0, max_dim / max(height, width))
+        img_small = img
+        if scale < 1.0:
+            img_small = cv2.resize(
+                img,
+                (int(width * scale), int(height * scale)),
+                interpolation=cv2.INTER_AREA,
+            )
+        gray = cv2.cvtColor(img_small, cv2.COLOR_BGR2GRAY)
+        faces = face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(60, 60))
+        start = _mark(timings, "detect", start)
+
+        if len(faces) == 0:
+            return None, "Could not isolate face clearly. Please try again in better lighting."
+
+        x, y, w, h = (int(v / scale) for v in max(faces, key=lambda f: f[2] * f[3]))
+        pad_h, pad_w = int(h * 0.1), int(w * 0.1)
+        y1, y2 = max(0, y - pad_h), min(height, y + h + pad_h)
+        x1, x2 = max(0, x - pad_w), min(width, x + w + pad_w)
+        face_img = img[y1:y2, x1:x2]
+        if face_img.size == 0:
+            return None, "Could not isolate face clearly. Please try again in better lighting."
+
+        face = cv2.resize(face_img, (224, 224), interpolation=cv2.INTER_AREA)
+        face = cv2.cvtColor(face, cv2.COLOR_BGR2RGB).astype(np.float32)
+        face = (face * (1.0 / 255.0) - _MEAN) / _STD
+        face_array = np.ascontiguousarray(face.transpose(2, 0, 1))
+        _mark(timings, "preprocess", start)
+        return face_array, None
+
+    except Exception as e:
+        print(f"ERROR in preprocess_face_fast: {str(e)}")
+        return None, f"Face processing error: {str(e)}"
+
+
+def embed_faces(face_tensors):
+    """Single batched forward pass; returns an (n, 1280) float32 array"""
+    model, device, _ = _get_ai_resources()
+    batch = torch.stack(list(face_tensors)).to(device)
+    with torch.no_grad():
+        embeddings = model(batch)
+    return embeddings.cpu().numpy().astype(np.float32)
+
+
+def generate_face_embedding(image_bytes, mode=None, timings=None):
+    """
+    1. Detect face using OpenCV Haar Cascade (Low Memory).
+    2. Preprocess and generate 1280-d embedding using MobileNetV2.
+
+    Pass a dict as timings to get per-stage ms (decode, detect,
+    preprocess, infer).
+    """
+    face_tensor, error = preprocess_face(image_bytes, mode=mode, timings=timings)
+    if error:
+        return None, error
+
+    try:
+        start = time.perf_counter()
+        embedding_list = embed_faces([face_tensor])[0].tolist()
+        _mark(timings, "infer", start)
+        return embedding_list, None
     except Exception as e:
         print(f"ERROR in generate_face_embedding: {str(e)}")
         return None, f"Face processing error: {str(e)}"
@@ -103,6 +324,4 @@ def generate_face_embedding(image_bytes):
 
 def compare_embeddings(emb1, emb2):
     """Cosine Similarity comparison"""
-    a = np.array(emb1)
-    b = np.array(emb2)
-    return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+    return cosine_similarity(normalize_embedding(emb1), normalize_embedding(emb2))
@@ -0,0 +1,21 @@
+"""Vectorised great-circle distances (NumPy)"""
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def haversine_matrix(lats_a, lngs_a, lats_b, lngs_b):
+    """
+    Distances in meters between every point of a (rows) and of b
+    (columns). Unknown coordinates (None/NaN) give NaN.
+    """
+    lat_a = np.radians(np.asarray(lats_a, dtype=float))[:, None]
+    lng_a = np.radians(np.asarray(lngs_a, dtype=float))[:, None]
+    lat_b = np.radians(np.asarray(lats_b, dtype=float))[None, :]
+    lng_b = np.radians(np.asarray(lngs_b, dtype=float))[None, :]
+    a = (
+        np.sin((lat_b - lat_a) / 2) ** 2
+        + np.cos(lat_a) * np.cos(lat_b) * np.sin((lng_b - lng_a) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
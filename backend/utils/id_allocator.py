@@ -0,0 +1,167 @@
+"""
+Business ID allocation: LN-2026-000123, CUST-2026-000123, ...
+
+Human-facing IDs used to be built by counting this year's rows and
+probing for a free number. That is a full count per ID, and concurrent
+requests get the same number. Each kind of ID is now a per-year
+sequence:
+
+  * PostgreSQL: a real sequence per kind and year (bizid_<kind>_<year>),
+  * other databases: a row in change_counters bumped with one UPDATE in
+    its own short transaction (the row lock is released immediately).
+
+Each worker process reserves ID_BLOCK_SIZE numbers at a time and hands
+them out from memory, so most IDs cost no query at all. IDs are unique
+but not gap-free, and across workers they are not in creation order.
+
+    loan_id = LOAN_IDS.next()
+    customer_ids = CUSTOMER_IDS.take(len(rows))
+"""
+
+import os
+import threading
+from collections import deque
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from extensions import db
+from models import ChangeCounter, Customer, Loan
+from utils.business_time import business_date
+
+ID_BLOCK_SIZE = int(os.getenv("ID_BLOCK_SIZE", 20))
+_RESERVE_ATTEMPTS = 3
+
+
+def _max_suffix(conn, column, prefix):
+    """Highest numeric suffix among existing IDs starting with prefix (0 if none)"""
+    highest = 0
+    for (value,) in conn.execute(select(column).where(column.like(f"{prefix}%"))):
+        suffix = value[len(prefix) :]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    return highest
+
+
+def reserve_block(name, count, seed):
+    """
+    Reserves count consecutive numbers from the named change_counters row
+    and returns the first. seed(conn) gives the highest number already in
+    use and is only called when the counter row does not exist yet.
+    """
+    counters = ChangeCounter.__table__
+    for _ in range(_RESERVE_ATTEMPTS):
+        try:
+            with db.engine.begin() as conn:
+                result = conn.execute(
+                    counters.update()
+                    .where(counters.c.name == name)
+                    .values(value=counters.c.value + count)
+                )
+                if result.rowcount:
+                    last = conn.execute(
+                        select(counters.c.value).where(counters.c.name == name)
+                    ).scalar_one()
+                    return last - count + 1
+                first = seed(conn) + 1
+                conn.execute(
+                    counters.insert().values(name=name, value=first + count - 1)
+                )
+                return first
+        except IntegrityError:
+            # Another worker created the counter row first; take the UPDATE path
+            continue
+    raise RuntimeError(f"Could not reserve IDs from counter {name}")
+
+
+def reserve_from_sequence(sequence, count, seed):
+    """count numbers from a PostgreSQL sequence, created (seeded) on first use"""
+    for _ in range(_RESERVE_ATTEMPTS):
+        try:
+            with db.engine.begin() as conn:
+                exists = conn.execute(
+                    text(
+                        "SELECT 1 FROM pg_class WHERE relkind = 'S' AND relname = :name"
+                    ),
+                    {"name": sequence},
+                ).first()
+                if not exists:
+                    start = int(seed(conn)) + 1
+                    conn.execute(
+                        text(
+                            f"CREATE SEQUENCE IF NOT EXISTS {sequence} START WITH {start}"
+                        )
+                    )
+                return [
+                    value
+                    for (value,) in conn.execute(
+                        text(
+                            f"SELECT nextval('{sequence}') FROM generate_series(1, :count)"
+                        ),
+                        {"count": count},
+                    )
+                ]
+        except DBAPIError:
+            # Concurrent CREATE SEQUENCE; the retry finds it
+            continue
+    raise RuntimeError(f"Could not reserve IDs from sequence {sequence}")
+
+
+class BusinessIdSequence:
+    """Per-year IDs of the form <PREFIX>-<YEAR>-<NNNNNN>, served from reserved blocks"""
+
+    _lock = threading.Lock()
+    _blocks = {}  # (database url, counter name) -> deque of reserved numbers
+    _pid = None
+
+    def __init__(self, kind, prefix, column, width=6, block_size=ID_BLOCK_SIZE):
+        self.kind = kind
+        self.prefix = prefix
+        self.column = column
+        self.width = width
+        self.block_size = block_size
+
+    def format(self, year, number):
+        return f"{self.prefix}-{year}-{str(number).zfill(self.width)}"
+
+    def _reserve(self, year, count):
+        prefix = f"{self.prefix}-{year}-"
+
+        def seed(conn):
+            return _max_suffix(conn, self.column, prefix)
+
+        if db.engine.dialect.name == "postgresql":
+            return reserve_from_sequence(f"bizid_{self.kind}_{year}", count, seed)
+        first = reserve_block(f"{self.kind}:{year}", count, seed)
+        return range(first, first + count)
+
+    def take(self, count, year=None):
+        """count new IDs for the given year (default: current IST year)"""
+        if count <= 0:
+            return []
+        year = year or business_date().year
+        cls = BusinessIdSequence
+        key = (str(db.engine.url), f"{self.kind}:{year}")
+        numbers = []
+        with cls._lock:
+            if cls._pid != os.getpid():
+                # Blocks reserved before a fork belong to the parent
+                cls._blocks = {}
+                cls._pid = os.getpid()
+            block = cls._blocks.setdefault(key, deque())
+            while len(numbers) < count:
+                if not block:
+                    block.extend(
+                        self._reserve(year, max(self.block_size, count - len(numbers)))
+                    )
+                numbers.append(block.popleft())
+        return [self.format(year, number) for number in numbers]
+
+    def next(self, year=None):
+        return self.take(1, year)[0]
+
+
+LOAN_IDS = BusinessIdSequence("loan_id", "LN", Loan.__table__.c.loan_id)
+CUSTOMER_IDS = BusinessIdSequence(
+    "customer_id", "CUST", Customer.__table__.c.customer_id
+)
@@ -0,0 +1,244 @@
+"""
+Idempotency keys for retried mutating requests.
+
+A client sends `Idempotency-Key: <uuid>` (or "idempotency_key" in the JSON
+body). The first request with a key claims a row in idempotency_keys,
+runs the handler and stores its response; any retry with the same key
+replays that response without running the handler again.
+
+The claim is inserted in the handler's own transaction, so it commits
+or rolls back together with the business change: a visible claim always
+means the change was applied. Concurrent duplicates block on the unique
+key until the first request commits, then replay its response. If the
+process dies between the handler's commit and storing the response, the
+claim stays without a response and retries get 409
+request_already_applied instead of running the handler a second time.
+
+Completed responses are also kept in a per-process LRU so hot retries
+skip the database. Rows expire after IDEMPOTENCY_TTL_HOURS.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import g, jsonify, make_response, request
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", 48))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 4096))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", 5))
+_PURGE_INTERVAL = 600  # seconds between expired-row sweeps per process
+_MAX_KEY_LENGTH = 64
+
+
+class ReplayCache:
+    """LRU of completed responses: (scope, user_id, key) -> (hash, status, body, expires)"""
+
+    def __init__(self, maxsize=IDEMPOTENCY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key):
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry[3] < datetime.utcnow():
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry
+
+    def put(self, cache_key, entry):
+        with self._lock:
+            self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+replay_cache = ReplayCache()
+_last_purge = 0.0
+
+
+def request_idempotency_key():
+    """The key supplied with the current request, if any (set by @idempotent)"""
+    return g.get("idempotency_key")
+
+
+def _read_key():
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            key = data.get("idempotency_key")
+    return str(key).strip() if key else None
+
+
+def _replay(status_code, body):
+    response = make_response(body or "", status_code)
+    response.mimetype = "application/json"
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _conflict(msg, status_code):
+    return jsonify({"msg": msg}), status_code
+
+
+def _claim(scope, user_id, key, request_hash, table):
+    """Inserts the claim in db.session's transaction; the handler's commit publishes it"""
+    now = datetime.utcnow()
+    db.session.execute(
+        table.insert().values(
+            scope=scope,
+            user_id=user_id,
+            key=key,
+            request_hash=request_hash,
+            created_at=now,
+            expires_at=now + timedelta(hours=IDEMPOTENCY_TTL_HOURS),
+        )
+    )
+
+
+def _lookup(scope, user_id, key, table):
+    with db.engine.connect() as conn:
+        return conn.execute(
+            table.select().where(
+                table.c.scope == scope, table.c.user_id == user_id, table.c.key == key
+            )
+        ).first()
+
+
+def _release(row_filter, table):
+    with db.engine.begin() as conn:
+        conn.execute(table.delete().where(*row_filter))
+
+
+def _purge_expired(table):
+    global _last_purge
+    now = time.monotonic()
+    if now - _last_purge < _PURGE_INTERVAL:
+        return
+    _last_purge = now
+    with db.engine.begin() as conn:
+        conn.execute(table.delete().where(table.c.expires_at < datetime.utcnow()))
+
+
+def idempotent(scope):
+    """
+    Makes a JWT-protected POST handler safe to retry. Place it below
+    @jwt_required(). Requests without a key run unchanged.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = _read_key()
+            if not key:
+                return fn(*args, **kwargs)
+            if len(key) > _MAX_KEY_LENGTH:
+                return _conflict("invalid_idempotency_key", 400)
+
+            from utils.auth_helpers import get_current_principal
+
+            # Claim tokens resolve without touching the database
+            user = get_current_principal()
+            if user is None:
+                return fn(*args, **kwargs)
+
+            table = IdempotencyKey.__table__
+            cache_key = (scope, user.id, key)
+            request_hash = hashlib.sha256(request.get_data()).hexdigest()
+            row_filter = (
+                table.c.scope == scope,
+                table.c.user_id == user.id,
+                table.c.key == key,
+            )
+
+            cached = replay_cache.get(cache_key)
+            if cached is not None:
+                if cached[0] != request_hash:
+                    return _conflict("idempotency_key_reused", 422)
+                return _replay(cached[1], cached[2])
+
+            _purge_expired(table)
+            try:
+                _claim(scope, user.id, key, request_hash, table)
+            except IntegrityError:
+                # The first request has committed: replay it once it stored the response
+                db.session.rollback()
+                deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+                while True:
+                    row = _lookup(scope, user.id, key, table)
+                    if row is None or row.expires_at < datetime.utcnow():
+                        # Released after a failure, or expired: claim it afresh
+                        if row is not None:
+                            _release(row_filter, table)
+                        try:
+                            _claim(scope, user.id, key, request_hash, table)
+                            break
+                        except IntegrityError:
+                            db.session.rollback()
+                            continue
+                    if row.request_hash != request_hash:
+                        return _conflict("idempotency_key_reused", 422)
+                    if row.status_code is not None:
+                        replay_cache.put(
+                            cache_key,
+                            (
+                                row.request_hash,
+                                row.status_code,
+                                row.response_body,
+                                row.expires_at,
+                            ),
+                        )
+                        return _replay(row.status_code, row.response_body)
+                    if time.monotonic() >= deadline:
+                        # Applied, but the response was never stored
+                        return _conflict("request_already_applied", 409)
+                    time.sleep(0.05)
+
+            g.idempotency_key = key
+            try:
+                response = make_response(fn(*args, **kwargs))
+            except Exception:
+                db.session.rollback()
+                _release(row_filter, table)
+                raise
+
+            # Anything the handler left uncommitted (the claim included) is discarded
+            db.session.rollback()
+            if response.status_code >= 500:
+                # Let the client retry for real
+                _release(row_filter, table)
+                return response
+
+            body = response.get_data(as_text=True)
+            with db.engine.begin() as conn:
+                stored = conn.execute(
+                    table.update()
+                    .where(*row_filter)
+                    .values(status_code=response.status_code, response_body=body)
+                ).rowcount
+            if stored:
+                expires_at = datetime.utcnow() + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+                replay_cache.put(
+                    cache_key, (request_hash, response.status_code, body, expires_at)
+                )
+            # Otherwise the handler committed nothing, so a retry may run it again
+            return response
+
+        return wrapper
+
+    return decorator
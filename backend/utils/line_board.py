@@ -0,0 +1,138 @@
+"""
+Route screen data for one line (GET /api/line/<id>/customers).
+
+The board used to be built with a Loan query per customer and a
+Collection query per loan. It is now four set-based queries whatever the
+size of the line: members with their customer rows, their active loans,
+today's collection totals per loan and the EMI amount due per loan.
+check_line_board_queries.py guards the query count.
+"""
+
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from extensions import db
+from models import Collection, Customer, EMISchedule, LineCustomer, Loan
+from utils.business_time import business_date
+
+BOARD_QUERY_COUNT = 4
+
+
+def build_line_board(line_id, day=None):
+    """Customers of the line in route order with today's collection state"""
+    day = day or business_date()
+    members = (
+        db.session.query(
+            LineCustomer.sequence_order,
+            Customer.id,
+            Customer.name,
+            Customer.mobile_number,
+            Customer.area,
+        )
+        .join(Customer, Customer.id == LineCustomer.customer_id)
+        .filter(LineCustomer.line_id == line_id)
+        .order_by(LineCustomer.sequence_order)
+        .all()
+    )
+
+    member_ids = (
+        db.session.query(LineCustomer.customer_id)
+        .filter(LineCustomer.line_id == line_id)
+        .scalar_subquery()
+    )
+    active_loan = db.and_(Loan.customer_id.in_(member_ids), Loan.status == "active")
+    loans_by_customer = defaultdict(list)
+    for loan in (
+        db.session.query(Loan.id, Loan.loan_id, Loan.customer_id, Loan.pending_amount)
+        .filter(active_loan)
+        .order_by(Loan.id)
+    ):
+        loans_by_customer[loan.customer_id].append(loan)
+
+    active_loan_ids = db.session.query(Loan.id).filter(active_loan).scalar_subquery()
+    is_cash = db.func.lower(Collection.payment_mode) == "cash"
+    collected = {
+        row.loan_id: row
+        for row in db.session.query(
+            Collection.loan_id,
+            db.func.sum(Collection.amount).label("amount"),
+            # sum(case) rather than FILTER (WHERE ...), which MySQL lacks
+            db.func.sum(db.case((is_cash, Collection.amount), else_=0.0)).label("cash"),
+            db.func.sum(
+                db.case(
+                    (
+                        db.or_(Collection.payment_mode.is_(None), db.not_(is_cash)),
+                        Collection.amount,
+                    ),
+                    else_=0.0,
+                )
+            ).label("upi"),
+        )
+        .filter(
+            Collection.loan_id.in_(active_loan_ids),
+            Collection.collection_date == day,
+            Collection.status != "rejected",
+        )
+        .group_by(Collection.loan_id)
+    }
+
+    # Unpaid EMIs due up to the end of the day; balance is None on legacy rows
+    due = dict(
+        db.session.query(
+            EMISchedule.loan_id,
+            db.func.sum(db.func.coalesce(EMISchedule.balance, EMISchedule.amount)),
+        )
+        .filter(
+            EMISchedule.loan_id.in_(active_loan_ids),
+            EMISchedule.status != "paid",
+            EMISchedule.due_date < datetime.combine(day + timedelta(days=1), time.min),
+        )
+        .group_by(EMISchedule.loan_id)
+        .all()
+    )
+
+    board = []
+    for member in members:
+        loans = loans_by_customer.get(member.id, [])
+        loan_summaries = []
+        total_amount = total_cash = total_upi = total_due = 0.0
+        for loan in loans:
+            today = collected.get(loan.id)
+            amount = float(today.amount) if today else 0.0
+            loan_due = float(due.get(loan.id) or 0.0)
+            total_amount += amount
+            total_due += loan_due
+            if today:
+                total_cash += float(today.cash)
+                total_upi += float(today.upi)
+            loan_summaries.append(
+                {
+                    "id": loan.id,
+                    "loan_id": loan.loan_id,
+                    "is_collected": today is not None,
+                    "collected_amount": amount,
+                    "pending": loan.pending_amount,
+                    "due_amount": loan_due,
+                }
+            )
+
+        fully_collected = bool(loans) and all(
+            summary["is_collected"] for summary in loan_summaries
+        )
+        board.append(
+            {
+                "id": member.id,
+                "name": member.name,
+                "mobile": member.mobile_number,
+                "area": member.area,
+                "sequence": member.sequence_order,
+                "is_collected_today": fully_collected,
+                "amount": total_amount,
+                "amount_cash": total_cash,
+                "amount_upi": total_upi,
+                "due_amount": total_due,
+                "active_loans": loan_summaries,
+                "loan_count": len(loans),
+            }
+        )
+    return board
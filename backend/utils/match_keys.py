@@ -0,0 +1,85 @@
+"""
+Normalised keys derived from customer fields, stored on the customer row
+by model validators and used by search (utils/customer_search.py) and
+duplicate detection (utils/duplicate_detection.py).
+"""
+
+import re
+
+MOBILE_SUFFIX_DIGITS = 7
+
+# Spelling variants common in transliterated South Indian names
+_PHONETIC_RULES = (
+    ("ck", "k"),
+    ("x", "ks"),
+    ("q", "k"),
+    ("aa", "a"),
+    ("ee", "i"),
+    ("ii", "i"),
+    ("oo", "u"),
+    ("uu", "u"),
+    ("ou", "u"),
+    ("zh", "l"),
+    ("th", "t"),
+    ("dh", "d"),
+    ("bh", "b"),
+    ("ph", "f"),
+    ("kh", "k"),
+    ("gh", "g"),
+    ("sh", "s"),
+    ("ch", "c"),
+    ("w", "v"),
+    ("z", "s"),
+    ("y", "i"),
+)
+
+
+def search_key(value):
+    """Lower-case words of value joined by single spaces"""
+    return " ".join(re.sub(r"[\W_]+", " ", str(value).lower()).split()) if value else ""
+
+
+def mobile_digits(mobile_number):
+    """Last ten digits of a mobile number (drops +91 / leading 0)"""
+    return re.sub(r"\D", "", mobile_number or "")[-10:]
+
+
+def phonetic_code(token):
+    """
+    Rough sound-alike code of one name token: Murugan / Muruggan -> mrgn,
+    Lakshmi / Laxmi -> lksm. Non-Latin tokens are returned unchanged.
+    """
+    if not token.isascii():
+        return token
+    for pattern, replacement in _PHONETIC_RULES:
+        token = token.replace(pattern, replacement)
+    token = token.replace("h", "") if len(token) > 1 else token
+    if not token:
+        return ""
+    code = token[0] + re.sub(r"[aeiou]", "", token[1:])
+    return re.sub(r"(.)\1+", r"\1", code)
+
+
+def name_key(name):
+    """Phonetic codes of the name's tokens, sorted, so word order does not matter"""
+    return " ".join(
+        sorted(filter(None, (phonetic_code(t) for t in search_key(name).split())))
+    )
+
+
+def customer_search_text(name, mobile_number, customer_id):
+    """Name, mobile digits and customer_id in one normalised string"""
+    mobile = re.sub(r"\D", "", mobile_number or "")
+    return " ".join(
+        part for part in (search_key(name), mobile, search_key(customer_id)) if part
+    )
+
+
+def customer_match_keys(name, mobile_number, customer_id, area):
+    """Column values for Customer.search_text / name_key / mobile_suffix / area_key"""
+    return {
+        "search_text": customer_search_text(name, mobile_number, customer_id),
+        "name_key": name_key(name)[:100],
+        "mobile_suffix": mobile_digits(mobile_number)[-MOBILE_SUFFIX_DIGITS:] or None,
+        "area_key": search_key(area)[:100],
+    }
@@ -128,6 +128,20 @@ class RiskEngine:
         else:
             return prob * 100, "LOW"
 
+    def predict_risk_batch(self, rows):
+        """
+        predict_risk for many loans in one model call. rows: list of
+        (missed_emis, max_overdue_days, days_since_pay, partial_score,
+        utilization_approx). Returns probabilities of default in percent.
+        """
+        if not rows:
+            return []
+        if not self.model or self.scaler is None:
+            return [50.0] * len(rows)
+
+        scaled = self.scaler.transform(np.array(rows, dtype=float))
+        return [float(p) * 100 for p in self.model.predict_proba(scaled)[:, 1]]
+
 
 # Singleton
 risk_engine = RiskEngine()
@@ -1,6 +1,23 @@
-import pulp
-from typing import List, Dict
+import os
+import time
 from math import radians, cos, sin, asin, sqrt
+from typing import List, Dict
+
+import numpy as np
+import pulp
+from sklearn.neighbors import BallTree
+
+from utils.geo import EARTH_RADIUS_M, haversine_matrix
+
+# Above this many worker x customer variables the LP is not attempted
+ASSIGN_EXACT_MAX_VARIABLES = int(os.getenv("ASSIGN_EXACT_MAX_VARIABLES", 20000))
+ASSIGN_CANDIDATES = 16  # nearest workers considered per customer (scalable mode)
+ASSIGN_TIME_BUDGET = float(
+    os.getenv("ASSIGN_TIME_BUDGET", 10.0)
+)  # cycle cancelling seconds
+MISSING_DISTANCE_KM = 999.0
+_CHUNK = 20000
+
 
 class OptimizationEngine:
     """
@@ -12,59 +29,124 @@ class OptimizationEngine:
     def haversine_distance(lat1, lon1, lat2, lon2):
         """Calculates distance between two points in km."""
         if None in [lat1, lon1, lat2, lon2]:
-            return 999.0 # Penalty for missing coordinates
-        
+            return 999.0  # Penalty for missing coordinates
+
         # approximate radius of earth in km
         R = 6371.0
-        
+
         dLat = radians(lat2 - lat1)
         dLon = radians(lon2 - lon1)
         lat1 = radians(lat1)
         lat2 = radians(lat2)
 
-        a = sin(dLat / 2)**2 + cos(lat1) * cos(lat2) * sin(dLon / 2)**2
+        a = sin(dLat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dLon / 2) ** 2
         c = 2 * asin(sqrt(a))
         return R * c
 
     @staticmethod
-    def assign_workers_to_customers(workers: List[Dict], customers: List[Dict], max_per_worker: int = 50):
+    def _coordinates(items):
+        lats = np.array(
+            [i.get("lat") if i.get("lat") is not None else np.nan for i in items],
+            dtype=float,
+        )
+        lngs = np.array(
+            [i.get("lng") if i.get("lng") is not None else np.nan for i in items],
+            dtype=float,
+        )
+        return lats, lngs
+
+    @staticmethod
+    def _km(lats_a, lngs_a, lats_b, lngs_b):
+        dist = haversine_matrix(lats_a, lngs_a, lats_b, lngs_b) / 1000.0
+        dist[np.isnan(dist)] = MISSING_DISTANCE_KM
+        return dist
+
+    @staticmethod
+    def distance_matrix_km(workers: List[Dict], customers: List[Dict], rows=None):
+        """Customers (rows) x workers distances in km; missing coordinates cost 999 km"""
+        c_lat, c_lng = OptimizationEngine._coordinates(customers)
+        w_lat, w_lng = OptimizationEngine._coordinates(workers)
+        if rows is not None:
+            c_lat, c_lng = c_lat[rows], c_lng[rows]
+        return OptimizationEngine._km(c_lat, c_lng, w_lat, w_lng)
+
+    @staticmethod
+    def worker_capacity(
+        workers: List[Dict], customers: List[Dict], max_per_worker: int = 50
+    ):
+        # Increasing max_per_worker if too many customers for feasibility
+        return max(max_per_worker, (len(customers) // len(workers)) + 5)
+
+    @staticmethod
+    def assign_workers_to_customers(
+        workers: List[Dict],
+        customers: List[Dict],
+        max_per_worker: int = 50,
+        method: str = "auto",
+    ):
+        """
+        Capacity-constrained worker-customer assignment minimising total
+        travel distance. method: "exact" (integer program, small inputs),
+        "scalable" (greedy + min-cost flow, any size) or "auto" (exact up to
+        ASSIGN_EXACT_MAX_VARIABLES worker x customer pairs).
+        """
+        worker_ids = [w["id"] for w in workers]
+        if not customers:
+            return [
+                {"worker_id": int(w_id), "customer_ids": [], "count": 0}
+                for w_id in worker_ids
+            ]
+        if not workers:
+            return []
+
+        if method == "auto":
+            small = len(workers) * len(customers) <= ASSIGN_EXACT_MAX_VARIABLES
+            method = "exact" if small else "scalable"
+        if method == "exact":
+            assignments = OptimizationEngine._assign_exact(
+                workers, customers, max_per_worker
+            )
+            if assignments is not None:
+                return assignments
+            print("Worker assignment: LP not optimal, using the scalable solver")
+        return OptimizationEngine._assign_scalable(workers, customers, max_per_worker)
+
+    @staticmethod
+    def _assign_exact(
+        workers: List[Dict], customers: List[Dict], max_per_worker: int = 50
+    ):
         """
         Solves the Worker-Customer Assignment problem using Integer Programming.
         Goal: Minimize total travel distance while balancing workload.
+        Returns None if no optimal solution was found.
         """
         # 1. Define the Problem
         model = pulp.LpProblem("Worker_Assignment", pulp.LpMinimize)
 
         # 2. Decision Variables: x[w][c] = 1 if worker w is assigned customer c
-        worker_ids = [str(w['id']) for w in workers]
-        customer_ids = [str(c['id']) for c in customers]
-        
-        if not customer_ids:
-            return [{"worker_id": int(w_id), "customer_ids": [], "count": 0} for w_id in worker_ids]
-        
-        x = pulp.LpVariable.dicts("assign", (worker_ids, customer_ids), 0, 1, cat=pulp.LpBinary)
+        worker_ids = [str(w["id"]) for w in workers]
+        customer_ids = [str(c["id"]) for c in customers]
+        x = pulp.LpVariable.dicts(
+            "assign", (worker_ids, customer_ids), 0, 1, cat=pulp.LpBinary
+        )
 
         # 3. Objective Function: Minimize total distance
-        distances = {}
-        for w in workers:
-            for c in customers:
-                dist = OptimizationEngine.haversine_distance(
-                    w.get('lat'), w.get('lng'),
-                    c.get('lat'), c.get('lng')
-                )
-                distances[(str(w['id']), str(c['id']))] = dist
-        
-        model += pulp.lpSum([x[w_id][c_id] * distances[(w_id, c_id)] 
-                            for w_id in worker_ids for c_id in customer_ids])
+        dist = OptimizationEngine.distance_matrix_km(workers, customers)
+        model += pulp.lpSum(
+            [
+                x[w_id][c_id] * float(dist[ci, wi])
+                for wi, w_id in enumerate(worker_ids)
+                for ci, c_id in enumerate(customer_ids)
+            ]
+        )
 
         # 4. Constraints
         # Rule A: Each customer must be assigned to exactly one worker
         for c_id in customer_ids:
             model += pulp.lpSum([x[w_id][c_id] for w_id in worker_ids]) == 1
-        
+
         # Rule B: Workload balance (each worker has a max capacity)
-        # Increasing max_per_worker if too many customers for feasibility
-        limit = max(max_per_worker, (len(customers) // len(workers)) + 5)
+        limit = OptimizationEngine.worker_capacity(workers, customers, max_per_worker)
         for w_id in worker_ids:
             model += pulp.lpSum([x[w_id][c_id] for c_id in customer_ids]) <= limit
 
@@ -72,24 +154,270 @@ class OptimizationEngine:
         model.solve(pulp.PULP_CBC_CMD(msg=0))
 
         # 6. Extract Results
+        if pulp.LpStatus[model.status] != "Optimal":
+            return None
         assignments = []
-        if pulp.LpStatus[model.status] == 'Optimal':
-            for w_id in worker_ids:
-                assigned_custs = [int(c_id) for c_id in customer_ids if pulp.value(x[w_id][c_id]) == 1]
-                assignments.append({
+        for w_id in worker_ids:
+            assigned_custs = [
+                int(c_id) for c_id in customer_ids if pulp.value(x[w_id][c_id]) > 0.5
+            ]
+            assignments.append(
+                {
                     "worker_id": int(w_id),
                     "customer_ids": assigned_custs,
-                    "count": len(assigned_custs)
-                })
-            return assignments
-        
-        # Fallback: Simple Round Robin if optimization fails
-        assignments = [{"worker_id": int(w_id), "customer_ids": [], "count": 0} for w_id in worker_ids]
-        for i, c_id in enumerate(customer_ids):
-            assignments[i % len(workers)]["customer_ids"].append(int(c_id))
-            assignments[i % len(workers)]["count"] += 1
+                    "count": len(assigned_custs),
+                }
+            )
         return assignments
 
+    @staticmethod
+    def _nearest_candidates(c_lat, c_lng, w_lat, w_lng, k: int):
+        """(indices, km) of each customer's k nearest workers, nearest first"""
+        k = min(k, len(w_lat))
+        indices = np.empty((len(c_lat), k), dtype=np.int64)
+        dists = np.empty((len(c_lat), k))
+        for start in range(0, len(c_lat), _CHUNK):
+            rows = slice(start, start + _CHUNK)
+            dist = OptimizationEngine._km(c_lat[rows], c_lng[rows], w_lat, w_lng)
+            if k < dist.shape[1]:
+                nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.tile(np.arange(dist.shape[1]), (dist.shape[0], 1))
+            near_dist = np.take_along_axis(dist, nearest, axis=1)
+            order = np.argsort(near_dist, axis=1)
+            indices[rows] = np.take_along_axis(nearest, order, axis=1)
+            dists[rows] = np.take_along_axis(near_dist, order, axis=1)
+        return indices, dists
+
+    @staticmethod
+    def _assign_scalable(
+        workers: List[Dict],
+        customers: List[Dict],
+        max_per_worker: int = 50,
+        time_budget: float = ASSIGN_TIME_BUDGET,
+    ):
+        """
+        Capacitated assignment for large inputs, without a W x C model:
+        each customer's ASSIGN_CANDIDATES nearest workers (vectorised, in
+        chunks of customers), then _place.
+        """
+        deadline = time.perf_counter() + time_budget
+        limit = OptimizationEngine.worker_capacity(workers, customers, max_per_worker)
+        c_lat, c_lng = OptimizationEngine._coordinates(customers)
+        w_lat, w_lng = OptimizationEngine._coordinates(workers)
+        cand, cand_dist = OptimizationEngine._nearest_candidates(
+            c_lat, c_lng, w_lat, w_lng, ASSIGN_CANDIDATES
+        )
+        room = np.full(len(workers), limit, dtype=np.int64)
+        assigned, _ = OptimizationEngine._place(
+            cand, cand_dist, room, (c_lat, c_lng), (w_lat, w_lng), deadline
+        )
+        return OptimizationEngine._group(workers, customers, assigned)
+
+    @staticmethod
+    def assign_new_customers(
+        workers: List[Dict],
+        customers: List[Dict],
+        max_per_worker: int = 50,
+        time_budget: float = ASSIGN_TIME_BUDGET,
+    ):
+        """
+        Incremental assignment: places only the given (new or orphaned)
+        customers and leaves every existing assignment as it is.
+        workers: {'id', 'lat', 'lng', 'load'} with lat/lng the worker's
+        home area (None if unknown) and load the customers they already
+        have. The capacity is the same as a full solve over all customers
+        (existing + new); workers already above it take nobody new.
+        Nearby workers come from a BallTree (haversine) over home areas,
+        so the cost grows with the number of new customers only.
+        Customers without coordinates go to the workers with most room.
+        """
+        if not customers:
+            return [
+                {"worker_id": int(w["id"]), "customer_ids": [], "count": 0}
+                for w in workers
+            ]
+        if not workers:
+            return []
+        deadline = time.perf_counter() + time_budget
+        load = np.array([w.get("load") or 0 for w in workers], dtype=np.int64)
+        limit = max(
+            max_per_worker, (int(load.sum()) + len(customers)) // len(workers) + 5
+        )
+        room = np.maximum(limit - load, 0)
+        while room.sum() < len(customers):
+            # Overloaded workers leave too little room: raise everyone's limit
+            limit += 1
+            room = np.maximum(limit - load, 0)
+
+        c_lat, c_lng = OptimizationEngine._coordinates(customers)
+        w_lat, w_lng = OptimizationEngine._coordinates(workers)
+        k = min(ASSIGN_CANDIDATES, len(workers))
+        # Without coordinates every worker is as far: most room first
+        by_room = np.argsort(-room, kind="stable")[:k]
+        cand = np.tile(by_room, (len(customers), 1))
+        cand_dist = np.full((len(customers), k), MISSING_DISTANCE_KM)
+
+        homed = np.flatnonzero(~np.isnan(w_lat) & ~np.isnan(w_lng))
+        located = np.flatnonzero(~np.isnan(c_lat) & ~np.isnan(c_lng))
+        if len(homed) and len(located):
+            tree = BallTree(
+                np.radians(np.column_stack((w_lat[homed], w_lng[homed]))),
+                metric="haversine",
+            )
+            near = min(k, len(homed))
+            dist, index = tree.query(
+                np.radians(np.column_stack((c_lat[located], c_lng[located]))), k=near
+            )
+            cand[located] = by_room[0]
+            cand[located[:, None], np.arange(near)] = homed[index]
+            cand_dist[located] = MISSING_DISTANCE_KM
+            cand_dist[located[:, None], np.arange(near)] = (
+                dist * EARTH_RADIUS_M / 1000.0
+            )
+
+        assigned, _ = OptimizationEngine._place(
+            cand, cand_dist, room, (c_lat, c_lng), (w_lat, w_lng), deadline
+        )
+        return OptimizationEngine._group(workers, customers, assigned)
+
+    @staticmethod
+    def _group(workers, customers, assigned):
+        customer_ids = [int(c["id"]) for c in customers]
+        per_worker = [[] for _ in range(len(workers))]
+        for i, w in enumerate(assigned.tolist()):
+            per_worker[w].append(customer_ids[i])
+        return [
+            {"worker_id": int(workers[w]["id"]), "customer_ids": ids, "count": len(ids)}
+            for w, ids in enumerate(per_worker)
+        ]
+
+    @staticmethod
+    def _place(cand, cand_dist, room, customer_points, worker_points, deadline):
+        """
+        Places every customer (row of cand/cand_dist: candidate worker
+        indices, nearest first, and their km) within room[w] places per
+        worker. Returns (worker index, km) per customer.
+          1. greedy start: customers with the most to lose if they miss
+             their nearest worker (regret = 2nd nearest - nearest) pick
+             first, taking the nearest candidate with room; if all are
+             full, the nearest worker with room anywhere,
+          2. min-cost flow by cycle cancelling on a graph of workers: arc
+             a -> b is the cheapest move of one of a's customers to b, a
+             free-capacity node links workers with room back to every
+             worker. A negative cycle (found with Bellman-Ford) is a chain
+             of moves or a rotation that shortens the total distance; they
+             are applied until none is left or the deadline passes.
+        With no negative cycle the result is optimal over the candidate
+        moves.
+        """
+        n_customers, n_workers = len(cand), len(room)
+        assigned = np.full(n_customers, -1, dtype=np.int64)
+        cost = np.zeros(n_customers)
+        load = np.zeros(n_workers, dtype=np.int64)
+        overflow = []
+        regret = (
+            cand_dist[:, 1] - cand_dist[:, 0]
+            if cand.shape[1] > 1
+            else np.zeros(n_customers)
+        )
+        for i in np.argsort(-regret, kind="stable").tolist():
+            for w, d in zip(cand[i].tolist(), cand_dist[i].tolist()):
+                if load[w] < room[w]:
+                    assigned[i], cost[i] = w, d
+                    load[w] += 1
+                    break
+            else:
+                overflow.append(i)
+        if overflow:
+            c_lat, c_lng = customer_points
+            dist = OptimizationEngine._km(
+                c_lat[overflow], c_lng[overflow], *worker_points
+            )
+            for row, i in zip(dist, overflow):
+                row[load >= room] = np.inf
+                w = int(np.argmin(row))
+                assigned[i], cost[i] = w, row[w]
+                load[w] += 1
+
+        # Residual graph: nodes 0..W-1 workers, W the free-capacity node
+        free = n_workers
+        arc_cost = np.full((n_workers + 1, n_workers + 1), np.inf)
+        arc_customer = np.full((n_workers, n_workers), -1, dtype=np.int64)
+        arc_cost[free, :n_workers] = 0.0
+
+        def refresh(a):
+            """Cheapest move to every other worker among a's customers"""
+            arc_cost[a, :n_workers] = np.inf
+            members = np.flatnonzero(assigned == a)
+            if not len(members):
+                return
+            targets = cand[members].ravel()
+            delta = (cand_dist[members] - cost[members, None]).ravel()
+            movers = np.repeat(members, cand.shape[1])
+            keep = targets != a
+            targets, delta, movers = targets[keep], delta[keep], movers[keep]
+            best = arc_cost[a]
+            np.minimum.at(best, targets, delta)
+            cheapest = delta == best[targets]
+            arc_customer[a, targets[cheapest]] = movers[cheapest]
+
+        for a in range(n_workers):
+            refresh(a)
+        while time.perf_counter() < deadline:
+            arc_cost[:n_workers, free] = np.where(load < room, 0.0, np.inf)
+            cycle = OptimizationEngine._negative_cycle(arc_cost)
+            if cycle is None:
+                break
+            for a, b in zip(cycle, cycle[1:] + cycle[:1]):
+                if a == free:
+                    load[b] -= 1
+                elif b == free:
+                    load[a] += 1
+                else:
+                    i = arc_customer[a, b]
+                    assigned[i] = b
+                    cost[i] += arc_cost[a, b]
+            for a in cycle:
+                if a != free:
+                    refresh(a)
+        return assigned, cost
+
+    @staticmethod
+    def _negative_cycle(arc_cost, eps=1e-9):
+        """Nodes of a negative-cost cycle in a dense arc matrix (inf = no arc), or None"""
+        n = len(arc_cost)
+        dist = np.zeros(n)
+        pred = np.full(n, -1)
+        for _ in range(n):
+            through = dist[:, None] + arc_cost
+            best = np.argmin(through, axis=0)
+            shorter = through[best, np.arange(n)] < dist - eps
+            if not shorter.any():
+                return None
+            dist[shorter] = through[best, np.arange(n)][shorter]
+            pred[shorter] = best[shorter]
+            cycle = OptimizationEngine._pred_cycle(pred, np.flatnonzero(shorter)[0])
+            if cycle is not None:
+                return cycle
+        return None
+
+    @staticmethod
+    def _pred_cycle(pred, node):
+        """Cycle reached by following predecessors from node, in arc order"""
+        seen = {}
+        while node != -1 and node not in seen:
+            seen[node] = len(seen)
+            node = pred[node]
+        if node == -1:
+            return None
+        cycle = [node]
+        current = pred[node]
+        while current != node:
+            cycle.append(current)
+            current = pred[current]
+        return [int(v) for v in reversed(cycle)]
+
     @staticmethod
     def optimize_budget(fund_limit: float, categories: List[Dict]):
         """
@@ -97,15 +425,21 @@ class OptimizationEngine:
         categories: list of {'id': 1, 'name': 'Gold Loan', 'roi': 12.0, 'risk_weight': 0.1}
         """
         model = pulp.LpProblem("Budget_Optimization", pulp.LpMaximize)
-        
+
         # Decision Variables: amount[cat]
-        cat_ids = [str(cat['id']) for cat in categories]
-        amounts = pulp.LpVariable.dicts("allocate", cat_ids, 0, fund_limit, cat=pulp.LpContinuous)
+        cat_ids = [str(cat["id"]) for cat in categories]
+        amounts = pulp.LpVariable.dicts(
+            "allocate", cat_ids, 0, fund_limit, cat=pulp.LpContinuous
+        )
 
         # Objective: Maximize Total Estimated Return (Weighted by Risk)
         # Return = Sum(amount * ROI * (1 - RiskWeight))
-        model += pulp.lpSum([amounts[str(cat['id'])] * cat['roi'] * (1 - cat.get('risk_weight', 0.2)) 
-                            for cat in categories])
+        model += pulp.lpSum(
+            [
+                amounts[str(cat["id"])] * cat["roi"] * (1 - cat.get("risk_weight", 0.2))
+                for cat in categories
+            ]
+        )
 
         # Constraints
         # 1. Total allocation must not exceed fund limit
@@ -113,11 +447,14 @@ class OptimizationEngine:
 
         # 2. Diversification: No category gets more than 50% of budget
         for cid in cat_ids:
-             model += amounts[cid] <= fund_limit * 0.5
+            model += amounts[cid] <= fund_limit * 0.5
 
         model.solve(pulp.PULP_CBC_CMD(msg=0))
 
-        if pulp.LpStatus[model.status] == 'Optimal':
-            return {str(cat['id']): pulp.value(amounts[str(cat['id'])]) for cat in categories}
-        
+        if pulp.LpStatus[model.status] == "Optimal":
+            return {
+                str(cat["id"]): pulp.value(amounts[str(cat["id"])])
+                for cat in categories
+            }
+
         return None
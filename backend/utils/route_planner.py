@@ -0,0 +1,216 @@
+"""
+Visiting order for the customers of a line (POST /api/line/<id>/optimize).
+
+The route is an open path from the agent's position through every stop
+with coordinates (an open travelling-salesman path):
+
+  1. haversine distance matrix for all stops in one NumPy expression
+     (utils/geo.py),
+  2. nearest-neighbour seed tour,
+  3. 2-opt (reverse a stretch) and Or-opt (move a run of 1-3 stops)
+     improvement, each move scored for every candidate position at once
+     with NumPy, until no move helps or the time budget runs out.
+
+Priorities (0..1, e.g. default risk) are a soft constraint: each stop
+costs priority * priority_meters per position it is visited late, so a
+risky customer moves forward when the detour is small. With
+priority_meters=0 the plan is the shortest walk.
+
+Stops without coordinates cannot be placed and are appended at the end
+in their given order.
+"""
+
+import os
+import time
+
+import numpy as np
+
+from utils.geo import haversine_matrix
+
+ROUTE_TIME_BUDGET = float(os.getenv("ROUTE_TIME_BUDGET", 0.5))  # seconds
+ROUTE_PRIORITY_METERS = float(os.getenv("ROUTE_PRIORITY_METERS", 5))
+_EPS = 1e-6
+
+
+def distance_matrix(lats, lngs):
+    """Pairwise haversine distances in meters"""
+    return haversine_matrix(lats, lngs, lats, lngs)
+
+
+class _Tour:
+    """
+    Node order with fixed ends: tour[0] is the start and tour[-1] a sink at
+    zero distance from everything, which turns the open path into a cycle.
+    Cost = path length + penalty * sum(weight * position).
+    """
+
+    def __init__(self, dist, weights, penalty, order):
+        self.dist = dist
+        self.weights = weights
+        self.penalty = penalty
+        self.tour = np.asarray(order)
+        self._prefix()
+
+    def _prefix(self):
+        w = self.weights[self.tour]
+        positions = np.arange(len(self.tour))
+        # W[k] = sum of weights before index k; K[k] = sum of index * weight before k
+        self.W = np.concatenate(([0.0], np.cumsum(w)))
+        self.K = np.concatenate(([0.0], np.cumsum(w * positions)))
+
+    def cost(self):
+        t = self.tour
+        travel = self.dist[t[:-1], t[1:]].sum()
+        return travel + self.penalty * self.K[-1]
+
+    def two_opt(self, deadline):
+        """Applies the best reversal for each start index; True if any was applied"""
+        d, t, n = self.dist, self.tour, len(self.tour)
+        improved = False
+        for i in range(1, n - 2):
+            if time.perf_counter() >= deadline:
+                break
+            j = np.arange(i + 1, n - 1)
+            a, b = t[i - 1], t[i]
+            c, e = t[j], t[j + 1]
+            delta = d[a, c] + d[b, e] - d[a, b] - d[c, e]
+            if self.penalty:
+                # Reversing i..j moves the stop at k to i + j - k
+                weight = self.W[j + 1] - self.W[i]
+                index_weight = self.K[j + 1] - self.K[i]
+                delta = delta + self.penalty * ((i + j) * weight - 2 * index_weight)
+            best = int(np.argmin(delta))
+            if delta[best] < -_EPS:
+                end = j[best]
+                t[i : end + 1] = t[i : end + 1][::-1]
+                self._prefix()
+                improved = True
+        return improved
+
+    def or_opt(self, deadline, max_run=3):
+        """Moves runs of 1..max_run stops to their best position; True if any moved"""
+        d, n = self.dist, len(self.tour)
+        improved = False
+        for length in range(1, max_run + 1):
+            i = 1
+            while i + length < n and time.perf_counter() < deadline:
+                t = self.tour
+                run = t[i : i + length]
+                prev, nxt = t[i - 1], t[i + length]
+                removed = d[prev, run[0]] + d[run[-1], nxt] - d[prev, nxt]
+
+                # Insert between rest[p] and rest[p + 1] of the tour without the run
+                rest = np.concatenate((t[:i], t[i + length :]))
+                p = np.arange(len(rest) - 1)
+                added = (
+                    d[rest[p], run[0]]
+                    + d[run[-1], rest[p + 1]]
+                    - d[rest[p], rest[p + 1]]
+                )
+                delta = added - removed
+                if self.penalty:
+                    delta = delta + self.penalty * self._shift_penalty(i, length, p)
+                delta[i - 1] = np.inf  # Where it already is
+                best = int(np.argmin(delta))
+                if delta[best] < -_EPS:
+                    self.tour = np.concatenate(
+                        (rest[: best + 1], run, rest[best + 1 :])
+                    )
+                    self._prefix()
+                    improved = True
+                else:
+                    i += 1
+        return improved
+
+    def _shift_penalty(self, i, length, p):
+        """Position penalty change (per unit penalty) of moving run i..i+length-1 after rest[p]"""
+        W = self.W
+        run_weight = W[i + length] - W[i]
+        change = np.zeros(len(p))
+        before = p < i - 1
+        # Moving earlier: stops p+1..i-1 shift back by length, the run forward
+        pb = p[before]
+        change[before] = length * (W[i] - W[pb + 1]) - (i - pb - 1) * run_weight
+        # Moving later: stops i+length..p+length shift forward by length, the run back
+        after = p >= i
+        pa = p[after]
+        change[after] = (pa - i + 1) * run_weight - length * (
+            W[pa + length + 1] - W[i + length]
+        )
+        return change
+
+
+def _nearest_neighbour(dist, start, stops):
+    order = [start]
+    remaining = np.array(stops)
+    current = start
+    while len(remaining):
+        k = int(np.argmin(dist[current, remaining]))
+        current = remaining[k]
+        order.append(current)
+        remaining = np.delete(remaining, k)
+    return order
+
+
+def plan_route(
+    stops,
+    start=None,
+    priorities=None,
+    priority_meters=ROUTE_PRIORITY_METERS,
+    time_budget=ROUTE_TIME_BUDGET,
+):
+    """
+    stops: list of (lat, lng) (None for unknown); start: (lat, lng) or None
+    for "anywhere"; priorities: 0..1 per stop. Returns a dict with "order"
+    (indices into stops), "legs" (meters from the previous stop, None when
+    unknown), "distance" (total meters) and "improved_from" (seed distance).
+    """
+    deadline = time.perf_counter() + time_budget
+    placed = [k for k, point in enumerate(stops) if point and None not in point]
+    unplaced = sorted(set(range(len(stops))) - set(placed))
+    if not placed:
+        return {
+            "order": unplaced,
+            "legs": [None] * len(unplaced),
+            "distance": 0.0,
+            "improved_from": 0.0,
+        }
+
+    # Nodes: 0 start, 1..m placed stops, m + 1 sink
+    m = len(placed)
+    points = [stops[k] for k in placed]
+    if start is not None:
+        points = [start] + points
+    else:
+        points = [points[0]] + points
+    dist = np.zeros((m + 2, m + 2))
+    dist[: m + 1, : m + 1] = distance_matrix(
+        [p[0] for p in points], [p[1] for p in points]
+    )
+    if start is None:
+        dist[0, :] = dist[:, 0] = 0.0  # Free starting point
+    dist[m + 1, :] = dist[:, m + 1] = 0.0
+
+    weights = np.zeros(m + 2)
+    if priorities is not None:
+        weights[1 : m + 1] = np.clip([priorities[k] or 0.0 for k in placed], 0.0, 1.0)
+
+    seed = _nearest_neighbour(dist[: m + 1, : m + 1], 0, range(1, m + 1)) + [m + 1]
+    tour = _Tour(dist, weights, priority_meters, seed)
+    seed_travel = float(dist[tour.tour[:-1], tour.tour[1:]].sum())
+    while time.perf_counter() < deadline:
+        improved = tour.two_opt(deadline)
+        improved = tour.or_opt(deadline) or improved
+        if not improved:
+            break
+
+    path = tour.tour[1:-1]
+    legs = [float(dist[a, b]) for a, b in zip(tour.tour[:-2], path)]
+    if start is None:
+        legs[0] = 0.0
+    return {
+        "order": [placed[node - 1] for node in path] + unplaced,
+        "legs": legs + [None] * len(unplaced),
+        "distance": float(sum(legs)),
+        "improved_from": seed_travel,
+    }
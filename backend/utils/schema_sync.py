@@ -0,0 +1,146 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+
+
+def _default_sql(column):
+    default = column.server_default
+    if default is None:
+        return None
+    arg = default.arg
+    return arg if isinstance(arg, str) else str(arg.text)
+
+
+def add_missing_columns(db):
+    """
+    db.create_all() only creates missing tables, it never alters existing ones.
+    Adds any model column that is missing from a live table so new fields
+    can ship without a manual migration. Returns the list of added columns.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    existing_tables = set(inspector.get_table_names())
+    added = []
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            live_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in live_columns:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {col_type}"
+                default = _default_sql(column)
+                if default is not None:
+                    ddl += f" DEFAULT {default}"
+                conn.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+
+    for name in added:
+        print(f"Schema sync: added column {name}")
+    return added
+
+
+def relax_face_embedding_data(db):
+    """
+    face_embeddings.embedding_data became nullable when embeddings moved to
+    embedding_blob. Drops its NOT NULL on existing databases; SQLite cannot
+    alter a column, so the table is rebuilt there. Returns True if changed.
+    """
+    from models import FaceEmbedding
+
+    table = FaceEmbedding.__table__
+    engine = db.engine
+    inspector = inspect(engine)
+    if table.name not in inspector.get_table_names():
+        return False
+    live = {c["name"]: c for c in inspector.get_columns(table.name)}
+    if live.get("embedding_data", {"nullable": True})["nullable"]:
+        return False
+
+    quote = engine.dialect.identifier_preparer.quote
+    name, column = quote(table.name), quote("embedding_data")
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == "postgresql":
+            conn.execute(
+                text(f"ALTER TABLE {name} ALTER COLUMN {column} DROP NOT NULL")
+            )
+        elif dialect in ("mysql", "mariadb"):
+            col_type = table.c.embedding_data.type.compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE {name} MODIFY {column} {col_type} NULL"))
+        elif dialect == "sqlite":
+            # Same metadata so the users foreign key resolves; not kept there
+            rebuilt = table.to_metadata(table.metadata, name=f"{table.name}_rebuild")
+            try:
+                conn.execute(CreateTable(rebuilt))
+            finally:
+                table.metadata.remove(rebuilt)
+            columns = ", ".join(quote(c) for c in live if c in table.c)
+            conn.execute(
+                text(
+                    f"INSERT INTO {quote(rebuilt.name)} ({columns}) SELECT {columns} FROM {name}"
+                )
+            )
+            conn.execute(text(f"DROP TABLE {name}"))
+            conn.execute(text(f"ALTER TABLE {quote(rebuilt.name)} RENAME TO {name}"))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+        else:
+            return False
+
+    print(f"Schema sync: {table.name}.embedding_data is now nullable")
+    return True
+
+
+def create_missing_indexes(db):
+    """
+    Creates model indexes that are missing from live tables (create_all
+    skips tables that already exist). Returns the list of created indexes.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            live_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in live_indexes:
+                    continue
+                index.create(bind=conn)
+                created.append(index.name)
+
+    for name in created:
+        print(f"Schema sync: created index {name}")
+    return created
+
+
+def run_migrations(db):
+    """
+    Brings an existing database up to the models: missing columns, the
+    embedding_data relaxation, missing indexes (and the PostgreSQL search
+    trigram index), then the data backfills.
+    Every step is idempotent. Run once per deploy (flask migrate), never
+    from worker start-up.
+    """
+    from utils.auth_helpers import backfill_normalized_names
+    from utils.business_time import backfill_collection_dates
+    from utils.customer_search import backfill_match_keys, create_trigram_index
+    from utils.customer_sync import backfill_change_versions, seed_change_counter
+
+    db.create_all()
+    add_missing_columns(db)
+    relax_face_embedding_data(db)
+    create_missing_indexes(db)
+    backfill_normalized_names()
+    backfill_collection_dates(db)
+    seed_change_counter(db)
+    backfill_change_versions(db)
+    backfill_match_keys(db)
+    create_trigram_index(db)
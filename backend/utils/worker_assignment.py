@@ -0,0 +1,126 @@
+"""
+Incremental worker assignment (POST /api/line/assign-new-customers and
+assign_new_customers.py).
+
+Re-solving OptimizationEngine.assign_workers_to_customers over the whole
+book reshuffles customers between agents every night. Here existing
+relationships stay fixed and only customers nobody serves are placed:
+
+  * a customer is served by its assigned_worker_id if that user is an
+    active field agent, otherwise by the active agent of a line it is on,
+  * each agent's load is the number of open customers they serve, and
+    their home area is the centroid of those customers (their last GPS
+    position when they serve nobody with coordinates yet),
+  * OptimizationEngine.assign_new_customers places the rest near a home
+    area, within the same capacity as a full solve.
+"""
+
+from collections import defaultdict
+
+from sqlalchemy import or_
+
+from extensions import db
+from models import Customer, Line, LineCustomer, User, UserRole
+from utils.customer_sync import mark_customers_changed
+from utils.optimization_engine import OptimizationEngine
+
+CLOSED_STATUSES = ("inactive", "closed")
+
+
+def _open_customers():
+    return or_(Customer.status.is_(None), Customer.status.notin_(CLOSED_STATUSES))
+
+
+def load_assignment_state():
+    """(workers for assign_new_customers, unserved customers, served count)"""
+    agents = {
+        row.id: row
+        for row in db.session.query(
+            User.id, User.last_latitude, User.last_longitude
+        ).filter(User.role == UserRole.FIELD_AGENT, User.is_active.isnot(False))
+    }
+    line_agent = {}
+    for customer_id, agent_id in (
+        db.session.query(LineCustomer.customer_id, Line.agent_id)
+        .join(Line, LineCustomer.line_id == Line.id)
+        .filter(Line.agent_id.isnot(None))
+        .order_by(LineCustomer.id)
+    ):
+        if agent_id in agents:
+            line_agent.setdefault(customer_id, agent_id)
+
+    load = defaultdict(int)
+    points = defaultdict(list)
+    unserved = []
+    rows = (
+        db.session.query(
+            Customer.id,
+            Customer.assigned_worker_id,
+            Customer.latitude,
+            Customer.longitude,
+        )
+        .filter(_open_customers())
+        .yield_per(10000)
+    )
+    for row in rows:
+        worker = row.assigned_worker_id if row.assigned_worker_id in agents else None
+        worker = worker or line_agent.get(row.id)
+        if worker is None:
+            unserved.append({"id": row.id, "lat": row.latitude, "lng": row.longitude})
+            continue
+        load[worker] += 1
+        if row.latitude is not None and row.longitude is not None:
+            points[worker].append((row.latitude, row.longitude))
+
+    workers = []
+    for agent_id, agent in agents.items():
+        home = points.get(agent_id)
+        if home:
+            lat = sum(p[0] for p in home) / len(home)
+            lng = sum(p[1] for p in home) / len(home)
+        else:
+            lat, lng = agent.last_latitude, agent.last_longitude
+        workers.append({"id": agent_id, "lat": lat, "lng": lng, "load": load[agent_id]})
+    return workers, unserved, sum(load.values())
+
+
+def assign_new_customers(max_per_worker=50, apply=False):
+    """
+    Places every unserved open customer with an active field agent. With
+    apply, sets their assigned_worker_id and commits. Returns a summary
+    dict with the placements per agent.
+    """
+    workers, unserved, served = load_assignment_state()
+    plan = OptimizationEngine.assign_new_customers(workers, unserved, max_per_worker)
+    loads = {w["id"]: w["load"] for w in workers}
+    placements = [
+        {
+            "worker_id": entry["worker_id"],
+            "customer_ids": entry["customer_ids"],
+            "count": entry["count"],
+            "load_before": loads[entry["worker_id"]],
+            "load_after": loads[entry["worker_id"]] + entry["count"],
+        }
+        for entry in plan
+        if entry["count"]
+    ]
+
+    if apply and placements:
+        placed_ids = [cid for entry in placements for cid in entry["customer_ids"]]
+        # Bulk updates skip the flush hook, so mark the placed customers first
+        mark_customers_changed(db.session, Customer.id.in_(placed_ids))
+        for entry in placements:
+            Customer.query.filter(Customer.id.in_(entry["customer_ids"])).update(
+                {Customer.assigned_worker_id: entry["worker_id"]},
+                synchronize_session=False,
+            )
+        db.session.commit()
+
+    return {
+        "agents": len(workers),
+        "served": served,
+        "unserved": len(unserved),
+        "placed": sum(entry["count"] for entry in placements),
+        "applied": bool(apply and placements),
+        "placements": placements,
+    }
@@ -62,7 +62,7 @@ sudo mysql -e "FLUSH PRIVILEGES;"
 
 # 7. Initialize database tables
 echo "🗄️  Initializing database..."
-python -c "from app import create_app; from extensions import db; app = create_app(); app.app_context().push(); db.create_all()"
+flask --app app:create_app migrate
 
 # 8. Configure Gunicorn systemd service
 echo "⚙️  Configuring Gunicorn service..."